@@ -5,9 +5,16 @@ app = Flask(__name__, instance_relative_config=True)
 app.config.from_object('config')
 
 # Load views
-from .views import FilteredSalesApiView, MonthlySalesApiView, TopProductsApiView
+from .views import FilteredSalesApiView, MonthlySalesApiView, TopProductsApiView, RangeRevenueApiView, \
+    RevenueCubeApiView, BatchApiView, StatsApiView, MetricsApiView, WorkloadApiView
 
 # Register endpoints
 app.add_url_rule('/sales/', view_func=FilteredSalesApiView.as_view('filter-sales'))
 app.add_url_rule('/sales/monthly-revenue/', view_func=MonthlySalesApiView.as_view('monthly-revenue'))
 app.add_url_rule('/sales/top-products/', view_func=TopProductsApiView.as_view('top-products'))
+app.add_url_rule('/sales/range-revenue/', view_func=RangeRevenueApiView.as_view('range-revenue'))
+app.add_url_rule('/sales/revenue-cube/', view_func=RevenueCubeApiView.as_view('revenue-cube'))
+app.add_url_rule('/batch', view_func=BatchApiView.as_view('batch'))
+app.add_url_rule('/stats/', view_func=StatsApiView.as_view('stats'))
+app.add_url_rule('/metrics', view_func=MetricsApiView.as_view('metrics'))
+app.add_url_rule('/workload', view_func=WorkloadApiView.as_view('workload'))
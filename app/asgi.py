@@ -0,0 +1,173 @@
+"""
+ASGI entry point of the app, to be served by any ASGI server, e.g.:
+
+    uvicorn app.asgi:application --port 5000
+
+GET requests to query endpoints are answered by the async variant of their
+view, which offloads SQLite work and cache lookups to bounded pools of threads
+while the event loop keeps accepting requests. Any other request is handed to
+the WSGI app on the pool of threads executing queries.
+"""
+import asyncio
+import sys
+from functools import lru_cache
+from io import BytesIO
+from typing import Any, Callable, Dict, Iterable, List, Tuple, Type
+
+from flask import Response
+from werkzeug.exceptions import HTTPException
+
+from . import app
+from .views import QueryApiView, AsyncQueryApiView, _executor, _prepare_executor
+
+Scope = Dict[str, Any]
+Receive = Callable[[], Any]
+Send = Callable[[Dict[str, Any]], Any]
+
+
+@lru_cache(maxsize=None)
+def async_view_class(view_class: Type[QueryApiView]) -> Type[AsyncQueryApiView]:
+    """Returns the async variant of a query view, e.g. `AsyncFilteredSalesApiView`."""
+    return type(f'Async{view_class.__name__}', (AsyncQueryApiView, view_class), {})
+
+
+def wsgi_environ(scope: Scope, body: bytes) -> Dict[str, Any]:
+    """Returns the WSGI environ (PEP 3333) of an HTTP request."""
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode().decode('latin-1'),
+        'PATH_INFO': scope['path'].encode().decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f'HTTP/{scope["http_version"]}',
+        'REMOTE_ADDR': scope['client'][0] if scope.get('client') else '',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name, value = name.decode('latin-1').upper().replace('-', '_'), value.decode('latin-1')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = f'HTTP_{name}'
+        # Repeated headers are joined as WSGI servers do
+        environ[name] = f'{environ[name]},{value}' if name in environ else value
+    return environ
+
+
+async def read_body(receive: Receive) -> bytes:
+    """Returns the whole body of an HTTP request."""
+    body = b''
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            break
+    return body
+
+
+async def send_response(send: Send, status: str, headers: List[Tuple[str, str]], app_iter: Iterable,
+                        blocking: bool):
+    """
+    Sends a WSGI response. The body is iterated on a thread if `blocking`,
+    e.g. when its chunks are fetched from a database cursor.
+    """
+    await send({
+        'type': 'http.response.start',
+        'status': int(status.split(' ', 1)[0]),
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+    })
+    if blocking:
+        async for chunk in _executor.iterate(app_iter):
+            if chunk:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+    else:
+        try:
+            for chunk in app_iter:
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        finally:
+            close = getattr(app_iter, 'close', None)
+            if close is not None:
+                close()
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def serve_async_view(send: Send, environ: Dict[str, Any], ctx, view_class: Type[AsyncQueryApiView]):
+    """Answers a request by an async view within its request context, as `Flask.wsgi_app` would."""
+    ctx.push()
+    error = None
+    try:
+        try:
+            response = app.preprocess_request()
+            if response is None:
+                response = await view_class().dispatch()
+        except Exception as e:
+            response = app.handle_user_exception(e)
+            # Render errors (e.g. rejections by the executor) on the event loop
+            if isinstance(response, HTTPException):
+                response = response.get_response()
+        response: Response = app.finalize_request(response)
+    except Exception as e:
+        error = e
+        response = app.handle_exception(e)
+    try:
+        app_iter, status, headers = response.get_wsgi_response(environ)
+        await send_response(send, status, headers, app_iter, blocking=not response.is_sequence)
+    finally:
+        ctx.pop(error)
+
+
+async def serve_wsgi(send: Send, environ: Dict[str, Any]):
+    """Answers a request by the WSGI app on a thread."""
+    started = []
+
+    def start_response(status, headers, exc_info=None):
+        started[:] = [status, headers]
+
+    try:
+        app_iter = await _executor.run(app.wsgi_app, environ, start_response)
+    except HTTPException as e:
+        # Too many queries waiting for a thread
+        app_iter = e.get_response(environ)(environ, start_response)
+        await send_response(send, *started, app_iter, blocking=False)
+    else:
+        await send_response(send, *started, app_iter, blocking=True)
+
+
+async def lifespan(receive: Receive, send: Send):
+    """Stops the threads of the executors when the server shuts down."""
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            for executor in (_prepare_executor, _executor):
+                await asyncio.get_running_loop().run_in_executor(None, executor.shutdown)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope: Scope, receive: Receive, send: Send):
+    """ASGI application serving the app."""
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        raise ValueError(f'Unsupported ASGI scope type {scope["type"]!r}')
+
+    environ = wsgi_environ(scope, await read_body(receive))
+    ctx = app.request_context(environ)
+    ctx.match_request()
+    rule = ctx.request.url_rule
+    view_class = getattr(app.view_functions.get(rule.endpoint), 'view_class', None) if rule else None
+    if environ['REQUEST_METHOD'] == 'GET' and isinstance(view_class, type) and issubclass(view_class, QueryApiView):
+        await serve_async_view(send, environ, ctx, async_view_class(view_class))
+    else:
+        await serve_wsgi(send, environ)
@@ -0,0 +1,176 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, Optional
+
+from flask_caching.backends.base import BaseCache
+
+from .utils import DataVersion
+
+
+class SQLiteCache(BaseCache):
+    """
+    A cache backend stored in a local SQLite file, so that it is shared by all
+    worker processes on the host instead of being warmed up by each of them.
+
+    Every entry is tagged with the data version current when it was set, and
+    only entries of the current version are ever returned. Bumping the data
+    version (as ingestion does) therefore invalidates all older entries at
+    once, and they are purged on the next write. Results computed from older
+    data must be set with the version they were computed at, so that they are
+    dropped rather than tagged with a version bumped in the meantime.
+
+    Counting entries takes a scan of the table, so they are only counted
+    every 1% of `threshold` writes of a process, by which they may exceed the
+    threshold in between.
+
+    :param cache_file:         Path to SQLite file storing the entries.
+    :param data_version:       Counter of data changes that scopes the entries.
+    :param threshold:          Maximum number of entries before the oldest ones
+                               are evicted.
+    :param default_timeout:    Default timeout (in seconds) of entries, where 0
+                               means entries never expire.
+    """
+
+    def __init__(self, cache_file: str, data_version: DataVersion, threshold: int = 10000,
+                 default_timeout: int = 300):
+        super().__init__(default_timeout=default_timeout)
+        self.cache_file = cache_file
+        self.data_version = data_version
+        self.threshold = threshold
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._purged_version: Optional[int] = None
+        self._prune_every = max(1, threshold // 100)
+        self._writes = 0
+        self._stats = Counter()
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        kwargs.update(
+            cache_file=config['CACHE_SQLITE_FILE'],
+            data_version=DataVersion(config['DATA_VERSION_FILE']),
+            threshold=config['CACHE_THRESHOLD'],
+        )
+        return cls(*args, **kwargs)
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        """Connection owned by the current thread of the current process."""
+        pid, conn = getattr(self._local, 'conn', (None, None))
+        if pid != os.getpid():
+            conn = sqlite3.connect(self.cache_file, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode = WAL').fetchall()
+            conn.execute('PRAGMA synchronous = NORMAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS cache_entries (
+                    key TEXT PRIMARY KEY,
+                    version INTEGER NOT NULL,
+                    expires REAL NOT NULL,
+                    value BLOB NOT NULL
+                ) WITHOUT ROWID
+            ''')
+            self._local.conn = os.getpid(), conn
+        return conn
+
+    def _expires(self, timeout: Optional[int]) -> float:
+        timeout = self._normalize_timeout(timeout)
+        return time.time() + timeout if timeout != 0 else 0
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def get(self, key: str) -> Any:
+        row = self._conn.execute(
+            'SELECT value FROM cache_entries WHERE key = ? AND version = ? AND (expires = 0 OR expires > ?)',
+            (key, self.data_version.get(), time.time()),
+        ).fetchone()
+        self._count('hits' if row else 'misses')
+        return pickle.loads(row[0]) if row else None
+
+    def set(self, key: str, value: Any, timeout: Optional[int] = None, version: Optional[int] = None) -> bool:
+        """
+        Sets an entry of the current data version, unless `version` (i.e. the
+        version its value was computed at) is given and no longer current.
+        """
+        current = self.data_version.get()
+        if version is not None and version != current:
+            self._count('stale')
+            return False
+        version = current
+        self._conn.execute(
+            'INSERT OR REPLACE INTO cache_entries (key, version, expires, value) VALUES (?, ?, ?, ?)',
+            (key, version, self._expires(timeout), pickle.dumps(value, pickle.HIGHEST_PROTOCOL)),
+        )
+        self._prune(version)
+        return True
+
+    def add(self, key: str, value: Any, timeout: Optional[int] = None) -> bool:
+        if self.has(key):
+            return False
+        return self.set(key, value, timeout)
+
+    def delete(self, key: str) -> bool:
+        return self._conn.execute('DELETE FROM cache_entries WHERE key = ?', (key,)).rowcount > 0
+
+    def has(self, key: str) -> bool:
+        return self._conn.execute(
+            'SELECT 1 FROM cache_entries WHERE key = ? AND version = ? AND (expires = 0 OR expires > ?)',
+            (key, self.data_version.get(), time.time()),
+        ).fetchone() is not None
+
+    def clear(self) -> bool:
+        self._conn.execute('DELETE FROM cache_entries')
+        return True
+
+    def _prune(self, version: int):
+        """Purges entries of older versions and evicts entries over threshold."""
+        conn = self._conn
+        if version != self._purged_version:
+            conn.execute('DELETE FROM cache_entries WHERE version != ?', (version,))
+            self._purged_version = version
+        with self._lock:
+            self._writes = (self._writes + 1) % self._prune_every
+            if self._writes:
+                return
+        (total,), = conn.execute('SELECT COUNT(*) FROM cache_entries').fetchall()
+        if total > self.threshold:
+            # Evict entries closest to expire first, never-expiring ones last
+            conn.execute(
+                'DELETE FROM cache_entries WHERE key IN ('
+                'SELECT key FROM cache_entries ORDER BY expires = 0, expires LIMIT ?)',
+                (total - self.threshold,),
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns statistics of the cache: number and size of entries of the
+        current data version shared by all processes, and hits, misses and
+        stale results (computed from older data, hence not set) of this
+        process.
+        """
+        version = self.data_version.get()
+        (entries, size), = self._conn.execute(
+            'SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM cache_entries WHERE version = ?',
+            (version,),
+        ).fetchall()
+        with self._lock:
+            hits, misses, stale = self._stats['hits'], self._stats['misses'], self._stats['stale']
+        return {
+            'data_version': version,
+            'entries': entries,
+            'size': size,
+            'file_size': sum(
+                os.path.getsize(path)
+                for path in (self.cache_file, f'{self.cache_file}-wal')
+                if os.path.exists(path)
+            ),
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / (hits + misses), 4) if hits + misses else None,
+            'stale': stale,
+        }
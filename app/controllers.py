@@ -1,41 +1,108 @@
+import json
+import math
+import sqlite3
+import random
+import re
+import time
 from abc import ABC, abstractmethod
+from base64 import urlsafe_b64decode, urlsafe_b64encode
 from hashlib import md5
-from typing import List, Dict
+from datetime import date
+from functools import partial
+from itertools import chain
+from typing import List, Dict, Any, Iterator, Tuple, Hashable, Optional, ClassVar
 from urllib.parse import urlencode
 
 from flask_caching import Cache
 
 from . import app
-from .models import CURRENT_YEAR, BeforeCurrentYearSale, CurrentYearSale
-from .utils import SQLite
+from .engines import ColumnarSales, np, get_columnar_sales
+from .models import CURRENT_YEAR, CumulativeRevenue, MonthlyRevenue, ProductRevenue, ProductSketch, RevenueCube, \
+    Sale, SalePartition
+from .utils import SQLite, SQLitePool, SingleFlight, DataVersion, PhaseTimer, LatencyTracker, TableStatistics, \
+    Workload
 
 # Init cache
 _cache = Cache(app)
 
+# Init pool of persistent SQLite connections, owned by the app
+_pool = app.extensions['sqlite_pool'] = SQLitePool(
+    app.config['DATABASE_FILE'],
+    size=app.config['SQLITE_POOL_SIZE'],
+    timeout=app.config['SQLITE_POOL_TIMEOUT'],
+    pragmas=app.config['SQLITE_READ_PRAGMAS'],
+    cached_statements=app.config['SQLITE_CACHED_STATEMENTS'],
+)
+
+# Init coalescing of identical queries executed concurrently by threads
+_flights = SingleFlight()
+
+# Init data version, which is bumped by ingestion
+_data_version = DataVersion(app.config['DATA_VERSION_FILE'])
+
+# Init latencies of profiles observed by this worker, used by `profile=auto`
+_latencies = LatencyTracker()
+
+# Init record of statement shapes executed by this worker, for the index advisor
+_workload = Workload(app.config['WORKLOAD_MAX_STATEMENTS'])
+
 
 class ParamError(Exception):
     """Raised when parameter validation is failed."""
 
 
 class BaseQueryController(ABC):
-    def __init__(self, profile: int = None, cache=False, **params):
+    # Engines that queries can be executed on
+    engines = ('sqlite', 'numpy')
+
+    # Value of `profile` that lets the controller choose the profile
+    AUTO = 'auto'
+
+    # Names of the columns of results. Rows may carry trailing columns that
+    # are not part of results (e.g. the id of sales for pagination).
+    columns: ClassVar[Tuple[str, ...]] = ()
+
+    def __init__(self, profile: int | str = None, cache=False, engine: str = 'sqlite', **params):
         """
         :param profile:    Which profile is selected. Default is using the most
                            optimized profile which is the last one found in
-                           profile list.
+                           profile list. If `auto`, the profile expected to be
+                           the fastest for the parameters is selected (see
+                           `choose_profile()`).
         :param cache:      Whether to enable caching. Default is False.
+        :param engine:     Which engine executes the query, either `sqlite`
+                           (default) or `numpy` which uses an in-memory
+                           columnar copy of sales data and ignores profiles.
         :param params:     Custom parameters for populating the query.
         """
+        # Timings of the phases of the query, e.g. `populate_query`, `execute`
+        self.timings = PhaseTimer()
+
+        # Init SQLite wrapper as `db` instance
+        self.db = SQLite(app.config['DATABASE_FILE'], pool=_pool)
+
         # Validate profile
-        if profile is not None and (not isinstance(profile, int) or profile < 1):
-            raise ParamError('Profile must be an integer >= 1')
+        if profile is not None and profile != self.AUTO and (not isinstance(profile, int) or profile < 1):
+            raise ParamError(f'Profile must be an integer >= 1 or {self.AUTO!r}')
+
+        # Validate engine
+        if engine not in self.engines:
+            raise ParamError(f'Engine must be one of: {", ".join(self.engines)}')
+        if engine == 'numpy' and np is None:
+            raise ParamError('Engine numpy is not available')
+
+        # Shape of the parameters, under which latencies of profiles are observed
+        self.shape = self.profile_shape(**params)
 
         # Select query based on input profile
+        requested = profile
         try:
             queries = self.query_profiles()
-            if profile is None:
+            if profile is None or (profile == self.AUTO and engine != 'sqlite'):
                 # Use the most optimized profile by default
                 profile = len(queries)
+            elif profile == self.AUTO:
+                profile = self.choose_profile(len(queries), **params)
             self.query = queries[profile - 1]
         except IndexError:
             raise ParamError(f'Profile {profile} does not exist')
@@ -43,16 +110,30 @@ class BaseQueryController(ABC):
         # Save inner attrs
         self.cache = bool(cache)
         self.profile = profile
+        self.engine = engine
 
         # Create query key to support caching
-        encoded_params = urlencode({'profile': profile, **params})
+        encoded_params = urlencode({'profile': profile, 'engine': engine, **params})
         self.query_key = md5((self.query + encoded_params).encode()).hexdigest()
 
-        # Query population
-        self.populate_query(**params)
+        # Key of the request, which is the same whichever profile `auto`
+        # chooses, since every profile returns the same results
+        self.request_key = self.query_key
+        if requested == self.AUTO:
+            encoded_params = urlencode({'profile': requested, 'engine': engine, **params})
+            self.request_key = md5(f'{type(self).__name__}:{encoded_params}'.encode()).hexdigest()
 
-        # Init SQLite wrapper as `db` instance
-        self.db = SQLite(app.config['DATABASE_FILE'])
+        # Query population, values of parameters are bound to the query's
+        # named placeholders at execution time rather than embedded into it.
+        self.query_args: Dict[str, Any] = {}
+        with self.timings.phase('populate_query'):
+            self.populate_query(**params)
+
+        # Metadata of results, available once the query is executed
+        self.meta: Dict[str, Any] = {}
+
+        # Whether results came from cache (`hit`/`miss`), `off` if disabled
+        self.cache_status = 'off'
 
     @abstractmethod
     def query_profiles(self) -> List[str]:
@@ -63,24 +144,320 @@ class BaseQueryController(ABC):
 
     def parse_results(self, results):
         """Parses the results of executed query into usable data."""
-        return results
+        columns = self.columns
+        return [dict(zip(columns, row)) for row in results] if columns else results
+
+    def trim_rows(self, rows: List[tuple]) -> List[tuple]:
+        """Returns the rows of executed query without their columns that are not part of results."""
+        width = len(self.columns)
+        if not width or not rows or len(rows[0]) == width:
+            return rows
+        return [row[:width] for row in rows]
+
+    def results_meta(self, results) -> Dict[str, Any]:
+        """
+        Returns metadata describing the results of executed query (e.g. the
+        cursor of next page), which are kept in `meta` along with the parsed
+        results.
+        """
+        return {}
+
+    def profile_shape(self, **params) -> Hashable:
+        """
+        Returns the shape of the custom parameters, e.g. which filters are set.
+        Queries of the same shape are expected to favor the same profile, so
+        latencies of profiles are observed per shape.
+        """
+        return ()
+
+    def estimate_costs(self, **params) -> Dict[int, float]:
+        """
+        Returns the estimated cost of executing each profile with the custom
+        parameters, in number of rows read. Profiles without estimates are
+        considered as costly as the cheapest one.
+        """
+        return {}
+
+    def choose_profile(self, profiles: int, **params) -> int:
+        """
+        Returns the profile expected to be the fastest for the custom
+        parameters. Profiles are ranked by their estimated costs, the most
+        optimized one (i.e. the last) winning ties. Once the best ranked
+        profile and others have been observed enough under the same shape of
+        parameters, the one with the lowest observed latency is chosen
+        instead. Now and then, a profile not observed enough yet is chosen to
+        learn its latency, unless it is estimated far more costly.
+        """
+        costs = self.estimate_costs(**params)
+        ranked = sorted(range(1, profiles + 1), key=lambda p: (costs.get(p, 0), -p))
+        best = ranked[0]
+
+        # Average latencies of profiles observed enough
+        observed = {}
+        for profile in ranked:
+            count, average = _latencies.get((type(self).__name__, self.shape, profile))
+            if count >= app.config['AUTO_PROFILE_MIN_SAMPLES']:
+                observed[profile] = average
+        if best in observed and len(observed) > 1:
+            return min(observed, key=observed.get)
+
+        # Explore another profile that is not estimated far more costly
+        if random.random() < app.config['AUTO_PROFILE_EXPLORATION']:
+            limit = costs.get(best, 0) * app.config['AUTO_PROFILE_EXPLORATION_COST_RATIO']
+            for profile in ranked[1:]:
+                if profile not in observed and costs.get(profile, 0) <= limit:
+                    return profile
+        return best
+
+    @abstractmethod
+    def query_columnar(self, sales: ColumnarSales) -> List[tuple]:
+        """
+        Answers the query from a columnar copy of sales data, returns rows in
+        the same shape as the SQL query's.
+        """
+
+    def index_candidates(self) -> List[Tuple[str, Tuple[str, ...]]]:
+        """
+        Returns `(table, columns)` of indexes that may speed up the query, to
+        be evaluated by the index advisor. Columns compared by equality come
+        first, then those of ranges, grouping and ordering, then the other
+        columns read so that the index covers the query.
+        """
+        return []
+
+    def query_tables(self) -> List[str]:
+        """Returns the tables read by the query, in order."""
+        return list(dict.fromkeys(re.findall(r'\bFROM (\w+)', self.query)))
 
     def populate_query(self, **params):
-        """Populates custom parameters into the query before it is used."""
+        """
+        Populates custom parameters into the query before it is used. Values
+        should be put in `query_args` and referred to by named placeholders
+        (e.g. `:name`) so that the statement stays the same for any values.
+        """
+
+    def __call__(self, parse: bool = True):
+        """
+        Executes the selected profile's query and returns parsed results, or
+        their rows as tuples if not `parse` (see `trim_rows()`).
+        """
+        results = self.lookup_cache(parse)
+        if results is None:
+            results = self.compute(parse)
+        return results
+
+    def results_key(self, parse: bool = True) -> str:
+        """Returns the key of results in cache, which differs for parsed results and rows."""
+        return self.query_key if parse else f'{self.query_key}:rows'
+
+    def lookup_cache(self, parse: bool = True) -> Optional[Any]:
+        """
+        Returns cached results if caching is enabled and they exist, or None.
+        It never touches the sales database, so it is cheap enough to be
+        called by an event loop.
+        """
+        if not self.cache:
+            return None
+        with self.timings.phase('cache'):
+            cached = _cache.get(self.results_key(parse))
+        if cached is None:
+            self.cache_status = 'miss'
+            return None
+        self.cache_status = 'hit'
+        results, self.meta = cached
+        return results
+
+    def compute(self, parse: bool = True):
+        """Executes the selected profile's query without looking up the cache, and returns its results."""
+        # Identical queries in flight are executed once, their callers share
+        # the same results. Time spent waiting for the execution of another
+        # caller is recorded as `flight`.
+        self._executed, waiting = False, PhaseTimer()
+        with waiting.phase('flight'):
+            results, self.meta = _flights.do(self.results_key(parse), partial(self._execute_and_parse, parse))
+        if not self._executed:
+            self.timings.merge(waiting)
+        return results
+
+    @property
+    def meta(self) -> Dict[str, Any]:
+        """Metadata of results, including the profile they were queried by."""
+        return {**self._meta, 'query_profile': self.profile}
 
-    def __call__(self):
-        """Executes the selected profile's query and returns parsed results."""
+    @meta.setter
+    def meta(self, value: Dict[str, Any]):
+        self._meta = value
+
+    def _execute_and_parse(self, parse: bool = True) -> Tuple[Any, Dict[str, Any]]:
+        """Executes the query and returns parsed results (or rows) with their metadata."""
+        self._executed = True
+        # Results are cached under the data version they are computed at, so
+        # that they are not served once data is changed during execution
+        version = _data_version.get()
+        started = time.perf_counter()
+        with self.timings.phase('execute'):
+            rows = self.execute()
+        if self.engine == 'sqlite':
+            elapsed = (time.perf_counter() - started) * 1000
+            # Observe latency of the profile for choosing profiles automatically
+            _latencies.observe((type(self).__name__, self.shape, self.profile), elapsed)
+            # Record the statement shape for the index advisor
+            _workload.record(
+                self.query, self.query_args, elapsed, self.index_candidates,
+                controller=type(self).__name__, profile=self.profile,
+            )
+        with self.timings.phase('parse'):
+            results = self.parse_results(rows) if parse else self.trim_rows(rows)
+            meta = self.results_meta(rows)
         if self.cache:
-            # Returns cached results if existed
-            results = _cache.get(self.query_key)
-            if results is not None:
-                return results
+            # Cache results for latter calls
+            with self.timings.phase('cache'):
+                _cache.set(self.results_key(parse), (results, meta), version=version)
+        return results, meta
+
+    def iterate(self, size: int, parse: bool = True) -> Iterator[list]:
+        """
+        Executes the query on the selected engine and lazily yields parsed
+        results (or rows if not `parse`) in batches of at most `size` rows, so
+        that the whole resultset is never held in memory at once. Caching is
+        not applied.
+        """
+        parse_results = self.parse_results if parse else self.trim_rows
+        if self.engine == 'numpy':
+            rows = self.execute()
+            for i in range(0, len(rows), size):
+                yield parse_results(rows[i:i + size])
+            return
+        with self.db as conn:
+            for rows in conn.iterate(self.query, self.query_args, size=size):
+                yield parse_results(rows)
+
+    def execute(self) -> List[tuple]:
+        """Executes the query on the selected engine and returns its rows."""
+        if self.engine == 'numpy':
+            return self.query_columnar(get_columnar_sales(app.config['DATABASE_FILE']))
+        with self.db as conn:
+            return conn.fetchall(self.query, self.query_args)
+
+    def explain(self) -> List[Dict[str, Any]]:
+        """
+        Returns the plan chosen by SQLite for the final query of the selected
+        profile (i.e. `EXPLAIN QUERY PLAN`), one step per row. Each step has
+        its `id`, the `parent` step it belongs to, and its `detail` which
+        tells how a table is accessed, e.g. `SEARCH s USING INDEX ...`.
+        """
+        if self.engine != 'sqlite':
+            raise ParamError('Query plans are only available on engine sqlite')
         with self.db as conn:
-            results = self.parse_results(conn.fetchall(self.query))
-            if self.cache:
-                # Cache results for latter calls
-                _cache.set(self.query_key, results)
-            return results
+            rows = conn.fetchall(f'EXPLAIN QUERY PLAN {self.query}', self.query_args)
+        return [{'id': id_, 'parent': parent, 'detail': detail} for id_, parent, _, detail in rows]
+
+    def bind_date_range(self, start_date: str = None, end_date: str = None, single_day: bool = False):
+        """
+        Validates an optional range of sale dates, and binds its dates to
+        `:start_date` and `:end_date`. The range may be a single day (i.e. both
+        dates being the same) only if `single_day`.
+        """
+        for name, value in (('start_date', start_date), ('end_date', end_date)):
+            if value:
+                try:
+                    self.query_args[name] = SQLite.validates_date(value)
+                except ValueError as e:
+                    raise ParamError(e)
+        if start_date and end_date and single_day and start_date > end_date:
+            raise ParamError(f'`start_date` must not be after `end_date`')
+        if start_date and end_date and not single_day and start_date >= end_date:
+            raise ParamError(f'`start_date` must be before `end_date`')
+
+    def date_range_clause(self, date_field: str) -> str:
+        """Returns the `WHERE` clause of the bound date range on a date field, if any."""
+        conds = []
+        if 'start_date' in self.query_args:
+            conds.append(f'{date_field} >= :start_date')
+        if 'end_date' in self.query_args:
+            conds.append(f'{date_field} <= :end_date')
+        return f'WHERE {" AND ".join(conds)}' if conds else ''
+
+    # Registry of partitions of sales, per data version
+    _partitions: Tuple[int, List[Tuple[str, str, str, int]]] = None
+
+    @classmethod
+    def partition_registry(cls) -> List[Tuple[str, str, str, int]]:
+        """
+        Returns `(table, start_date, end_date, rows)` of all partitions of
+        sales in date order. The registry is reloaded whenever the data
+        version changes.
+        """
+        version = _data_version.get()
+        cached = BaseQueryController._partitions
+        if cached is None or cached[0] != version:
+            with SQLite(app.config['DATABASE_FILE'], pool=_pool) as conn:
+                try:
+                    partitions = conn.fetchall(
+                        f'SELECT name, start_date, end_date, rows FROM {SalePartition.__tablename__} ORDER BY start_date'
+                    )
+                except sqlite3.OperationalError:  # nothing ingested yet
+                    partitions = []
+            cached = BaseQueryController._partitions = version, partitions
+        return cached[1]
+
+    def partitions(self, start_date: str = None, end_date: str = None) -> List[Tuple[str, str, str, int]]:
+        """
+        Returns `(table, start_date, end_date, rows)` of the partitions of sales
+        whose periods overlap the date range, in date order.
+        """
+        return [
+            partition for partition in self.partition_registry()
+            if (not start_date or partition[2] >= start_date) and (not end_date or partition[1] <= end_date)
+        ]
+
+    @classmethod
+    def registries_loaded(cls) -> bool:
+        """
+        Returns whether the registries read by initing queries (see
+        `load_registries()`) are loaded for the current data version, so that
+        initing queries does not read the database.
+        """
+        cached = BaseQueryController._partitions
+        return cached is not None and cached[0] == _data_version.get()
+
+    @classmethod
+    def load_registries(cls):
+        """Loads the registries read by initing queries, e.g. the partitions of sales."""
+        cls.partition_registry()
+
+    def partitioned_queries(self, template: str, conditions: List[str], start_date: str = None,
+                            end_date: str = None, after: str = None) -> List[str]:
+        """
+        Returns the template query for each partition of sales overlapping the
+        date range, in date order, with its `{table}` placeholder replaced by
+        the partition table (aliased as `s`). Each query is filtered by the
+        conditions, and by the date range bound to `:start_date` and
+        `:end_date` unless its partition lies entirely within the range, so
+        whole partitions are read without going through their date index.
+
+        :param template:      Query reading sales from `{table}`.
+        :param conditions:    Conditions applied to every partition.
+        :param start_date:    First date of the range, if any.
+        :param end_date:      Last date of the range, if any.
+        :param after:         Partitions ending before this date are pruned
+                              too (e.g. the date of a cursor).
+        """
+        queries = []
+        for table, first, last, _ in self.partitions(max(filter(None, [start_date, after]), default=None), end_date):
+            conds = conditions.copy()
+            if start_date and first < start_date:
+                conds.append('s.date >= :start_date')
+            if end_date and last > end_date:
+                conds.append('s.date <= :end_date')
+            query = template.format(table=table)
+            if conds:
+                query += '\nWHERE ' + ' AND '.join(conds)
+            queries.append(query)
+        if not queries:
+            # No partition overlaps the range, query none of the sales
+            queries.append(template.format(table=Sale.__tablename__) + '\nWHERE 0')
+        return queries
 
     def __repr__(self):
         return f'<{self.__class__.__name__} profile={self.profile}>'
@@ -88,7 +465,7 @@ class BaseQueryController(ABC):
 
 class MonthlySalesQuery(BaseQueryController):
     """
-    The controller used for querying monthly sales data. It has 3 available
+    The controller used for querying monthly sales data. It has 4 available
     profiles as follows:
 
         * Profile 1:    Query that extracts `year` and `month` from `date` field
@@ -99,17 +476,51 @@ class MonthlySalesQuery(BaseQueryController):
 
         * Profile 3:    Query that uses pre-populated `indexed_year` and `indexed_month`
                         fields with composite index enabled.
+
+        * Profile 4:    Query that reads revenue straight from the `monthly_revenue`
+                        summary table kept up to date by ingestion.
     """
 
-    def parse_results(self, results) -> List[Dict[str, str | float]]:
-        columns = ['year', 'month', 'revenue']
-        return list(map(lambda res: dict(zip(columns, res)), results))
+    columns = ('year', 'month', 'revenue')
+
+    def populate_query(self, start_date=None, end_date=None):
+        self.bind_date_range(start_date, end_date, single_day=True)
+        if self.profile == 4 and (start_date or end_date):
+            # Summary table does not keep sale dates, so revenue of a date
+            # range is summed up from the partitions overlapping it instead
+            partitions = self.partitioned_queries('''
+                SELECT SUBSTR(s.date, 1, 4) AS selected_year, SUBSTR(s.date, 6, 2) AS selected_month, s.revenue
+                FROM {table} s
+            ''', [], start_date, end_date)
+            union = '\nUNION ALL\n'.join(partitions)
+            self.query = f'''
+                SELECT selected_year, selected_month, SUM(revenue)
+                FROM ({union})
+                GROUP BY selected_year, selected_month
+                ORDER BY selected_year, selected_month;
+            '''
+        else:
+            date_field = 'indexed_date' if self.profile == 3 else 'date'
+            self.query = self.query.format(where=self.date_range_clause(date_field))
+
+    def query_columnar(self, sales: ColumnarSales):
+        return sales.monthly_revenue(**self.query_args)
+
+    def index_candidates(self) -> List[Tuple[str, Tuple[str, ...]]]:
+        ranged = 'start_date' in self.query_args or 'end_date' in self.query_args
+        if self.profile == 4 and not ranged:
+            return []
+        date_field = 'indexed_date' if self.profile == 3 else 'date'
+        groups = {1: ['date'], 2: ['year', 'month'], 3: ['indexed_year', 'indexed_month'], 4: ['date']}[self.profile]
+        columns = tuple(dict.fromkeys([date_field] * ranged + groups + ['revenue']))
+        return [(table, columns) for table in self.query_tables()]
 
     def query_profiles(self) -> List[str]:
         strftime = lambda fmt: f'''STRFTIME('{fmt}', date)'''
         base_query = '''
             SELECT {year} AS selected_year, {month} AS selected_month, SUM(revenue)
             FROM sales
+            {{where}}
             GROUP BY selected_year, selected_month
             ORDER BY selected_year, selected_month;
         '''
@@ -117,29 +528,203 @@ class MonthlySalesQuery(BaseQueryController):
             base_query.format(year=strftime('%Y'), month=strftime('%m')),  # profile 1
             base_query.format(year='year', month='month'),  # profile 2
             base_query.format(year='indexed_year', month='indexed_month'),  # profile 3
+            # Profile 4
+            f'''
+                SELECT year, month, revenue
+                FROM {MonthlyRevenue.__tablename__}
+                ORDER BY year, month;
+            ''',
         ]
 
 
 class FilteredSalesQuery(BaseQueryController):
     """
-    The controller that returns sales data matching a set of filters. It has 3
+    The controller that returns sales data matching a set of filters. It has 4
     profiles as follows:
 
         * Profile 1:    No use of indexes.
 
         * Profile 2:    Leverages indexing for joining fields and the date field.
 
-        * Profile 3:    Leverages indexing like above plus partitioning tables.
+        * Profile 3:    Leverages indexing like above plus partitioning tables,
+                        split at the start of current year only: every
+                        partition before it and/or every partition after it
+                        is read, depending on the date range.
+
+        * Profile 4:    Leverages indexing like above plus partitioning tables
+                        by period, reading only the partitions whose periods
+                        overlap the date range.
+
+    Results can be paginated by `page_size`, in which case the `next_cursor`
+    metadata is an opaque cursor that encodes the last `(date, id)` seen. Pages
+    are sought through the date indexes rather than skipped with OFFSET, so
+    deep pages cost the same as the first one.
     """
 
-    def parse_results(self, results):
-        columns = ['sale_date', 'product_name', 'revenue', 'region_name']
-        return list(map(lambda res: dict(zip(columns, res)), results))
+    columns = ('sale_date', 'product_name', 'revenue', 'region_name')
 
-    def populate_query(self, product_name=None, region_name=None, start_date=None, end_date=None):
+    def results_meta(self, results) -> Dict[str, Any]:
+        page_size = self.query_args.get('page_size')
+        if page_size is None:
+            return {}
+        # A full page means there may be more results after its last row
+        next_cursor = None
+        if len(results) == page_size:
+            last = results[-1]
+            next_cursor = self.encode_cursor(last[0], last[-1])
+        return {'next_cursor': next_cursor}
+
+    def query_columnar(self, sales: ColumnarSales):
+        return sales.filtered_sales(**self.query_args)
+
+    def index_candidates(self) -> List[Tuple[str, Tuple[str, ...]]]:
+        if self.profile == 2:
+            product, region, date_field = 's.indexed_product_id', 's.indexed_region_id', 's.indexed_date'
+        else:
+            product, region, date_field = 's.product_id', 's.region_id', 's.date'
+        filters = [
+            column for column, name in ((product, 'product_name'), (region, 'region_name')) if name in self.query_args
+        ]
+        columns = tuple(column[2:] for column in dict.fromkeys([*filters, date_field, product, region, 's.revenue']))
+        return [(table, columns) for table in self.query_tables()]
+
+    # Statistics of sales tables and range of sale dates, per data version
+    _statistics: Tuple[int, TableStatistics, Optional[Tuple[date, date]]] = None
+
+    @classmethod
+    def statistics(cls) -> Tuple[TableStatistics, Optional[Tuple[date, date]]]:
+        """
+        Returns statistics of the sales tables, and the range of sale dates if
+        any, which are reloaded whenever the data version changes.
+        """
+        version = _data_version.get()
+        cached = FilteredSalesQuery._statistics
+        if cached is None or cached[0] != version:
+            tables = ['sales', 'products', 'regions']
+            with SQLite(app.config['DATABASE_FILE'], pool=_pool) as conn:
+                stats = TableStatistics(conn, tables)
+                (first, last), = conn.fetchall('SELECT MIN(indexed_date), MAX(indexed_date) FROM sales')
+            dates = (date.fromisoformat(first), date.fromisoformat(last)) if first else None
+            cached = FilteredSalesQuery._statistics = version, stats, dates
+        return cached[1], cached[2]
+
+    @classmethod
+    def registries_loaded(cls) -> bool:
+        cached = FilteredSalesQuery._statistics
+        return super().registries_loaded() and cached is not None and cached[0] == _data_version.get()
+
+    @classmethod
+    def load_registries(cls):
+        super().load_registries()
+        cls.statistics()
+
+    @staticmethod
+    def parse_date(value) -> Optional[date]:
+        """Returns the date of a date string, or None if it is not valid."""
+        try:
+            return date.fromisoformat(SQLite.validates_date(value))
+        except (ValueError, TypeError):
+            return None
+
+    def profile_shape(self, product_name=None, region_name=None, start_date=None, end_date=None,
+                      page_size=None, cursor=None) -> Hashable:
+        # Filters that are set, partitions involved, and the width of the date
+        # range in powers of 2 days.
+        start, end = self.parse_date(start_date), self.parse_date(end_date)
+        partitions = (
+            start is None or start.year < CURRENT_YEAR,
+            end is None or end.year >= CURRENT_YEAR,
+        )
+        width = int(math.log2((end - start).days + 1)) if start and end and start <= end else None
+        return bool(product_name), bool(region_name), partitions, width, page_size is not None or bool(cursor)
+
+    def estimate_costs(self, product_name=None, region_name=None, start_date=None, end_date=None,
+                       page_size=None, cursor=None) -> Dict[int, float]:
+        # A table is read either by scanning all of its rows, or by seeking its
+        # most selective index for the filters that are set, then looking up
+        # each matching row in the table, which costs the depth of the table.
+        # Sales are assumed to be spread evenly over their range of dates.
+        stats, dates = self.statistics()
+        if dates is None:
+            return {}
+        first, last = dates
+        start, end = self.parse_date(start_date) or first, self.parse_date(end_date) or last
+        paginated = page_size is not None or bool(cursor)
+        page_size = page_size if isinstance(page_size, int) and page_size > 0 else app.config['DEFAULT_PAGE_SIZE']
+
+        def date_selectivity(low: date, high: date) -> float:
+            """Fraction of sales between `low` and `high` that are in the date range."""
+            overlap = (min(end, high) - max(start, low)).days + 1
+            return max(overlap, 0) / ((high - low).days + 1) if high >= low else 0.0
+
+        def read(table: str, rows: int, product_index: str, region_index: str, low: date, high: date) -> float:
+            """Estimated number of rows read from a table of `rows` whose dates are between `low` and `high`."""
+            fraction = date_selectivity(low, high)
+            if not rows or not fraction:
+                return 0.0
+            selectivities = []
+            if start_date or end_date:
+                selectivities.append(fraction)
+            if product_name:
+                selectivities.append(stats.selectivity(table, product_index) or 1 / max(stats.rows['products'], 1))
+            if region_name:
+                selectivities.append(stats.selectivity(table, region_index) or 1 / max(stats.rows['regions'], 1))
+            seek = min(selectivities, default=1.0) * rows * math.log2(rows + 1)
+            if paginated and not (product_name or region_name):
+                # Pages are read in order from the date index, which stops
+                # after one page
+                seek = min(seek, page_size * math.log2(rows + 1))
+            return min(float(rows), seek)
+
+        def read_partitions(partitions: List[Tuple[str, str, str, int]]) -> float:
+            """Estimated number of rows read from partitions, each read costing at least one seek."""
+            return float(sum(
+                max(read(table, rows, f'ix_{table}_product_id', f'ix_{table}_region_id',
+                         date.fromisoformat(low), date.fromisoformat(high)), math.log2(rows + 1))
+                for table, low, high, rows in partitions
+            ))
+
+        # Profile 3 reads every partition on the sides of the start of current
+        # year that the date range reaches, profile 4 only those overlapping it.
+        # Sizes of partitions are kept by their registry.
+        boundary = date(CURRENT_YEAR, 1, 1)
+        sides = (start < boundary, end >= boundary)
+        return {
+            1: float(stats.rows['sales']),
+            2: read('sales', stats.rows['sales'], 'ix_sales_indexed_product_id', 'ix_sales_indexed_region_id',
+                    first, last),
+            3: read_partitions([p for p in self.partitions() if sides[p[1] >= boundary.isoformat()]]),
+            4: read_partitions(self.partitions(start_date, end_date)),
+        }
+
+    @staticmethod
+    def encode_cursor(date: str, id_: int) -> str:
+        """
+        Returns an opaque cursor that points right after `(date, id_)`.
+        Partitions hold copies of sales with the same ids, so cursors are
+        shared by all profiles and engines.
+        """
+        return urlsafe_b64encode(json.dumps([date, id_]).encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> Tuple[str, int]:
+        """Returns `(date, id)` that the input cursor points after."""
+        try:
+            date, id_ = json.loads(urlsafe_b64decode(cursor.encode()))
+            SQLite.validates_date(date)
+            assert isinstance(id_, int)
+        except (ValueError, TypeError, AssertionError):
+            raise ParamError(f'Invalid cursor {cursor!r}')
+        return date, id_
+
+    def populate_query(self, product_name=None, region_name=None, start_date=None, end_date=None,
+                       page_size=None, cursor=None):
         # Initial conditions
         conditions = []
 
+        # Date field used by the selected profile
+        date_field = 's.indexed_date' if self.profile == 2 else 's.date'
+
         def get_year(d):
             """Extracts year from date value."""
             try:
@@ -151,11 +736,11 @@ class FilteredSalesQuery(BaseQueryController):
         def range_condition(start=None, end=None) -> str:
             """Constructs range condition from start and/or end dates."""
             if start and end:
-                return f'date BETWEEN {start!r} AND {end!r}'
+                return f'{date_field} BETWEEN :start_date AND :end_date'
             if start:
-                return f'date >= {start!r}'
+                return f'{date_field} >= :start_date'
             if end:
-                return f'date <= {end!r}'
+                return f'{date_field} <= :end_date'
             raise AssertionError('Either `start` or `end` is required')
 
         def where_clause(start=None, end=None) -> str:
@@ -189,42 +774,90 @@ class FilteredSalesQuery(BaseQueryController):
 
         # Insert condition for product name if set
         if product_name:
-            conditions.append(f'product_name = {str(product_name)!r}')
+            conditions.append('product_name = :product_name')
+            self.query_args['product_name'] = str(product_name)
 
         # Insert condition for region name if set
         if region_name:
-            conditions.append(f'region_name = {str(region_name)!r}')
+            conditions.append('region_name = :region_name')
+            self.query_args['region_name'] = str(region_name)
+
+        # Bind dates of range condition if set
+        if start_date:
+            self.query_args['start_date'] = start_date
+        if end_date:
+            self.query_args['end_date'] = end_date
+
+        # Validate pagination if requested
+        paginated = page_size is not None or cursor is not None
+        if paginated:
+            if page_size is None:
+                page_size = app.config['DEFAULT_PAGE_SIZE']
+            if not isinstance(page_size, int) or page_size < 1:
+                raise ParamError('Page size must be an integer >= 1')
+            self.query_args['page_size'] = page_size
 
-        # Match other profiles
-        if self.profile != 3:
+        # Insert keyset condition that seeks right after the cursor if set. Its
+        # leading range on the date field is what lets the date index seek.
+        if cursor:
+            cursor_date, cursor_id = self.decode_cursor(cursor)
+            conditions.append(
+                f'{date_field} >= :cursor_date AND ({date_field} > :cursor_date OR s.id > :cursor_id)'
+            )
+            self.query_args.update(cursor_date=cursor_date, cursor_id=cursor_id)
+            # Partitions before current year are done once the cursor has
+            # reached current year
+            start_year_is_current = start_year_is_current or int(cursor_date[:4]) >= CURRENT_YEAR
+
+        # Match profiles reading the `sales` table
+        if self.profile in (1, 2):
             # Append where clause to the query if conditions or date range is
             # not empty.
             self.query += where_clause(start_date, end_date)
+            order_by = f'{date_field}, s.id'
 
-        # Match profile 3
-        ## Handles the case that only one partition (or table) gets involved
-        elif start_year_is_current or end_year_is_past:
-            table = (BeforeCurrentYearSale.__tablename__, CurrentYearSale.__tablename__)[start_year_is_current]
-            self.query = self.query.format(table=table) + where_clause(start_date, end_date)
+        # Match profile 4, which reads the partitions overlapping the date
+        # range (and not before the cursor)
+        elif self.profile == 4:
+            queries = self.partitioned_queries(
+                self.query, conditions, start_date, end_date, after=cursor and self.query_args['cursor_date']
+            )
+            self.query = '\nUNION ALL\n'.join(queries)
+            order_by = '1, 5' if len(queries) > 1 else f'{date_field}, s.id'
 
-        ## Handles the case that both partitions (or tables) get involved
+        # Match profile 3, which reads the partitions before current year
+        # unless the range (or the cursor) starts in current year, and those
+        # of current year unless the range ends before it. The start of the
+        # range is implied for partitions of current year once both sides get
+        # involved, and so is its end for partitions before current year.
         else:
-            # Constructs query that applies on first partition
-            query_1 = self.query.format(table=BeforeCurrentYearSale.__tablename__)
-            query_1 += where_clause(start=start_date)
-
-            # Constructs query that applies on second partition
-            query_2 = self.query.format(table=CurrentYearSale.__tablename__)
-            query_2 += where_clause(end=end_date)
+            boundary = date(CURRENT_YEAR, 1, 1).isoformat()
+            queries = []
+            for table, first, _, _ in self.partitions():
+                if first < boundary and not start_year_is_current:
+                    where = where_clause(start=start_date, end=end_year_is_past and end_date)
+                elif first >= boundary and not end_year_is_past:
+                    where = where_clause(start=start_year_is_current and start_date, end=end_date)
+                else:
+                    continue
+                queries.append(self.query.format(table=table) + where)
+            if not queries:
+                # No partition is involved, query none of the sales
+                queries.append(self.query.format(table=Sale.__tablename__) + '\nWHERE 0')
+            self.query = '\nUNION ALL\n'.join(queries)
+            # Compound queries are ordered by positions of result columns,
+            # i.e. `date` and `id`
+            order_by = '1, 5' if len(queries) > 1 else f'{date_field}, s.id'
 
-            # Final query is a UNION of both queries
-            self.query = '\nUNION ALL\n'.join([query_1, query_2])
+        # Order by keyset and limit to one page if paginated
+        if paginated:
+            self.query += f'\nORDER BY {order_by}\nLIMIT :page_size'
 
     def query_profiles(self) -> List[str]:
         return [
             # Profile 1: uses original `date`, `product_id`, and `region_id` fields
             '''
-                SELECT s.date, p.name AS product_name, s.revenue, r.name AS region_name
+                SELECT s.date, p.name AS product_name, s.revenue, r.name AS region_name, s.id
                 FROM sales s
                 JOIN products p ON s.product_id = p.id
                 JOIN regions r ON s.region_id = r.id
@@ -232,15 +865,24 @@ class FilteredSalesQuery(BaseQueryController):
 
             # Profile 2: uses indexed versions of `date`, `product_id`, and `region_id`
             '''
-                SELECT s.indexed_date AS date, p.name AS product_name, s.revenue, r.name AS region_name
+                SELECT s.indexed_date AS date, p.name AS product_name, s.revenue, r.name AS region_name, s.id
                 FROM sales s
                 JOIN products p ON s.indexed_product_id = p.id
                 JOIN regions r ON s.indexed_region_id = r.id
             ''',
 
-            # Profile 3: uses indexed versions and partitioned tables
+            # Profile 3: uses indexed versions and tables partitioned at the
+            # start of current year
+            '''
+                SELECT s.date, p.name AS product_name, s.revenue, r.name AS region_name, s.id
+                FROM {table} s
+                JOIN products p ON s.product_id = p.id
+                JOIN regions r ON s.region_id = r.id
+            ''',
+
+            # Profile 4: uses indexed versions and tables partitioned by period
             '''
-                SELECT s.date, p.name AS product_name, s.revenue, r.name AS region_name
+                SELECT s.date, p.name AS product_name, s.revenue, r.name AS region_name, s.id
                 FROM {table} s
                 JOIN products p ON s.product_id = p.id
                 JOIN regions r ON s.region_id = r.id
@@ -251,18 +893,109 @@ class FilteredSalesQuery(BaseQueryController):
 class TopProductsQuery(BaseQueryController):
     """
     This controller returns top five products based on sales revenue. There are
-    2 profiles implemented:
+    3 profiles implemented:
 
         * Profile 1:    Query without using indexes.
 
         * Profile 2:    Query with indexing fully enabled.
+
+        * Profile 3:    Query that reads the `product_revenue` summary table kept
+                        up to date by ingestion through its total revenue index.
+
+    If `approximate`, profiles are ignored (the profile is `None`) and top
+    products are approximated by merging the sketches of `product_sketches`
+    covering the date range, each with the error of its revenue, i.e. how much
+    it may be overestimated.
     """
-    def parse_results(self, results):
-        columns = ['product_name', 'total_revenue']
-        return list(map(lambda res: dict(zip(columns, res)), results))
 
-    def populate_query(self, limit=None):
-        self.query = self.query.format(limit=limit or 5)
+    columns = ('product_name', 'total_revenue')
+
+    def populate_query(self, limit=None, start_date=None, end_date=None, approximate=False):
+        self.query_args['limit'] = limit or 5
+        self.bind_date_range(start_date, end_date)
+        if approximate:
+            if self.engine != 'sqlite':
+                raise ParamError(f'Engine {self.engine} cannot approximate top products')
+            # Sketches are read whichever profile is selected, so none is reported
+            self.profile = None
+            self.approximate_query(start_date, end_date)
+        elif self.profile == 3 and (start_date or end_date):
+            # Summary table does not keep sale dates, so revenue of a date
+            # range is summed up from the partitions overlapping it instead
+            partitions = self.partitioned_queries('''
+                SELECT s.product_id, s.revenue
+                FROM {table} s
+            ''', [], start_date, end_date)
+            union = '\nUNION ALL\n'.join(partitions)
+            self.query = f'''
+                SELECT p.name AS product_name, SUM(s.revenue) AS total_revenue
+                FROM ({union}) s
+                JOIN products p ON s.product_id = p.id
+                GROUP BY s.product_id
+                ORDER BY total_revenue DESC
+                LIMIT :limit;
+            '''
+        else:
+            date_field = 's.indexed_date' if self.profile == 2 else 's.date'
+            self.query = self.query.format(where=self.date_range_clause(date_field))
+
+    def approximate_query(self, start_date: str = None, end_date: str = None):
+        """
+        Replaces the query with one merging the sketches of the fewest periods
+        covering the date range, which is bounded by the periods of partitions
+        of sales if open. The revenue of a product is summed up from the
+        sketches keeping it, plus the upper bound of its revenue from each of
+        the others, so its error is the sum of those bounds and of its errors.
+        Rows carry the sum of all bounds, which no error exceeds, as their
+        last column.
+        """
+        self.columns = ('product_name', 'total_revenue', 'revenue_error')
+        partitions = self.partitions(start_date, end_date)
+        periods = []
+        if partitions:
+            first = max(filter(None, [start_date, partitions[0][1]]))
+            last = min(filter(None, [end_date, partitions[-1][2]]))
+            periods = ProductSketch.periods(date.fromisoformat(first), date.fromisoformat(last))
+        self.query_args['periods'] = json.dumps(periods)
+        self.query = f'''
+            WITH bounds AS (
+                SELECT s.period, s.error AS bound
+                FROM json_each(:periods) j
+                JOIN {ProductSketch.__tablename__} s ON s.period = j.value AND s.product_id = {ProductSketch.ALL}
+            )
+            SELECT p.name AS product_name,
+                   ROUND(SUM(s.revenue - b.bound) + t.bound, 2) AS total_revenue,
+                   ROUND(SUM(s.error - b.bound) + t.bound, 2) AS revenue_error,
+                   ROUND(t.bound, 2) AS revenue_error_bound
+            FROM bounds b
+            JOIN {ProductSketch.__tablename__} s ON s.period = b.period AND s.product_id > {ProductSketch.ALL}
+            JOIN products p ON s.product_id = p.id
+            CROSS JOIN (SELECT SUM(bound) AS bound FROM bounds) t
+            GROUP BY s.product_id
+            ORDER BY total_revenue DESC
+            LIMIT :limit;
+        '''
+
+    def results_meta(self, results) -> Dict[str, Any]:
+        if 'periods' not in self.query_args:
+            return {}
+        return {'revenue_error_bound': results[0][-1] if results else None}
+
+    def profile_shape(self, limit=None, start_date=None, end_date=None, approximate=False) -> Hashable:
+        return bool(approximate)
+
+    def query_columnar(self, sales: ColumnarSales):
+        return sales.top_products(**self.query_args)
+
+    def index_candidates(self) -> List[Tuple[str, Tuple[str, ...]]]:
+        ranged = 'start_date' in self.query_args or 'end_date' in self.query_args
+        if (self.profile == 3 and not ranged) or 'periods' in self.query_args:
+            return []
+        if self.profile == 2:
+            columns = ('indexed_date',) * ranged + ('indexed_product_id', 'indexed_revenue')
+        else:
+            columns = ('date',) * ranged + ('product_id', 'revenue')
+        return [(table, columns) for table in self.query_tables()]
 
     def query_profiles(self) -> List[str]:
         return [
@@ -271,9 +1004,10 @@ class TopProductsQuery(BaseQueryController):
                 SELECT p.name AS product_name, SUM(s.revenue) AS total_revenue
                 FROM sales s
                 JOIN products p ON s.product_id = p.id
+                {where}
                 GROUP BY product_name
                 ORDER BY total_revenue DESC
-                LIMIT {limit};
+                LIMIT :limit;
             ''',
 
             # Profile 2
@@ -281,8 +1015,278 @@ class TopProductsQuery(BaseQueryController):
                 SELECT p.name AS product_name, SUM(s.indexed_revenue) AS total_revenue
                 FROM sales s
                 JOIN products p ON s.indexed_product_id = p.id
+                {where}
                 GROUP BY product_name
                 ORDER BY total_revenue DESC
-                LIMIT {limit};
+                LIMIT :limit;
+            ''',
+
+            # Profile 3
+            f'''
+                SELECT p.name AS product_name, pr.total_revenue
+                FROM {ProductRevenue.__tablename__} pr
+                JOIN products p ON pr.product_id = p.id
+                ORDER BY pr.total_revenue DESC
+                LIMIT :limit;
+            ''',
+        ]
+
+
+class RangeRevenueQuery(BaseQueryController):
+    """
+    This controller returns the total revenue of sales made within a date range
+    (both dates included), optionally of one product and/or region. There are
+    3 profiles implemented:
+
+        * Profile 1:    Query that sums up matching sales through the indexes of
+                        the `sales` table.
+
+        * Profile 2:    Query that sums up matching sales from the partitions of
+                        sales whose periods overlap the date range.
+
+        * Profile 3:    Query that reads the `cumulative_revenue` summary table
+                        kept up to date by ingestion, subtracting the revenue up
+                        to the day before the range from that up to its last
+                        day, i.e. two lookups whatever the width of the range.
+    """
+
+    columns = ('revenue',)
+
+    def populate_query(self, product_name=None, region_name=None, start_date=None, end_date=None):
+        self.bind_date_range(start_date, end_date, single_day=True)
+        if product_name:
+            self.query_args['product_name'] = str(product_name)
+        if region_name:
+            self.query_args['region_name'] = str(region_name)
+
+        # Ids of the product and region to filter by
+        product_id = '(SELECT id FROM products WHERE name = :product_name)'
+        region_id = '(SELECT id FROM regions WHERE name = :region_name)'
+
+        if self.profile == 1:
+            conditions = []
+            if product_name:
+                conditions.append(f's.indexed_product_id = {product_id}')
+            if region_name:
+                conditions.append(f's.indexed_region_id = {region_id}')
+            if start_date:
+                conditions.append('s.indexed_date >= :start_date')
+            if end_date:
+                conditions.append('s.indexed_date <= :end_date')
+            self.query = self.query.format(where=f'WHERE {" AND ".join(conditions)}' if conditions else '')
+
+        elif self.profile == 2:
+            conditions = []
+            if product_name:
+                conditions.append(f's.product_id = {product_id}')
+            if region_name:
+                conditions.append(f's.region_id = {region_id}')
+            partitions = self.partitioned_queries('''
+                SELECT s.revenue
+                FROM {table} s
+            ''', conditions, start_date, end_date)
+            self.query = self.query.format(union='\nUNION ALL\n'.join(partitions))
+
+        else:
+            # Revenue of the product and region (or all of them) up to a date,
+            # read from their latest row on or before it
+            key = [
+                f'c.product_id = {product_id if product_name else CumulativeRevenue.ALL}',
+                f'c.region_id = {region_id if region_name else CumulativeRevenue.ALL}',
+            ]
+
+            def revenue_up_to(condition: str = None) -> str:
+                where = ' AND '.join(key + [condition] * bool(condition))
+                return f'''COALESCE((
+                    SELECT c.revenue
+                    FROM {CumulativeRevenue.__tablename__} c
+                    WHERE {where}
+                    ORDER BY c.date DESC
+                    LIMIT 1
+                ), 0)'''
+
+            total = revenue_up_to('c.date <= :end_date' if end_date else None)
+            if start_date:
+                total += ' - ' + revenue_up_to('c.date < :start_date')
+            self.query = self.query.format(total=total)
+
+    def profile_shape(self, product_name=None, region_name=None, start_date=None, end_date=None) -> Hashable:
+        return bool(product_name), bool(region_name)
+
+    def query_columnar(self, sales: ColumnarSales):
+        return sales.range_revenue(**self.query_args)
+
+    def index_candidates(self) -> List[Tuple[str, Tuple[str, ...]]]:
+        if self.profile == 3:
+            return []
+        if self.profile == 1:
+            columns = ['indexed_product_id', 'indexed_region_id', 'indexed_date', 'indexed_revenue']
+        else:
+            columns = ['product_id', 'region_id', 'date', 'revenue']
+        product, region, date_field, revenue = columns
+        ranged = 'start_date' in self.query_args or 'end_date' in self.query_args
+        filters = [column for column, name in ((product, 'product_name'), (region, 'region_name'))
+                   if name in self.query_args]
+        columns = tuple(filters + [date_field] * ranged + [revenue])
+        return [(table, columns) for table in self.query_tables() if table not in ('products', 'regions')]
+
+    def query_profiles(self) -> List[str]:
+        return [
+            # Profile 1
+            '''
+                SELECT ROUND(COALESCE(SUM(s.indexed_revenue), 0), 2) AS revenue
+                FROM sales s
+                {where};
+            ''',
+
+            # Profile 2
+            '''
+                SELECT ROUND(COALESCE(SUM(revenue), 0), 2) AS revenue
+                FROM ({union});
+            ''',
+
+            # Profile 3
+            '''
+                SELECT ROUND({total}, 2) AS revenue;
+            ''',
+        ]
+
+
+class RevenueCubeQuery(BaseQueryController):
+    """
+    This controller returns revenue grouped by any subset of the dimensions
+    `month`, `product` and `region` (set by `group_by`), optionally within a
+    range of months and of one product and/or region. There are 2 profiles
+    implemented:
+
+        * Profile 1:    Query that groups sales of the `sales` table.
+
+        * Profile 2:    Query that rolls up the cells of the `revenue_cube`
+                        summary table kept up to date by ingestion, which hold
+                        revenue per month, product and region.
+
+    Results are ordered by their dimensions, in the order above.
+    """
+
+    # Columns of results of each dimension, and the columns of the `sales`
+    # table (or of cells) they are grouped by
+    dimensions: ClassVar[Dict[str, Tuple[Tuple[str, ...], Tuple[str, ...]]]] = {
+        'month': (('year', 'month'), ('year', 'month')),
+        'product': (('product_name',), ('product_id',)),
+        'region': (('region_name',), ('region_id',)),
+    }
+
+    # Orders of dimensions that cells are kept in by the primary key and the
+    # indexes of the cube. Cells are grouped in the order that starts with the
+    # grouped dimensions, so that they are read in group order.
+    cell_orders: ClassVar[List[Tuple[str, ...]]] = [
+        ('month', 'product', 'region'),
+        ('product', 'region', 'month'),
+        ('region', 'month', 'product'),
+    ]
+
+    @classmethod
+    def parse_dimensions(cls, group_by: str | List[str] = None) -> Tuple[str, ...]:
+        """Returns the dimensions of a comma-separated list (or a list) of them, in the order of `dimensions`."""
+        names = group_by.split(',') if isinstance(group_by, str) else list(group_by or [])
+        names = [name.strip() for name in names if name and name.strip()]
+        unknown = [name for name in names if name not in cls.dimensions]
+        if unknown:
+            raise ParamError(f'Dimensions of `group_by` must be among: {", ".join(cls.dimensions)}')
+        return tuple(dimension for dimension in cls.dimensions if dimension in names)
+
+    @staticmethod
+    def validates_month(value: str) -> str:
+        """Validates a month value, which must be in the format of `yyyy-mm`."""
+        if not isinstance(value, str) or not re.fullmatch(r'\d{4}-\d{2}', value) or not '01' <= value[5:] <= '12':
+            raise ParamError(f'Month {value!r} must be in the format of yyyy-mm')
+        return value
+
+    def populate_query(self, group_by=None, product_name=None, region_name=None, start_month=None, end_month=None):
+        self.group_by = self.parse_dimensions(group_by)
+        self.columns = tuple(chain.from_iterable(self.dimensions[d][0] for d in self.group_by)) + ('revenue',)
+
+        # Filters of sales, or of cells
+        conditions = []
+        if start_month:
+            self.query_args['start_month'] = self.validates_month(start_month)
+            conditions.append('(s.year, s.month) >= (SUBSTR(:start_month, 1, 4), SUBSTR(:start_month, 6, 2))')
+        if end_month:
+            self.query_args['end_month'] = self.validates_month(end_month)
+            conditions.append('(s.year, s.month) <= (SUBSTR(:end_month, 1, 4), SUBSTR(:end_month, 6, 2))')
+        if start_month and end_month and start_month > end_month:
+            raise ParamError('`start_month` must not be after `end_month`')
+        if product_name:
+            self.query_args['product_name'] = str(product_name)
+            conditions.append('s.product_id = (SELECT id FROM products WHERE name = :product_name)')
+        if region_name:
+            self.query_args['region_name'] = str(region_name)
+            conditions.append('s.region_id = (SELECT id FROM regions WHERE name = :region_name)')
+
+        # Sales (or cells) are grouped by ids first, then names of products
+        # and regions are joined to the grouped rows
+        cell_order = next(order for order in self.cell_orders if set(order[:len(self.group_by)]) == set(self.group_by))
+        keys = [column for dimension in cell_order if dimension in self.group_by
+                for column in self.dimensions[dimension][1]]
+        selected, joins, order = [], [], []
+        for dimension in self.group_by:
+            if dimension == 'month':
+                selected += ['g.year', 'g.month']
+                order += ['g.year', 'g.month']
+            elif dimension == 'product':
+                selected.append('p.name AS product_name')
+                joins.append('JOIN products p ON g.product_id = p.id')
+                order.append('product_name')
+            else:
+                selected.append('r.name AS region_name')
+                joins.append('JOIN regions r ON g.region_id = r.id')
+                order.append('region_name')
+
+        clauses = [f'WHERE {" AND ".join(conditions)}'] if conditions else []
+        if keys:
+            clauses.append(f'GROUP BY {", ".join(f"s.{key}" for key in keys)}')
+            joins.append(f'ORDER BY {", ".join(order)}')
+        self.query = self.query.format(
+            columns=''.join(f'{column}, ' for column in selected),
+            keys=''.join(f's.{key}, ' for key in keys),
+            clauses=''.join(f'\n{clause}' for clause in clauses),
+            joins=''.join(f'\n{clause}' for clause in joins),
+        )
+
+    def profile_shape(self, group_by=None, product_name=None, region_name=None, start_month=None,
+                      end_month=None) -> Hashable:
+        return self.parse_dimensions(group_by), bool(product_name), bool(region_name), bool(start_month or end_month)
+
+    def query_columnar(self, sales: ColumnarSales):
+        return sales.grouped_revenue(self.group_by, **self.query_args)
+
+    def index_candidates(self) -> List[Tuple[str, Tuple[str, ...]]]:
+        if self.profile == 2:
+            return []
+        filters = [column for column, name in (('product_id', 'product_name'), ('region_id', 'region_name'))
+                   if name in self.query_args]
+        ranged = 'start_month' in self.query_args or 'end_month' in self.query_args
+        groups = [column for dimension in self.group_by for column in self.dimensions[dimension][1]]
+        columns = tuple(dict.fromkeys(filters + ['year', 'month'] * ranged + groups + ['revenue']))
+        return [(Sale.__tablename__, columns)]
+
+    def query_profiles(self) -> List[str]:
+        return [
+            # Profile 1
+            '''
+                SELECT {columns}ROUND(g.revenue, 2) AS revenue
+                FROM (
+                    SELECT {keys}COALESCE(SUM(s.revenue), 0) AS revenue
+                    FROM sales s{clauses}
+                ) g{joins};
+            ''',
+
+            # Profile 2
+            f'''
+                SELECT {{columns}}ROUND(g.revenue, 2) AS revenue
+                FROM (
+                    SELECT {{keys}}COALESCE(SUM(s.revenue), 0) AS revenue
+                    FROM {RevenueCube.__tablename__} s{{clauses}}
+                ) g{{joins}};
             ''',
         ]
@@ -0,0 +1,217 @@
+import sqlite3
+import threading
+from contextlib import closing
+from typing import List, Tuple, Any, Dict
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is an optional dependency
+    np = None
+
+# Columnar copies loaded by this process, with the connections used to watch
+# for changes of their database files
+_columnar_sales: Dict[str, Tuple[sqlite3.Connection, int, 'ColumnarSales']] = {}
+_columnar_sales_lock = threading.Lock()
+
+
+class ColumnarSales:
+    """
+    An in-memory columnar copy of the `sales` table, used as an alternative
+    engine to SQLite for answering aggregate queries with vectorized masks and
+    grouped reductions. It holds these columns:
+
+        * `ids`:         Sale ids.
+        * `dates`:       Sale dates as `datetime64[D]`.
+        * `products`:    Dictionary-encoded product codes, decoded by `product_names`.
+        * `regions`:     Dictionary-encoded region codes, decoded by `region_names`.
+        * `revenue`:     Revenue as `float64`.
+
+    A copy is never modified once loaded, so it can be read by many threads at
+    once. Use `get_columnar_sales()` to get an up-to-date copy.
+    """
+
+    # Number of rows fetched from SQLite at a time while loading
+    fetch_size = 1_000_000
+
+    def __init__(self, conn: sqlite3.Connection):
+        """
+        :param conn:    Connection to load sales data from.
+        """
+        if np is None:
+            raise RuntimeError('NumPy is required by the columnar engine')
+
+        product_ids, self.product_names = self._load_dictionary(conn, 'products')
+        region_ids, self.region_names = self._load_dictionary(conn, 'regions')
+
+        chunks = []
+        with closing(conn.execute('SELECT id, date, product_id, region_id, revenue FROM sales ORDER BY id')) as cursor:
+            while rows := cursor.fetchmany(self.fetch_size):
+                ids, dates, products, regions, revenue = zip(*rows)
+                chunks.append((
+                    np.array(ids, dtype=np.int64),
+                    np.array(dates, dtype='datetime64[D]'),
+                    np.searchsorted(product_ids, products).astype(np.int32),
+                    np.searchsorted(region_ids, regions).astype(np.int32),
+                    np.array(revenue, dtype=np.float64),
+                ))
+        if chunks:
+            self.ids, self.dates, self.products, self.regions, self.revenue = map(np.concatenate, zip(*chunks))
+        else:
+            self.ids = np.empty(0, dtype=np.int64)
+            self.dates = np.empty(0, dtype='datetime64[D]')
+            self.products = np.empty(0, dtype=np.int32)
+            self.regions = np.empty(0, dtype=np.int32)
+            self.revenue = np.empty(0, dtype=np.float64)
+
+    @staticmethod
+    def _load_dictionary(conn: sqlite3.Connection, table: str) -> Tuple['np.ndarray', 'np.ndarray']:
+        """Returns sorted ids of a lookup table, and names in the same order."""
+        rows = conn.execute(f'SELECT id, name FROM {table} ORDER BY id').fetchall()
+        ids, names = zip(*rows) if rows else ((), ())
+        return np.array(ids, dtype=np.int64), np.array(names, dtype=object)
+
+    def _code(self, names: 'np.ndarray', name: str) -> int:
+        """Returns the dictionary code of a name, or -1 if it does not exist."""
+        found = np.flatnonzero(names == name)
+        return int(found[0]) if found.size else -1
+
+    def _date_mask(self, start_date: str = None, end_date: str = None) -> 'np.ndarray':
+        """Returns the mask of sales made between optional start and end dates."""
+        mask = np.ones(self.dates.size, dtype=bool)
+        if start_date:
+            mask &= self.dates >= np.datetime64(start_date, 'D')
+        if end_date:
+            mask &= self.dates <= np.datetime64(end_date, 'D')
+        return mask
+
+    def monthly_revenue(self, start_date: str = None, end_date: str = None) -> List[Tuple[str, str, float]]:
+        """Returns `(year, month, revenue)` of every month in order, within an optional date range."""
+        mask = self._date_mask(start_date, end_date)
+        months, inverse = np.unique(self.dates[mask].astype('datetime64[M]'), return_inverse=True)
+        totals = np.bincount(inverse, weights=self.revenue[mask], minlength=months.size)
+        return [
+            (*month.split('-'), total)
+            for month, total in zip(np.datetime_as_string(months).tolist(), totals.tolist())
+        ]
+
+    def top_products(self, limit: int, start_date: str = None, end_date: str = None) -> List[Tuple[str, float]]:
+        """Returns `(product_name, total_revenue)` of top products by revenue, within an optional date range."""
+        mask = self._date_mask(start_date, end_date)
+        products = self.products[mask]
+        totals = np.bincount(products, weights=self.revenue[mask], minlength=self.product_names.size)
+        sold = np.flatnonzero(np.bincount(products, minlength=self.product_names.size))
+        top = sold[np.argsort(-totals[sold], kind='stable')][:limit]
+        return list(zip(self.product_names[top].tolist(), totals[top].tolist()))
+
+    def range_revenue(self, product_name: str = None, region_name: str = None, start_date: str = None,
+                      end_date: str = None) -> List[Tuple[float]]:
+        """Returns `(revenue,)` of sales made between optional start and end dates, of a product and region if set."""
+        mask = self._date_mask(start_date, end_date)
+        if product_name:
+            mask &= self.products == self._code(self.product_names, product_name)
+        if region_name:
+            mask &= self.regions == self._code(self.region_names, region_name)
+        return [(round(float(self.revenue[mask].sum()), 2),)]
+
+    def grouped_revenue(self, dimensions: Tuple[str, ...], product_name: str = None, region_name: str = None,
+                        start_month: str = None, end_month: str = None) -> List[tuple]:
+        """
+        Returns rows of revenue rounded to cents and grouped by dimensions
+        (`month` as year and month, `product` and `region` as names) in the
+        order of dimensions, within an optional range of months and of a
+        product and region if set.
+        """
+        mask = np.ones(self.dates.size, dtype=bool)
+        months = self.dates.astype('datetime64[M]')
+        if start_month:
+            mask &= months >= np.datetime64(start_month, 'M')
+        if end_month:
+            mask &= months <= np.datetime64(end_month, 'M')
+        if product_name:
+            mask &= self.products == self._code(self.product_names, product_name)
+        if region_name:
+            mask &= self.regions == self._code(self.region_names, region_name)
+        if not dimensions:
+            return [(round(float(self.revenue[mask].sum()), 2),)]
+
+        # Pack codes of dimensions into one key per sale, with months counted
+        # from the first one and products and regions coded by the rank of
+        # their names, so that keys of groups are in the order of their values
+        months = months[mask].astype(np.int64)
+        first_month = int(months.min()) if months.size else 0
+        sorted_names = {
+            'product': np.argsort(self.product_names, kind='stable'),
+            'region': np.argsort(self.region_names, kind='stable'),
+        }
+        codes = {
+            'month': (months - first_month, int(months.max()) - first_month + 1 if months.size else 1),
+            'product': (np.argsort(sorted_names['product'])[self.products[mask]], self.product_names.size),
+            'region': (np.argsort(sorted_names['region'])[self.regions[mask]], self.region_names.size),
+        }
+        keys = np.zeros(months.size, dtype=np.int64)
+        for dimension in dimensions:
+            dimension_codes, size = codes[dimension]
+            keys = keys * size + dimension_codes
+        groups, inverse = np.unique(keys, return_inverse=True)
+        totals = np.bincount(inverse, weights=self.revenue[mask], minlength=groups.size)
+
+        # Unpack codes of groups, from the last dimension to the first
+        decoded = []
+        for dimension in reversed(dimensions):
+            groups, group_codes = np.divmod(groups, codes[dimension][1])
+            if dimension == 'month':
+                decoded.append([tuple(month.split('-')) for month in
+                                np.datetime_as_string((group_codes + first_month).astype('datetime64[M]')).tolist()])
+            else:
+                names = self.product_names if dimension == 'product' else self.region_names
+                decoded.append([(name,) for name in names[sorted_names[dimension][group_codes]].tolist()])
+        return [sum(values, ()) + (round(total, 2),) for *values, total in zip(*reversed(decoded), totals.tolist())]
+
+    def filtered_sales(self, product_name: str = None, region_name: str = None, start_date: str = None,
+                       end_date: str = None, page_size: int = None, cursor_date: str = None,
+                       cursor_id: int = None) -> List[Tuple[str, str, Any, str, int]]:
+        """
+        Returns `(date, product_name, revenue, region_name, id)` of matching
+        sales. If `page_size` is set, only one page of sales ordered by
+        `(date, id)` is returned, starting right after the cursor if set.
+        """
+        mask = self._date_mask(start_date, end_date)
+        if product_name:
+            mask &= self.products == self._code(self.product_names, product_name)
+        if region_name:
+            mask &= self.regions == self._code(self.region_names, region_name)
+        if cursor_date:
+            cursor_date = np.datetime64(cursor_date, 'D')
+            mask &= (self.dates > cursor_date) | ((self.dates == cursor_date) & (self.ids > cursor_id))
+        selected = np.flatnonzero(mask)
+        if page_size is not None:
+            selected = selected[np.lexsort((self.ids[selected], self.dates[selected]))][:page_size]
+        return list(zip(
+            np.datetime_as_string(self.dates[selected]).tolist(),
+            self.product_names[self.products[selected]].tolist(),
+            self.revenue[selected].tolist(),
+            self.region_names[self.regions[selected]].tolist(),
+            self.ids[selected].tolist(),
+        ))
+
+
+def get_columnar_sales(db_file: str, refresh: bool = False) -> ColumnarSales:
+    """
+    Returns the columnar copy of `sales` owned by this process (i.e. by this
+    worker). The copy is loaded on first use, and reloaded whenever the
+    database has been changed by another connection (e.g. by ingestion).
+
+    :param db_file:    Path to SQLite database file.
+    :param refresh:    Whether to reload the copy even if the database is
+                       unchanged.
+    """
+    with _columnar_sales_lock:
+        if db_file in _columnar_sales:
+            conn, version, sales = _columnar_sales[db_file]
+        else:
+            conn, version, sales = sqlite3.connect(db_file, check_same_thread=False), None, None
+        (current,), = conn.execute('PRAGMA data_version').fetchall()
+        if sales is None or current != version or refresh:
+            sales = ColumnarSales(conn)
+        _columnar_sales[db_file] = conn, current, sales
+    return sales
@@ -0,0 +1,253 @@
+import csv
+import gzip
+import io
+import json
+import zlib
+from abc import ABC, abstractmethod
+from struct import Struct
+from typing import ClassVar, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+from flask import Response, jsonify
+from werkzeug.datastructures import MIMEAccept
+
+from . import app
+
+
+class ResultFormat(ABC):
+    """
+    A format that results of queries are serialized into. Formats other than
+    JSON records are serialized straight from the rows of the cursor, without
+    building a dict per row.
+    """
+
+    # Name of the format, as given by the `format` parameter
+    name: ClassVar[str]
+
+    # Media type of the format, as negotiated by the `Accept` header
+    mimetype: ClassVar[str]
+
+    # Whether the format serializes parsed results rather than rows
+    parsed: ClassVar[bool] = False
+
+    @abstractmethod
+    def stream(self, columns: Sequence[str], batches: Iterable[list]) -> Iterator[str | bytes]:
+        """Yields chunks of serialized results, one per batch of results."""
+
+    def dumps(self, columns: Sequence[str], results: list) -> bytes:
+        """Returns serialized results."""
+        return b''.join(chunk.encode() if isinstance(chunk, str) else chunk
+                        for chunk in self.stream(columns, [results]))
+
+    def response(self, columns: Sequence[str], results: list) -> Response:
+        """Returns a response of serialized results."""
+        return Response(self.dumps(columns, results), mimetype=self.mimetype)
+
+
+class JsonFormat(ResultFormat):
+    """A JSON array of objects, one per row, keyed by column names (the default)."""
+
+    name = 'json'
+    mimetype = 'application/json'
+    parsed = True
+
+    def stream(self, columns, batches):
+        separator = '['
+        for items in batches:
+            if items:
+                yield separator + ','.join(map(app.json.dumps, items))
+                separator = ','
+        yield ']' if separator == ',' else '[]'
+
+    def response(self, columns, results):
+        return jsonify(results)
+
+
+class ColumnarFormat(ResultFormat):
+    """
+    A JSON object with the list of column names once, and the list of rows as
+    arrays of values, e.g. `{"columns": ["year", "month"], "rows": [["2025", "01"]]}`.
+    """
+
+    name = 'columnar'
+    mimetype = 'application/vnd.columnar+json'
+
+    encoder = json.JSONEncoder(separators=(',', ':'))
+
+    def stream(self, columns, batches):
+        separator = ''
+        yield f'{{"columns":{self.encoder.encode(list(columns))},"rows":['
+        for rows in batches:
+            if rows:
+                # Encode rows at once, and strip the brackets of their list
+                yield separator + self.encoder.encode(rows)[1:-1]
+                separator = ','
+        yield ']}'
+
+
+class CsvFormat(ResultFormat):
+    """Comma-separated values (RFC 4180), with a header line of column names."""
+
+    name = 'csv'
+    mimetype = 'text/csv'
+
+    def stream(self, columns, batches):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        for rows in batches:
+            writer.writerows(rows)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+
+
+class BinaryFormat(ResultFormat):
+    """
+    A compact binary encoding of rows, with all integers little-endian:
+
+        * Header:   The magic `SQR1`, the number of columns as uint16, then each
+                    column name as a uint8 length followed by its UTF-8 bytes.
+
+        * Rows:     The values of each row in the order of columns, each as a
+                    type tag followed by its payload: `N` null, `i` int32, `q`
+                    int64, `d` float64, `s` a string of less than 256 bytes as
+                    a uint8 length followed by its UTF-8 bytes, `S` a longer
+                    string as a uint32 length followed by its UTF-8 bytes, `r`
+                    a string already sent as a uint16 reference to it.
+
+    Strings of less than 256 bytes are numbered from 0 in the order they are
+    first sent, up to 65536 of them, so that names and dates repeated across
+    rows are sent once. The number of rows is not encoded: rows go on until the
+    end of the body.
+    """
+
+    name = 'binary'
+    mimetype = 'application/vnd.rows+octet-stream'
+
+    MAGIC = b'SQR1'
+    _uint8, _uint16, _uint32 = Struct('<B'), Struct('<H'), Struct('<I')
+    _int32, _int64, _float64 = Struct('<i'), Struct('<q'), Struct('<d')
+
+    def stream(self, columns, batches):
+        header = bytearray(self.MAGIC + self._uint16.pack(len(columns)))
+        for column in columns:
+            name = column.encode()
+            header += self._uint8.pack(len(name)) + name
+        yield bytes(header)
+        strings: Dict[str, bytes] = {}
+        for rows in batches:
+            if rows:
+                yield self.encode_rows(rows, strings)
+
+    def encode_rows(self, rows: List[tuple], strings: Dict[str, bytes]) -> bytes:
+        """
+        Returns the encoding of rows, where `strings` maps the strings already
+        sent to their references, and is updated with those sent first.
+        """
+        out = bytearray()
+        int32, int64, float64 = self._int32.pack, self._int64.pack, self._float64.pack
+        uint8, uint16, uint32 = self._uint8.pack, self._uint16.pack, self._uint32.pack
+        for row in rows:
+            for value in row:
+                if value is None:
+                    out += b'N'
+                elif isinstance(value, str):
+                    reference = strings.get(value)
+                    if reference is not None:
+                        out += reference
+                        continue
+                    data = value.encode()
+                    if len(data) < 256:
+                        out += b's' + uint8(len(data)) + data
+                        if len(strings) < 65536:
+                            strings[value] = b'r' + uint16(len(strings))
+                    else:
+                        out += b'S' + uint32(len(data)) + data
+                elif isinstance(value, float):
+                    out += b'd' + float64(value)
+                elif isinstance(value, int):
+                    out += b'i' + int32(value) if -2 ** 31 <= value < 2 ** 31 else b'q' + int64(value)
+                else:
+                    raise TypeError(f'Cannot encode {type(value).__name__} value {value!r}')
+        return bytes(out)
+
+    @classmethod
+    def loads(cls, data: bytes) -> Tuple[List[str], List[tuple]]:
+        """Returns the column names and rows decoded from the encoding of results."""
+        if data[:4] != cls.MAGIC:
+            raise ValueError('Not binary rows')
+        (count,), offset = cls._uint16.unpack_from(data, 4), 6
+        columns = []
+        for _ in range(count):
+            length = data[offset]
+            columns.append(data[offset + 1:offset + 1 + length].decode())
+            offset += 1 + length
+        fixed = {b'i': cls._int32, b'q': cls._int64, b'd': cls._float64}
+        rows, row, strings = [], [], []
+        while offset < len(data):
+            tag, offset = data[offset:offset + 1], offset + 1
+            if tag == b'N':
+                row.append(None)
+            elif tag in fixed:
+                row.append(fixed[tag].unpack_from(data, offset)[0])
+                offset += fixed[tag].size
+            elif tag == b'r':
+                row.append(strings[cls._uint16.unpack_from(data, offset)[0]])
+                offset += cls._uint16.size
+            elif tag in (b's', b'S'):
+                size = cls._uint8 if tag == b's' else cls._uint32
+                (length,), offset = size.unpack_from(data, offset), offset + size.size
+                row.append(data[offset:offset + length].decode())
+                offset += length
+                if tag == b's' and len(strings) < 65536:
+                    strings.append(row[-1])
+            else:
+                raise ValueError(f'Unknown type tag {tag!r} at offset {offset - 1}')
+            if len(row) == count:
+                rows.append(tuple(row))
+                row = []
+        return columns, rows
+
+
+# Formats by name, the first one being the default
+FORMATS: Dict[str, ResultFormat] = {fmt.name: fmt for fmt in (JsonFormat(), ColumnarFormat(), CsvFormat(),
+                                                               BinaryFormat())}
+
+
+def result_format(name: str) -> ResultFormat:
+    """Returns the format of a name."""
+    try:
+        return FORMATS[name]
+    except KeyError:
+        raise ValueError(f'Format must be one of: {", ".join(FORMATS)}')
+
+
+def negotiate_format(accept: MIMEAccept) -> ResultFormat:
+    """Returns the format accepted best by a client, or JSON if none of them is."""
+    mimetypes = {fmt.mimetype: fmt for fmt in FORMATS.values()}
+    return mimetypes[accept.best_match(mimetypes, default=JsonFormat.mimetype)]
+
+
+def gzip_compress(data: bytes, level: int) -> bytes:
+    """Returns data compressed by gzip."""
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def gzip_stream(chunks: Iterable[str | bytes], level: int) -> Iterator[bytes]:
+    """
+    Yields chunks compressed by gzip as a single stream, each of them flushed
+    so that clients can decompress results as they arrive.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    try:
+        for chunk in chunks:
+            if chunk:
+                yield compressor.compress(chunk.encode() if isinstance(chunk, str) else chunk) + \
+                    compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
@@ -1,10 +1,17 @@
 import datetime
-from typing import Tuple
+import itertools
+import os
+from abc import abstractmethod
+from collections import defaultdict
+from typing import Tuple, Type, Dict, Any, List, ClassVar, Optional, Set
 
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import Index
+from sqlalchemy import Column, Date, Index, Integer, MetaData, Numeric, Table, and_, bindparam, delete, func, insert, \
+    literal, select, update
+from sqlalchemy.dialects.sqlite import insert as upsert
 
 from . import app
+from .sketches import SpaceSaving
 
 # Init db session wrapper
 db = SQLAlchemy(app)
@@ -17,25 +24,32 @@ class ModelUtils:
     """Convenient utilities for CRUD operations."""
 
     @classmethod
-    def new(cls, **kwargs) -> db.Model:
+    def new(cls, commit=True, **kwargs) -> db.Model:
         """
         Newly creates a model object.
 
+        :param commit:    Whether to commit the object immediately. If False,
+                          the object is only flushed and left to be committed
+                          by the caller's transaction.
         :param kwargs:    Required fields for creating the object.
         """
         obj = cls(**kwargs)
         db.session.add(obj)
-        db.session.commit()
+        if commit:
+            db.session.commit()
+        else:
+            db.session.flush()
         return obj
 
     @classmethod
-    def get_or_create(cls, defaults=None, **queries) -> Tuple[db.Model, bool]:
+    def get_or_create(cls, defaults=None, commit=True, **queries) -> Tuple[db.Model, bool]:
         """
         Looks up the object against the input queries, creates one if not existed,
         then returns the object.
 
         :param defaults:    A mapping of field-value pairs serves as supplement
                             info that is useful for creating the object.
+        :param commit:      Whether to commit the object if it is created.
         :param queries:     Keyword arguments (mandatory fields) required for
                             querying and creating the object.
         """
@@ -43,10 +57,61 @@ class ModelUtils:
         existed = obj is not None
         if not existed:
             defaults = defaults or {}
-            obj = cls.new(**queries, **defaults)
+            obj = cls.new(commit=commit, **queries, **defaults)
         return obj, not existed
 
 
+class RollupUtils:
+    """
+    Utilities for summary tables that are kept up to date incrementally by
+    ingestion. Every subclass is registered so that ingestion can maintain all
+    summary tables at once.
+    """
+
+    # Registered summary tables
+    rollups: ClassVar[List[Type['RollupUtils']]] = []
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Models have the metaclass of `db.Model`, which cannot be combined
+        # with `ABCMeta`, so abstract methods are enforced here instead.
+        def is_abstract(method) -> bool:
+            return getattr(method, '__isabstractmethod__', False)
+
+        missing = [name for name, method in vars(RollupUtils).items() if is_abstract(method)]
+        missing = [name for name in missing if is_abstract(getattr(cls, name))]
+        if missing:
+            raise TypeError(f'Summary table {cls.__name__} must implement {", ".join(missing)}')
+        RollupUtils.rollups.append(cls)
+
+    @classmethod
+    @abstractmethod
+    def accumulate(cls, sales: List[Dict[str, Any]]):
+        """
+        Adds a batch of newly inserted sale records to the summary table.
+
+        :param sales:    Field values of the sale records, as returned by
+                         `Sale.row_values()`, along with their `id`.
+        """
+
+    @classmethod
+    @abstractmethod
+    def rebuild(cls):
+        """Recomputes the whole summary table from the `sales` table."""
+
+    @classmethod
+    def accumulate_all(cls, sales: List[Dict[str, Any]]):
+        """Adds a batch of newly inserted sale records to all summary tables."""
+        for rollup in cls.rollups:
+            rollup.accumulate(sales)
+
+    @classmethod
+    def rebuild_all(cls):
+        """Recomputes all summary tables."""
+        for rollup in cls.rollups:
+            rollup.rebuild()
+
+
 class Product(db.Model, ModelUtils):
     """Contains all available products."""
 
@@ -110,16 +175,20 @@ class Sale(db.Model, ModelUtils):
     )
 
     @classmethod
-    def new(cls, date: datetime.date, product: Product, revenue: float, region: Region) -> 'Sale':
+    def new(cls, date: datetime.date, product: Product, revenue: float, region: Region, commit=True) -> 'Sale':
+        # Create the mainstream sale record and return, copies of sales in
+        # partitions are written along with summary tables
+        return super().new(commit=commit, **cls.row_values(date, product.id, region.id, revenue))
+
+    @staticmethod
+    def row_values(date: datetime.date, product_id: int, region_id: int, revenue: float) -> Dict[str, Any]:
+        """
+        Returns field values of a sale record, with all duplicated fields
+        populated from the input values.
+        """
         # Split date into year, month, and day.
         year, month, day = date.strftime('%Y-%m-%d').split('-')
-
-        # Insert a copy of sale record on a respective partitioned table.
-        partition = (BeforeCurrentYearSale, CurrentYearSale)[int(year) == CURRENT_YEAR]
-        partition.new(date=date, product_id=product.id, region_id=region.id, revenue=revenue)
-
-        # Create the mainstream sale record and return
-        return super().new(
+        return dict(
             date=date,
             indexed_date=date,
             year=year,
@@ -127,41 +196,519 @@ class Sale(db.Model, ModelUtils):
             day=day,
             indexed_year=year,
             indexed_month=month,
-            product_id=product.id,
-            region_id=region.id,
-            indexed_product_id=product.id,
-            indexed_region_id=region.id,
+            product_id=product_id,
+            region_id=region_id,
+            indexed_product_id=product_id,
+            indexed_region_id=region_id,
             revenue=revenue,
             indexed_revenue=revenue,
         )
 
 
-class PartitionedSale:
+class IngestCheckpoint(db.Model, ModelUtils):
     """
-    This pseudo class defines a schema for those which are partitioned tables,
-    and of which this class is superclass.
-
-    This methodology of partitioning is created for demo purpose only to solve
-    the limitation of SQLite when it doesn't support physical partitioning.
+    Keeps track of how far a CSV file has been ingested. The byte offset is
+    updated in the same transaction as each committed chunk of rows, so an
+    interrupted ingestion can resume right after the last committed chunk.
     """
+    __tablename__ = 'ingest_checkpoints'
+
     id = db.Column(db.Integer, primary_key=True)
-    date = db.Column(db.Date, nullable=False, index=True)
-    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False, index=True)
-    region_id = db.Column(db.Integer, db.ForeignKey('regions.id'), nullable=False, index=True)
+    source = db.Column(db.String(1024), nullable=False, unique=True)
+
+    # Identifies the version of the source file the checkpoint applies to
+    file_size = db.Column(db.Integer, nullable=False)
+    file_mtime = db.Column(db.Integer, nullable=False)
+
+    # Position right after the last committed row
+    offset = db.Column(db.Integer, nullable=False, default=0)
+    line = db.Column(db.Integer, nullable=False, default=0)
+
+    @property
+    def completed(self) -> bool:
+        return self.offset >= self.file_size
+
+    def matches(self, stat: os.stat_result) -> bool:
+        """Returns `True` if the checkpoint was made against the same file version."""
+        return self.file_size == stat.st_size and self.file_mtime == stat.st_mtime_ns
+
+    def reset(self, stat: os.stat_result):
+        """Rewinds the checkpoint to the beginning of the given file version."""
+        self.file_size = stat.st_size
+        self.file_mtime = stat.st_mtime_ns
+        self.offset = self.line = 0
+
+
+class MonthlyRevenue(db.Model, RollupUtils):
+    """
+    Summary table of revenue per month. It holds one row per month, so reading
+    monthly revenue costs time proportional to the number of months instead of
+    the number of sales.
+    """
+    __tablename__ = 'monthly_revenue'
+
+    year = db.Column(db.String(4), primary_key=True)
+    month = db.Column(db.String(2), primary_key=True)
     revenue = db.Column(db.Numeric(10, 2, asdecimal=False), nullable=False)
 
+    __table_args__ = {'sqlite_with_rowid': False}
 
-class BeforeCurrentYearSale(db.Model, PartitionedSale, ModelUtils):
+    @classmethod
+    def accumulate(cls, sales: List[Dict[str, Any]]):
+        # Sum up revenue per month within the batch first
+        totals = defaultdict(float)
+        for sale in sales:
+            totals[sale['year'], sale['month']] += sale['revenue']
+        if not totals:
+            return
+
+        # Add the sums to existing months or insert new months
+        stmt = upsert(cls.__table__)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[cls.year, cls.month],
+            set_={'revenue': cls.revenue + stmt.excluded.revenue},
+        )
+        db.session.execute(stmt, [
+            dict(year=year, month=month, revenue=revenue)
+            for (year, month), revenue in totals.items()
+        ])
+
+    @classmethod
+    def rebuild(cls):
+        db.session.execute(delete(cls))
+        db.session.execute(insert(cls).from_select(
+            [cls.year, cls.month, cls.revenue],
+            select(Sale.year, Sale.month, func.sum(Sale.revenue)).group_by(Sale.year, Sale.month),
+        ))
+
+
+class ProductRevenue(db.Model, RollupUtils):
     """
-    This table holds a partition of sales data made before the context of
-    CURRENT_YEAR.
+    Summary table of total revenue per product. Its index on total revenue lets
+    top products be read in order by an index range read, no matter how many
+    sales there are.
     """
-    __tablename__ = 'before_current_year_sales'
+    __tablename__ = 'product_revenue'
 
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), primary_key=True)
+    total_revenue = db.Column(db.Numeric(10, 2, asdecimal=False), nullable=False)
 
-class CurrentYearSale(db.Model, PartitionedSale, ModelUtils):
+    __table_args__ = (
+        # Index for total revenue by descending order
+        Index('idx_total_revenue_desc', total_revenue.desc()),
+    )
+
+    @classmethod
+    def accumulate(cls, sales: List[Dict[str, Any]]):
+        # Sum up revenue per product within the batch first
+        totals = defaultdict(float)
+        for sale in sales:
+            totals[sale['product_id']] += sale['revenue']
+        if not totals:
+            return
+
+        # Add the sums to existing products or insert new products
+        stmt = upsert(cls.__table__)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[cls.product_id],
+            set_={'total_revenue': cls.total_revenue + stmt.excluded.total_revenue},
+        )
+        db.session.execute(stmt, [
+            dict(product_id=product_id, total_revenue=revenue)
+            for product_id, revenue in totals.items()
+        ])
+
+    @classmethod
+    def rebuild(cls):
+        db.session.execute(delete(cls))
+        db.session.execute(insert(cls).from_select(
+            [cls.product_id, cls.total_revenue],
+            select(Sale.product_id, func.sum(Sale.revenue)).group_by(Sale.product_id),
+        ))
+
+
+class CumulativeRevenue(db.Model, RollupUtils):
     """
-    This table holds a partition of sales data made starting from the context of
-    CURRENT_YEAR.
+    Summary table of cumulative daily revenue, i.e. the revenue of all sales
+    made up to and including each date. It is kept for all sales, per product,
+    per region, and per product and region, a `product_id` or `region_id` of
+    `ALL` standing for all of them. A key only has rows for the dates it has
+    sales on, so its revenue up to any date is that of its latest row on or
+    before the date, and the revenue of any date range is the difference of
+    two such lookups no matter how wide the range is.
     """
-    __tablename__ = 'current_year_sales'
+    __tablename__ = 'cumulative_revenue'
+
+    # Id standing for all products or all regions
+    ALL: ClassVar[int] = 0
+
+    product_id = db.Column(db.Integer, primary_key=True)
+    region_id = db.Column(db.Integer, primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+    revenue = db.Column(db.Float, nullable=False)
+
+    __table_args__ = {'sqlite_with_rowid': False}
+
+    @classmethod
+    def accumulate(cls, sales: List[Dict[str, Any]]):
+        # Sum up revenue per key and date within the batch first
+        totals = defaultdict(lambda: defaultdict(float))
+        for sale in sales:
+            for key in itertools.product((sale['product_id'], cls.ALL), (sale['region_id'], cls.ALL)):
+                totals[key][sale['date']] += sale['revenue']
+        if not totals:
+            return
+
+        # The revenue of the batch up to each of its dates is added to the rows
+        # of its key from that date until the next one, so that every row is
+        # updated once. Rows after the dates of the batch are updated too,
+        # which costs little as long as sales are ingested in date order.
+        records = []
+        for (product_id, region_id), days in totals.items():
+            dates, revenue = sorted(days), 0.0
+            for day, next_day in zip(dates, [*dates[1:], datetime.date.max]):
+                revenue += days[day]
+                records.append(dict(
+                    key_product_id=product_id, key_region_id=region_id, key_date=day, key_next_date=next_day,
+                    key_revenue=revenue,
+                ))
+
+        table = cls.__table__
+        key = and_(table.c.product_id == bindparam('key_product_id'), table.c.region_id == bindparam('key_region_id'))
+        key_date = bindparam('key_date', type_=Date)
+
+        # Insert dates new to their keys with the revenue of their keys so far
+        previous = select(table.c.revenue).where(key, table.c.date < key_date) \
+            .order_by(table.c.date.desc()).limit(1).scalar_subquery()
+        stmt = upsert(table).values(
+            product_id=bindparam('key_product_id'),
+            region_id=bindparam('key_region_id'),
+            date=key_date,
+            revenue=func.coalesce(previous, 0),
+        )
+        db.session.execute(stmt.on_conflict_do_nothing(), records)
+
+        db.session.execute(
+            update(table)
+            .where(key, table.c.date >= key_date, table.c.date < bindparam('key_next_date', type_=Date))
+            .values(revenue=table.c.revenue + bindparam('key_revenue')),
+            records,
+        )
+
+    @classmethod
+    def rebuild(cls):
+        db.session.execute(delete(cls))
+        # Daily revenue of each key, summed up over its dates in order
+        for by_product, by_region in itertools.product((True, False), repeat=2):
+            keys = [column for column, by in ((Sale.product_id, by_product), (Sale.region_id, by_region)) if by]
+            db.session.execute(insert(cls).from_select(
+                [cls.product_id, cls.region_id, cls.date, cls.revenue],
+                select(
+                    Sale.product_id if by_product else literal(cls.ALL),
+                    Sale.region_id if by_region else literal(cls.ALL),
+                    Sale.date,
+                    func.sum(func.sum(Sale.revenue)).over(partition_by=keys or None, order_by=Sale.date),
+                ).group_by(*keys, Sale.date),
+            ))
+
+
+class RevenueCube(db.Model, RollupUtils):
+    """
+    Summary table of revenue per month, product and region, i.e. the cells of
+    a cube whose dimensions are months, products and regions. Revenue grouped
+    by any subset of the dimensions is rolled up from the cells, which are far
+    fewer than sales. Cells are kept in the order of months, products then
+    regions, and indexed in the order of products, regions then months, and
+    of regions, months then products, so that cells of any subset of the
+    dimensions are read in group order (and slices of a product or region
+    are read alone) without sorting them.
+    """
+    __tablename__ = 'revenue_cube'
+
+    year = db.Column(db.String(4), primary_key=True)
+    month = db.Column(db.String(2), primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), primary_key=True)
+    region_id = db.Column(db.Integer, db.ForeignKey('regions.id'), primary_key=True)
+    revenue = db.Column(db.Numeric(10, 2, asdecimal=False), nullable=False)
+
+    __table_args__ = (
+        # Covering indexes of cells in other orders of dimensions
+        Index('idx_revenue_cube_product', product_id, region_id, year, month, revenue),
+        Index('idx_revenue_cube_region', region_id, year, month, product_id, revenue),
+        {'sqlite_with_rowid': False},
+    )
+
+    @classmethod
+    def accumulate(cls, sales: List[Dict[str, Any]]):
+        # Sum up revenue per cell within the batch first
+        totals = defaultdict(float)
+        for sale in sales:
+            totals[sale['year'], sale['month'], sale['product_id'], sale['region_id']] += sale['revenue']
+        if not totals:
+            return
+
+        # Add the sums to existing cells or insert new cells
+        stmt = upsert(cls.__table__)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[cls.year, cls.month, cls.product_id, cls.region_id],
+            set_={'revenue': cls.revenue + stmt.excluded.revenue},
+        )
+        db.session.execute(stmt, [
+            dict(year=year, month=month, product_id=product_id, region_id=region_id, revenue=revenue)
+            for (year, month, product_id, region_id), revenue in totals.items()
+        ])
+
+    @classmethod
+    def rebuild(cls):
+        db.session.execute(delete(cls))
+        db.session.execute(insert(cls).from_select(
+            [cls.year, cls.month, cls.product_id, cls.region_id, cls.revenue],
+            select(Sale.year, Sale.month, Sale.product_id, Sale.region_id, func.sum(Sale.revenue))
+            .group_by(Sale.year, Sale.month, Sale.product_id, Sale.region_id),
+        ))
+
+
+class ProductSketch(db.Model, RollupUtils):
+    """
+    SpaceSaving sketches of top products by revenue, one for each day, month
+    and year that sales are made in (e.g. `2024-03-15`, `2024-03` and `2024`).
+    Each sketch keeps the revenue of at most `PRODUCT_SKETCH_CAPACITY`
+    products along with its error, however many products are sold. Sketches
+    are mergeable, so top products of any date range are approximated by
+    merging the fewest sketches whose periods cover the range (see
+    `periods()`), without reading sales.
+
+    Each sketch also has a row of `ALL` products, holding the total revenue of
+    the period and the upper bound of the revenue of any product it does not
+    keep.
+    """
+    __tablename__ = 'product_sketches'
+
+    # Product id of the row of all products of a sketch
+    ALL: ClassVar[int] = 0
+
+    period = db.Column(db.String(10), primary_key=True)
+    product_id = db.Column(db.Integer, primary_key=True)
+    revenue = db.Column(db.Float, nullable=False)
+    error = db.Column(db.Float, nullable=False)
+
+    __table_args__ = {'sqlite_with_rowid': False}
+
+    @staticmethod
+    def periods(start: datetime.date, end: datetime.date) -> List[str]:
+        """Returns the fewest periods of sketches (years, months and days) covering the dates from start to end."""
+        periods, date = [], start
+        while date <= end:
+            next_month = (date.replace(day=1) + datetime.timedelta(days=31)).replace(day=1)
+            if date.month == 1 and date.day == 1 and date.replace(month=12, day=31) <= end:
+                periods.append(f'{date:%Y}')
+                date = date.replace(year=date.year + 1)
+            elif date.day == 1 and next_month - datetime.timedelta(days=1) <= end:
+                periods.append(f'{date:%Y-%m}')
+                date = next_month
+            else:
+                periods.append(date.isoformat())
+                date += datetime.timedelta(days=1)
+        return periods
+
+    @classmethod
+    def load(cls, periods: List[str]) -> Dict[str, SpaceSaving]:
+        """Returns the sketches of periods, empty ones for periods without sketches."""
+        counters, totals = defaultdict(dict), {}
+        rows = db.session.execute(select(cls.period, cls.product_id, cls.revenue, cls.error)
+                                  .where(cls.period.in_(periods))).all()
+        for period, product_id, revenue, error in rows:
+            if product_id == cls.ALL:
+                totals[period] = revenue, error
+            else:
+                counters[period][product_id] = revenue, error
+        capacity = app.config['PRODUCT_SKETCH_CAPACITY']
+        sketches = {}
+        for period in periods:
+            total, floor = totals.get(period, (0.0, 0.0))
+            sketches[period] = SpaceSaving(capacity, counters[period], floor, total)
+        return sketches
+
+    @classmethod
+    def save(cls, sketches: Dict[str, SpaceSaving]):
+        """Replaces the stored sketches of periods."""
+        db.session.execute(delete(cls).where(cls.period.in_(list(sketches))))
+        db.session.execute(insert(cls), [
+            dict(period=period, product_id=product_id, revenue=revenue, error=error)
+            for period, sketch in sketches.items()
+            for product_id, revenue, error in [(cls.ALL, sketch.total, sketch.floor), *sketch.top()]
+        ])
+
+    @classmethod
+    def accumulate(cls, sales: List[Dict[str, Any]]):
+        # Sum up revenue per period and product within the batch first
+        totals = defaultdict(lambda: defaultdict(float))
+        for sale in sales:
+            for period in (sale['year'], f'{sale["year"]}-{sale["month"]}', sale['date'].isoformat()):
+                totals[period][sale['product_id']] += sale['revenue']
+        if not totals:
+            return
+
+        # Stream the sums into the sketches of their periods, heaviest first
+        sketches = cls.load(list(totals))
+        for period, products in totals.items():
+            sketch = sketches[period]
+            for product_id, revenue in sorted(products.items(), key=lambda item: (-item[1], item[0])):
+                sketch.update(product_id, revenue)
+        cls.save(sketches)
+
+    @classmethod
+    def rebuild(cls):
+        # Sketches of exact revenue per product of each period
+        db.session.execute(delete(cls))
+        capacity = app.config['PRODUCT_SKETCH_CAPACITY']
+        levels = [
+            Sale.year,
+            Sale.year + '-' + Sale.month,
+            func.strftime('%Y-%m-%d', Sale.date),
+        ]
+        for period in levels:
+            totals = defaultdict(dict)
+            rows = db.session.execute(
+                select(period, Sale.product_id, func.sum(Sale.revenue)).group_by(period, Sale.product_id)
+            ).all()
+            for key, product_id, revenue in rows:
+                totals[key][product_id] = revenue
+            if totals:
+                cls.save({key: SpaceSaving.from_totals(capacity, products) for key, products in totals.items()})
+
+
+class SalePartition(db.Model):
+    """
+    Registry of the tables that partition sales by period, either by year
+    (e.g. `sales_2024`) or by month (e.g. `sales_2024_03`) as configured by
+    `SALES_PARTITION_PERIOD`. A partition table is created by ingestion the
+    first time a sale of its period is written, so no table has to be split
+    or rebuilt when a new period starts. Partitions hold copies of sales with
+    the same ids as in `sales`, and queries read only the partitions whose
+    periods overlap their date range.
+
+    Partitions are not summary tables, but they are maintained by ingestion
+    the same way, through `accumulate()` and `rebuild()`. Indexes built on
+    partitions afterwards (e.g. by `index_advisor.py`) are built on partitions
+    created later too.
+
+    This methodology of partitioning is created for demo purpose only to solve
+    the limitation of SQLite when it doesn't support physical partitioning.
+    """
+    __tablename__ = 'sale_partitions'
+
+    name = db.Column(db.String(32), primary_key=True)
+    start_date = db.Column(db.Date, nullable=False, unique=True)
+    end_date = db.Column(db.Date, nullable=False)
+    rows = db.Column(db.Integer, nullable=False, default=0)
+
+    # Schemas of partition tables, which are created on demand rather than by
+    # `db.create_all()`
+    partition_metadata = MetaData()
+
+    @staticmethod
+    def period(date: datetime.date) -> Tuple[str, datetime.date, datetime.date]:
+        """Returns the name, first and last dates of the partition of a sale made on `date`."""
+        if app.config['SALES_PARTITION_PERIOD'] == 'month':
+            start = date.replace(day=1)
+            end = (start + datetime.timedelta(days=31)).replace(day=1) - datetime.timedelta(days=1)
+            return f'sales_{start:%Y_%m}', start, end
+        start = date.replace(month=1, day=1)
+        return f'sales_{start:%Y}', start, start.replace(month=12, day=31)
+
+    @classmethod
+    def table(cls, name: str) -> Table:
+        """Returns the schema of a partition table, which holds the original fields of sales."""
+        if name not in cls.partition_metadata.tables:
+            Table(
+                name, cls.partition_metadata,
+                Column('id', Integer, primary_key=True),
+                Column('date', Date, nullable=False, index=True),
+                Column('product_id', Integer, nullable=False, index=True),
+                Column('region_id', Integer, nullable=False, index=True),
+                Column('revenue', Numeric(10, 2, asdecimal=False), nullable=False),
+            )
+        return cls.partition_metadata.tables[name]
+
+    @classmethod
+    def index_columns(cls) -> Set[Tuple[str, ...]]:
+        """Returns the columns of every index of the registered partitions."""
+        conn = db.session.connection()
+        indexes = conn.exec_driver_sql(
+            f"SELECT m.name FROM sqlite_master m JOIN {cls.__tablename__} p ON m.tbl_name = p.name "
+            f"WHERE m.type = 'index' AND m.sql IS NOT NULL"
+        ).scalars().all()
+        columns = set()
+        for index in indexes:
+            names = tuple(conn.exec_driver_sql(
+                'SELECT name FROM pragma_index_info(?) ORDER BY seqno', (index,)
+            ).scalars().all())
+            if names and all(names):  # indexes of expressions are not copied
+                columns.add(names)
+        return columns
+
+    @classmethod
+    def register(cls, name: str, start: datetime.date, end: datetime.date, rows: int,
+                 indexes: Optional[Set[Tuple[str, ...]]] = None):
+        """
+        Creates a partition table if not existed, with the same indexes as
+        other partitions unless `indexes` (as columns) are given, and adds
+        `rows` to its registered size.
+        """
+        if db.session.execute(select(cls.name).where(cls.name == name)).first() is None:
+            indexes = cls.index_columns() if indexes is None else indexes
+            cls.table(name).create(db.session.connection(), checkfirst=True)
+            for columns in sorted(indexes):
+                db.session.connection().exec_driver_sql(
+                    f'CREATE INDEX IF NOT EXISTS ix_{name}_{"_".join(columns)} ON {name} ({", ".join(columns)})'
+                )
+        stmt = upsert(cls.__table__).values(name=name, start_date=start, end_date=end, rows=rows)
+        stmt = stmt.on_conflict_do_update(index_elements=[cls.name], set_={'rows': cls.rows + stmt.excluded.rows})
+        db.session.execute(stmt)
+
+    @classmethod
+    def accumulate(cls, sales: List[Dict[str, Any]]):
+        """
+        Copies a batch of newly inserted sale records into their partitions.
+
+        :param sales:    Field values of the sale records, as returned by
+                         `Sale.row_values()`, along with their `id`.
+        """
+        # Group copies of sales by partition
+        partitions = defaultdict(list)
+        for sale in sales:
+            partitions[cls.period(sale['date'])].append({
+                column: sale[column] for column in ('id', 'date', 'product_id', 'region_id', 'revenue')
+            })
+
+        for (name, start, end), records in partitions.items():
+            cls.register(name, start, end, len(records))
+            db.session.execute(insert(cls.table(name)), records)
+
+    @classmethod
+    def rebuild(cls):
+        """Drops all partitions, and copies the `sales` table into new ones with the same indexes."""
+        # Drop all partitions
+        indexes = cls.index_columns()
+        for name in db.session.execute(select(cls.name)).scalars().all():
+            cls.table(name).drop(db.session.connection(), checkfirst=True)
+        db.session.execute(delete(cls))
+
+        # Copy sales period by period
+        first, last = db.session.execute(select(func.min(Sale.indexed_date), func.max(Sale.indexed_date))).one()
+        while first is not None and first <= last:
+            name, start, end = cls.period(first)
+            cls.register(name, start, end, 0, indexes)
+            table = cls.table(name)
+            result = db.session.execute(insert(table).from_select(
+                [table.c.id, table.c.date, table.c.product_id, table.c.region_id, table.c.revenue],
+                select(Sale.id, Sale.date, Sale.product_id, Sale.region_id, Sale.revenue)
+                .where(Sale.indexed_date.between(start, end)),
+            ))
+            if result.rowcount:
+                db.session.execute(cls.__table__.update().where(cls.name == name).values(rows=result.rowcount))
+            else:
+                table.drop(db.session.connection())
+                db.session.execute(delete(cls).where(cls.name == name))
+            first = end + datetime.timedelta(days=1)
@@ -0,0 +1,72 @@
+import heapq
+from typing import Dict, Hashable, List, Tuple
+
+
+class SpaceSaving:
+    """
+    SpaceSaving sketch of the heaviest items of a stream of weighted items
+    (Metwally et al., "Efficient Computation of Frequent and Top-k Elements in
+    Data Streams"), which keeps counters of at most `capacity` items whatever
+    the number of distinct items in the stream.
+
+    Each kept item has a `count` and an `error`: its total weight in the stream
+    lies between `count - error` and `count`. Items not kept weigh at most
+    `floor` in total. An item that is not kept takes the counter of the item
+    with the lowest count, so no error exceeds `total / capacity` and every
+    item weighing more than that is kept.
+    """
+
+    def __init__(self, capacity: int, counters: Dict[Hashable, Tuple[float, float]] = None, floor: float = 0.0,
+                 total: float = 0.0):
+        """
+        :param capacity:    Maximum number of items kept.
+        :param counters:    `(count, error)` of items already kept.
+        :param floor:       Upper bound of the weight of any item not kept.
+        :param total:       Total weight of the stream so far.
+        """
+        if capacity < 1:
+            raise ValueError('Capacity of sketch must be at least 1')
+        self.capacity = capacity
+        self.counters: Dict[Hashable, List[float]] = {item: list(counter) for item, counter in (counters or {}).items()}
+        self.floor = floor
+        self.total = total
+
+        # Heap of `(count, item)` to find the item of the lowest count, whose
+        # entries are left behind when counts change and skipped once popped
+        self._heap = [(count, item) for item, (count, _) in self.counters.items()]
+        heapq.heapify(self._heap)
+
+    @classmethod
+    def from_totals(cls, capacity: int, totals: Dict[Hashable, float]) -> 'SpaceSaving':
+        """Returns the sketch of exact totals of items, which keeps the heaviest ones without error."""
+        ranked = sorted(totals.items(), key=lambda item: (-item[1], item[0]))
+        floor = ranked[capacity][1] if len(ranked) > capacity else 0.0
+        return cls(capacity, {item: (total, 0.0) for item, total in ranked[:capacity]}, floor, sum(totals.values()))
+
+    def update(self, item: Hashable, weight: float):
+        """Adds the weight of an item to the sketch."""
+        self.total += weight
+        counter = self.counters.get(item)
+        if counter is None:
+            if len(self.counters) >= self.capacity:
+                self.floor = self._evict()
+            counter = self.counters[item] = [self.floor, self.floor]
+        counter[0] += weight
+        heapq.heappush(self._heap, (counter[0], item))
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(count, item) for item, (count, _) in self.counters.items()]
+            heapq.heapify(self._heap)
+
+    def _evict(self) -> float:
+        """Drops the item of the lowest count and returns its count."""
+        while True:
+            count, item = heapq.heappop(self._heap)
+            counter = self.counters.get(item)
+            if counter is not None and counter[0] == count:
+                del self.counters[item]
+                return count
+
+    def top(self, limit: int = None) -> List[Tuple[Hashable, float, float]]:
+        """Returns `(item, count, error)` of kept items by descending count."""
+        ranked = sorted(self.counters.items(), key=lambda item: (-item[1][0], item[0]))
+        return [(item, count, error) for item, (count, error) in ranked[:limit]]
@@ -1,10 +1,130 @@
+import asyncio
+import contextvars
 import datetime
+import os
 import sqlite3
-from contextlib import closing
-from functools import wraps
-from typing import Optional, Tuple, List, Any, Callable
+import statistics
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, contextmanager
+from functools import partial, wraps
+from typing import Optional, Tuple, List, Any, Callable, Dict, Iterator, Iterable, AsyncIterator
 
 from flask import request, abort
+from werkzeug.exceptions import ServiceUnavailable
+
+
+class SQLitePool:
+    """
+    A thread-safe pool of persistent SQLite connections. Connections are opened
+    lazily up to `size`, configured once with the given pragmas, and handed out
+    in LIFO order so that the most recently used connection (the one with the
+    warmest page cache) is reused first.
+
+    The pool is bound to the process that created its connections. After a
+    fork (e.g. uwsgi workers), connections inherited from the parent are
+    dropped and new ones are opened in the child process.
+    """
+
+    def __init__(self, db_file: str, size: int = 4, timeout: Optional[float] = None,
+                 pragmas: Optional[Dict[str, Any]] = None, **connect_kwargs):
+        """
+        :param db_file:           Path to SQLite database file.
+        :param size:              Maximum number of connections in the pool.
+        :param timeout:           How long (in seconds) to wait for a free
+                                  connection. Waits forever if None.
+        :param pragmas:           Pragmas applied in order to every new
+                                  connection, e.g. `{'query_only': 1}`.
+        :param connect_kwargs:    Extra arguments for `sqlite3.connect()`.
+        """
+        if size < 1:
+            raise ValueError('Pool size must be an integer >= 1')
+        self.db_file = db_file
+        self.size = size
+        self.timeout = timeout
+        self.pragmas = dict(pragmas or {})
+        self.connect_kwargs = connect_kwargs
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        """Forgets all connections and statistics of the pool."""
+        self._pid = os.getpid()
+        self._idle: List[sqlite3.Connection] = []
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._stats = Counter()
+
+    def connect(self) -> sqlite3.Connection:
+        """Opens a new connection with pragmas applied."""
+        conn = sqlite3.connect(self.db_file, check_same_thread=False, **self.connect_kwargs)
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}').fetchall()
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        """Takes a connection from the pool, opens one if none is idle."""
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            slots = self._slots
+
+        # Wait for a free slot
+        started = time.perf_counter()
+        if not slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._stats['timeouts'] += 1
+            raise TimeoutError(f'No SQLite connection available after {self.timeout}s')
+        waited = time.perf_counter() - started
+
+        with self._lock:
+            self._stats['acquired'] += 1
+            self._stats['wait_time'] += waited
+            if self._idle:
+                self._stats['reused'] += 1
+                return self._idle.pop()
+            self._stats['opened'] += 1
+
+        try:
+            return self.connect()
+        except Exception:
+            slots.release()
+            raise
+
+    def release(self, conn: sqlite3.Connection):
+        """Returns a connection taken by `acquire()` back to the pool."""
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            if self._pid != os.getpid():
+                return  # connection of a stale pool
+            self._idle.append(conn)
+            self._stats['released'] += 1
+            self._slots.release()
+
+    def close(self):
+        """Closes all idle connections."""
+        with self._lock:
+            while self._idle:
+                self._idle.pop().close()
+                self._stats['opened'] -= 1
+
+    def stats(self) -> Dict[str, int | float]:
+        """Returns statistics of the pool."""
+        with self._lock:
+            stats = {
+                'size': self.size,
+                'open': self._stats['opened'],
+                'idle': len(self._idle),
+                'in_use': self._stats['acquired'] - self._stats['released'],
+                'acquired': self._stats['acquired'],
+                'reused': self._stats['reused'],
+                'timeouts': self._stats['timeouts'],
+                'wait_time': round(self._stats['wait_time'], 6),
+            }
+        return stats
 
 
 class SQLite:
@@ -18,8 +138,14 @@ class SQLite:
         except (ValueError, TypeError):
             raise ValueError(f'Value {value!r} is not a valid date string')
 
-    def __init__(self, db_file: str):
+    def __init__(self, db_file: str, pool: Optional[SQLitePool] = None):
+        """
+        :param db_file:    Path to SQLite database file.
+        :param pool:       Pool to borrow connections from. If not set, a new
+                           connection is opened on every use.
+        """
         self.db_file: str = db_file
+        self.pool = pool
         self._conn: Optional[sqlite3.Connection] = None
 
     def fetchall(self, sql: str, *args, **kwargs) -> List[Tuple[Any, ...]]:
@@ -31,15 +157,515 @@ class SQLite:
             cursor.execute(sql, *args, **kwargs)
             return cursor.fetchall()
 
+    def iterate(self, sql: str, *args, size: int = 1000, **kwargs) -> Iterator[List[Tuple[Any, ...]]]:
+        """
+        Executes the input SQL statement and lazily yields rows fetched from
+        the resultset in batches of `size` rows.
+        """
+        assert self._conn is not None, 'No connection'
+        with closing(self._conn.cursor()) as cursor:
+            cursor.execute(sql, *args, **kwargs)
+            while rows := cursor.fetchmany(size):
+                yield rows
+
     def __enter__(self):
-        self._conn = sqlite3.connect(self.db_file)
+        if self.pool is not None:
+            self._conn = self.pool.acquire()
+        else:
+            self._conn = sqlite3.connect(self.db_file)
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self._conn.close()
+        if self.pool is not None:
+            self.pool.release(self._conn)
+        else:
+            self._conn.close()
         self._conn = None
 
 
+class DataVersion:
+    """
+    A counter of data changes shared by all processes on the host through a
+    small file. Ingestion bumps it whenever it commits new data, so that
+    anything derived from an older version (e.g. cached results) can be told
+    stale at once. Reading it costs a `stat()` call as long as the file is
+    unchanged, and never touches the database.
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path:    Path to the file holding the counter.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._stat: Optional[Tuple[int, int]] = None
+        self._value = 0
+
+    def get(self) -> int:
+        """Returns the current version, which is 0 if never bumped."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return 0
+        key = (stat.st_ino, stat.st_mtime_ns)
+        with self._lock:
+            if key != self._stat:
+                with open(self.path) as fp:
+                    self._value = int(fp.read().strip() or 0)
+                self._stat = key
+            return self._value
+
+    def bump(self) -> int:
+        """Increments the version and returns the new one."""
+        version = self.get() + 1
+        # Replace the file atomically so readers never see a partial write
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as fp:
+            fp.write(str(version))
+        os.replace(tmp_path, self.path)
+        return version
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key: the first caller executes the
+    function while the others arriving before it finishes wait for its result
+    (or exception) instead of executing the function themselves.
+    """
+
+    class _Call:
+        """An in-flight execution shared by callers of the same key."""
+
+        def __init__(self):
+            self.done = threading.Event()
+            self.result: Any = None
+            self.error: Optional[BaseException] = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, SingleFlight._Call] = {}
+        self._stats = Counter()
+
+    def do(self, key: str, func: Callable[[], Any]) -> Any:
+        """
+        Executes `func` and returns its result, unless an execution for the
+        same key is already in flight, in which case its result is returned.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+            self._stats['executions' if leader else 'coalesced'] += 1
+
+        # Wait for the leader to finish
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        # Execute as the leader and share the outcome
+        try:
+            call.result = func()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns the number of executions, and the number of calls coalesced
+        into them (i.e. executions saved).
+        """
+        with self._lock:
+            return {
+                'executions': self._stats['executions'],
+                'coalesced': self._stats['coalesced'],
+                'in_flight': len(self._calls),
+            }
+
+
+class BoundedExecutor:
+    """
+    A pool of threads that coroutines offload blocking work to (e.g. SQLite
+    queries), so that the event loop keeps serving other requests meanwhile.
+    It is bounded both in threads and in calls waiting for one: calls beyond
+    `max_pending` are rejected with `503 Service Unavailable` right away
+    rather than queued for longer than clients would wait. Calls run in a copy
+    of the caller's context, so that they see its Flask request context.
+    """
+
+    def __init__(self, workers: int = 4, max_pending: int = 64, name: str = 'query'):
+        """
+        :param workers:        Number of threads.
+        :param max_pending:    Number of calls that may wait for a thread.
+        :param name:           Prefix of the names of threads.
+        """
+        self.workers = workers
+        self.max_pending = max_pending
+        self.name = name
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pid: Optional[int] = None
+        self._stats = Counter()
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        """Threads of the current process, which are started on demand."""
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix=self.name)
+                self._pid = os.getpid()
+                self._stats = Counter()
+            return self._executor
+
+    async def run(self, func: Callable, *args) -> Any:
+        """Calls `func(*args)` on a thread and returns its result."""
+        executor = self.executor
+        with self._lock:
+            if self._stats['in_flight'] >= self.workers + self.max_pending:
+                self._stats['rejected'] += 1
+                raise ServiceUnavailable('Too many queries waiting for the database', retry_after=1)
+            self._stats['in_flight'] += 1
+        try:
+            context = contextvars.copy_context()
+            return await asyncio.get_running_loop().run_in_executor(executor, partial(context.run, func, *args))
+        finally:
+            with self._lock:
+                self._stats['in_flight'] -= 1
+                self._stats['completed'] += 1
+
+    async def iterate(self, iterable: Iterable) -> AsyncIterator:
+        """
+        Yields the items of a blocking iterable (e.g. a streamed response), each
+        of them fetched on a thread. Items are fetched within the same context,
+        and are not bounded by `max_pending` since they are part of a call
+        already admitted.
+        """
+        context, iterator, done = contextvars.copy_context(), iter(iterable), object()
+        loop = asyncio.get_running_loop()
+        try:
+            while (item := await loop.run_in_executor(self.executor, context.run, next, iterator, done)) is not done:
+                yield item
+        finally:
+            close = getattr(iterable, 'close', None)
+            if close is not None:
+                await loop.run_in_executor(self.executor, context.run, close)
+
+    def stats(self) -> Dict[str, int]:
+        """Returns statistics of the executor."""
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'max_pending': self.max_pending,
+                'in_flight': self._stats['in_flight'],
+                'completed': self._stats['completed'],
+                'rejected': self._stats['rejected'],
+            }
+
+    def shutdown(self):
+        """Waits for running calls and stops the threads."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+
+class TableStatistics:
+    """
+    Sizes of tables and selectivity of indexes, as read from the `sqlite_stat1`
+    table that is written by `ANALYZE`. Tables that have not been analyzed are
+    sized by their largest rowid instead, which costs an index seek.
+    """
+
+    def __init__(self, db: 'SQLite', tables: List[str]):
+        """
+        :param db:        Connected SQLite wrapper to read statistics from.
+        :param tables:    Tables whose sizes are needed.
+        """
+        self.rows: Dict[str, int] = {}
+        self.rows_per_key: Dict[str, int] = {}
+        if db.fetchall("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'"):
+            for table, index, stat in db.fetchall('SELECT tbl, idx, stat FROM sqlite_stat1'):
+                # Statistics are the number of rows, followed by the average
+                # number of rows per distinct value of each indexed column
+                values = [int(value) for value in str(stat).split() if value.isdigit()]
+                if values:
+                    self.rows[table] = values[0]
+                if index and len(values) > 1:
+                    self.rows_per_key[index] = values[1]
+        for table in tables:
+            if table not in self.rows:
+                (rows,), = db.fetchall(f'SELECT MAX(rowid) FROM {table}')
+                self.rows[table] = rows or 0
+
+    def selectivity(self, table: str, index: str) -> Optional[float]:
+        """
+        Returns the estimated fraction of rows of a table matching one value of
+        the first column of an index, or None if the index is not analyzed.
+        """
+        if index in self.rows_per_key and self.rows.get(table):
+            return self.rows_per_key[index] / self.rows[table]
+        return None
+
+
+class LatencyTracker:
+    """
+    Thread-safe exponentially weighted moving averages of latencies observed
+    per key, which favor recent observations so that they follow changes of
+    data and load.
+    """
+
+    def __init__(self, alpha: float = 0.2):
+        """
+        :param alpha:    Weight of every new observation in the average.
+        """
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self._latencies: Dict[Any, Tuple[int, float]] = {}
+
+    def observe(self, key: Any, elapsed: float):
+        """Records a latency of `elapsed` milliseconds under a key."""
+        with self._lock:
+            count, average = self._latencies.get(key, (0, elapsed))
+            self._latencies[key] = count + 1, average + self.alpha * (elapsed - average)
+
+    def get(self, key: Any) -> Tuple[int, Optional[float]]:
+        """Returns the number of observations of a key and their average."""
+        with self._lock:
+            return self._latencies.get(key, (0, None))
+
+    def clear(self):
+        """Forgets all observations."""
+        with self._lock:
+            self._latencies.clear()
+
+
+class Workload:
+    """
+    Thread-safe record of the statement shapes executed, keyed by their SQL
+    text, since values are bound rather than embedded. Each shape keeps how
+    many times and how long it was executed, the arguments of its latest
+    execution, and the indexes that may speed it up, so that indexes can be
+    evaluated against the workload actually served (see `index_advisor.py`).
+    """
+
+    def __init__(self, size: int = 1000):
+        """
+        :param size:    Maximum number of shapes recorded. Executions of new
+                        shapes beyond it are only counted as dropped.
+        """
+        self.size = size
+        self._lock = threading.Lock()
+        self._shapes: Dict[str, Dict[str, Any]] = {}
+        self._dropped = 0
+
+    def record(self, statement: str, args: Dict[str, Any], elapsed: float,
+               candidates: Optional[Callable[[], List[Tuple[str, Tuple[str, ...]]]]] = None, **labels):
+        """
+        Records an execution of a statement taking `elapsed` milliseconds,
+        along with labels of its origin (e.g. controller and profile). The
+        candidate indexes of the statement as `(table, columns)` are only
+        asked for the first time the statement is recorded.
+        """
+        with self._lock:
+            shape = self._shapes.get(statement)
+            if shape is None:
+                if len(self._shapes) >= self.size:
+                    self._dropped += 1
+                    return
+                shape = self._shapes[statement] = {
+                    **labels, 'statement': statement, 'count': 0, 'total': 0.0,
+                    'candidates': [[table, list(columns)] for table, columns in (candidates() if candidates else [])],
+                }
+            shape['count'] += 1
+            shape['total'] += elapsed
+            shape['args'] = args.copy()
+
+    def shapes(self) -> List[Dict[str, Any]]:
+        """Returns the recorded shapes, the most time consuming first."""
+        with self._lock:
+            shapes = [{**shape, 'total': round(shape['total'], 3)} for shape in self._shapes.values()]
+        return sorted(shapes, key=lambda shape: shape['total'], reverse=True)
+
+    def stats(self) -> Dict[str, int]:
+        """Returns the number of shapes recorded and executions dropped."""
+        with self._lock:
+            return {'shapes': len(self._shapes), 'dropped': self._dropped}
+
+    def clear(self):
+        """Forgets all recorded shapes."""
+        with self._lock:
+            self._shapes.clear()
+            self._dropped = 0
+
+
+class PhaseTimer:
+    """
+    Records how long each phase of a unit of work (e.g. a request) takes, in
+    milliseconds and in order of first occurrence. A phase is either timed as
+    a block by `phase()`, or as a lap by `lap()` which covers the time since
+    the previous phase ended.
+    """
+
+    def __init__(self):
+        self.started = self._mark = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+
+    def add(self, name: str, elapsed: float):
+        """Adds `elapsed` milliseconds to a phase."""
+        self.phases[name] = self.phases.get(name, 0.0) + elapsed
+
+    def lap(self, name: str):
+        """Records the time since the previous phase ended as a phase."""
+        now = time.perf_counter()
+        self.add(name, (now - self._mark) * 1000)
+        self._mark = now
+
+    @contextmanager
+    def phase(self, name: str):
+        """Records the time spent in the block as a phase."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._mark = time.perf_counter()
+            self.add(name, (self._mark - started) * 1000)
+
+    def merge(self, other: 'PhaseTimer'):
+        """Adds phases recorded by another timer, which end now."""
+        for name, elapsed in other.phases.items():
+            self.add(name, elapsed)
+        self._mark = time.perf_counter()
+
+    def elapsed(self) -> float:
+        """Returns milliseconds elapsed since the timer was created."""
+        return (time.perf_counter() - self.started) * 1000
+
+    def server_timing(self) -> str:
+        """Returns the phases and the total as a `Server-Timing` header value."""
+        metrics = [*self.phases.items(), ('total', self.elapsed())]
+        return ', '.join(f'{name};dur={elapsed:.3f}' for name, elapsed in metrics)
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Returns the percentile of sorted samples, interpolated linearly."""
+    if len(samples) == 1:
+        return samples[0]
+    rank = (len(samples) - 1) * pct / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(samples) - 1)
+    return samples[lower] + (samples[upper] - samples[lower]) * (rank - lower)
+
+
+def measure(func: Callable, iterations: int = 200, warmup: int = 20) -> Dict[str, float]:
+    """
+    Executes the input `func` a number of times after warming up, timing each
+    execution, and returns statistics of the timings in milliseconds along
+    with throughput in executions per second.
+
+    :param func:          Function to benchmark
+    :param iterations:    Number of timed executions
+    :param warmup:        Number of untimed executions before timing
+    """
+    for _ in range(warmup):
+        func()
+
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter_ns()
+        func()
+        samples.append((time.perf_counter_ns() - started) / 1e6)
+    samples.sort()
+
+    total = sum(samples)
+    return {
+        'iterations': iterations,
+        'total': round(total, 4),
+        'mean': round(total / iterations, 4),
+        'stdev': round(statistics.stdev(samples), 4) if iterations > 1 else 0.0,
+        'min': round(samples[0], 4),
+        'p50': round(percentile(samples, 50), 4),
+        'p95': round(percentile(samples, 95), 4),
+        'p99': round(percentile(samples, 99), 4),
+        'max': round(samples[-1], 4),
+        'throughput': round(iterations / total * 1000, 2) if total else None,
+    }
+
+
+class Metrics:
+    """
+    Thread-safe latency histograms, keyed by a set of labels (e.g. endpoint and
+    profile), along with the total time spent in each phase. They are shared by
+    all threads of the process and rendered in the Prometheus text format.
+    """
+
+    # Upper bounds of histogram buckets in milliseconds
+    buckets = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+    def __init__(self, name: str):
+        """
+        :param name:    Name of the histogram metric.
+        """
+        self.name = name
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._counts: Dict[Tuple, List[int]] = {}
+        self._sums: Dict[Tuple, float] = defaultdict(float)
+        self._phases: Dict[Tuple, float] = defaultdict(float)
+
+    def observe(self, labels: Dict[str, Any], elapsed: float, phases: Optional[Dict[str, float]] = None):
+        """
+        Records a latency of `elapsed` milliseconds, and the time spent in its
+        phases, under the given labels.
+        """
+        key = tuple((name, str(value)) for name, value in labels.items())
+        bucket = bisect_left(self.buckets, elapsed)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+            counts[bucket] += 1
+            self._sums[key] += elapsed
+            for phase, phase_elapsed in (phases or {}).items():
+                self._phases[key + (('phase', phase),)] += phase_elapsed
+
+    def clear(self):
+        """Forgets all recorded latencies."""
+        with self._lock:
+            self._reset()
+
+    def render(self) -> str:
+        """Returns the histograms in the Prometheus text exposition format."""
+        format_labels = lambda key: ','.join(f'{name}="{value}"' for name, value in key)
+        lines = [
+            f'# HELP {self.name}_milliseconds Latency of requests in milliseconds.',
+            f'# TYPE {self.name}_milliseconds histogram',
+        ]
+        with self._lock:
+            for key, counts in sorted(self._counts.items()):
+                labels, total = format_labels(key), 0
+                for bound, count in zip((*self.buckets, '+Inf'), counts):
+                    total += count
+                    lines.append(f'{self.name}_milliseconds_bucket{{{labels},le="{bound}"}} {total}')
+                lines.append(f'{self.name}_milliseconds_sum{{{labels}}} {self._sums[key]:.3f}')
+                lines.append(f'{self.name}_milliseconds_count{{{labels}}} {total}')
+            lines += [
+                f'# HELP {self.name}_phase_milliseconds_total Time spent in each phase of requests in milliseconds.',
+                f'# TYPE {self.name}_phase_milliseconds_total counter',
+            ]
+            for key, elapsed in sorted(self._phases.items()):
+                lines.append(f'{self.name}_phase_milliseconds_total{{{format_labels(key)}}} {elapsed:.3f}')
+        return '\n'.join(lines) + '\n'
+
+
 class SimpleAuthByHeader:
     """
     A simple class for authenticating a request that reads value from the
@@ -63,19 +689,23 @@ class SimpleAuthByHeader:
             self._secret_key = self._secret_key()
         return self._secret_key
 
+    def authenticate(self):
+        """Aborts the current request with `401` unless it presents the secret key."""
+        # Reads secret key from request header
+        secret_key = request.headers.get(self.header_name)
+        # Ensures secret key from request header is set
+        if not secret_key:
+            abort(401, 'Authentication required')
+        # Checks if the request secret key matches the configured secret key
+        if secret_key != self.secret_key:
+            abort(401, 'Invalid secret key')
+
     def protects(self, func):
         """Enables authentication functionality for wrapped methods."""
 
         @wraps(func)
         def wrapper(*args, **kwargs):
-            # Reads secret key from request header
-            secret_key = request.headers.get(self.header_name)
-            # Ensures secret key from request header is set
-            if not secret_key:
-                abort(401, 'Authentication required')
-            # Checks if the request secret key matches the configured secret key
-            if secret_key != self.secret_key:
-                abort(401, 'Invalid secret key')
+            self.authenticate()
             # Successfully authenticated
             return func(*args, **kwargs)
         return wrapper
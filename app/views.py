@@ -1,11 +1,17 @@
-from typing import ClassVar, Type, Callable, Optional, List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+from hashlib import md5
+from itertools import chain
+from typing import ClassVar, Type, Callable, Optional, List, Tuple, Iterator, Mapping, Dict, Any
 
-from flask import jsonify, request
+from flask import Response, g, jsonify, request, stream_with_context
 from flask.views import MethodView
 
 from . import app
-from .controllers import BaseQueryController, FilteredSalesQuery, MonthlySalesQuery, TopProductsQuery, ParamError
-from .utils import SimpleAuthByHeader, SQLite, getbool
+from .controllers import BaseQueryController, FilteredSalesQuery, MonthlySalesQuery, TopProductsQuery, \
+    RangeRevenueQuery, RevenueCubeQuery, ParamError, _cache, _pool, _flights, _data_version, _workload
+from .formats import ResultFormat, result_format, negotiate_format, gzip_compress, gzip_stream
+from .utils import SimpleAuthByHeader, SQLite, PhaseTimer, Metrics, BoundedExecutor, getbool
 
 # Init auth instance
 auth = SimpleAuthByHeader(
@@ -14,14 +20,74 @@ auth = SimpleAuthByHeader(
 )
 
 
+def profile_param(value: str) -> int | str:
+    """Returns a profile number, or `auto`."""
+    return value if value == BaseQueryController.AUTO else int(value)
+
+
+# Init latency histograms of query requests, shared by all threads
+_metrics = Metrics('query_request_duration')
+
+
+# Init threads that async views offload queries to, shared by all requests
+_executor = BoundedExecutor(workers=app.config['ASGI_EXECUTOR_WORKERS'], max_pending=app.config['ASGI_MAX_PENDING'])
+
+# Init threads that async views load registries read by initing queries on
+_prepare_executor = BoundedExecutor(
+    workers=app.config['ASGI_PREPARE_WORKERS'], max_pending=app.config['ASGI_MAX_PENDING'], name='prepare',
+)
+
+
+def start_timing():
+    """Starts timing the current request into `g.timings`."""
+    g.timings = PhaseTimer()
+    g.query_instance = None
+
+
+def observe_timing(response: Response) -> Response:
+    """
+    Exposes the phases of the current request by the `Server-Timing` response
+    header, and records them into `_metrics`.
+    """
+    timings, query_instance = g.timings, g.query_instance
+    response.headers['Server-Timing'] = timings.server_timing()
+    _metrics.observe(
+        labels={
+            'endpoint': request.endpoint,
+            'profile': query_instance.profile if query_instance and query_instance.profile is not None else '',
+            'engine': query_instance.engine if query_instance else '',
+            'cache': 'not_modified' if response.status_code == 304 else
+                     query_instance.cache_status if query_instance else 'off',
+        },
+        elapsed=timings.elapsed(),
+        phases=timings.phases,
+    )
+    return response
+
+
+def timed(func):
+    """
+    Times the phases of requests to the wrapped view, which are exposed by the
+    `Server-Timing` response header and recorded into `_metrics`. Phases after
+    authentication are recorded by the view into `g.timings`.
+    """
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        start_timing()
+        return observe_timing(func(*args, **kwargs))
+    return wrapper
+
+
 class QueryApiView(MethodView):
     """
     An abstract view that accepts GET requests, reads parameters from URL query
     string, and executes the pre-defined controller to acquire and return results.
     """
 
-    # Enforces authentication for accessing to all methods
-    decorators = [auth.protects]
+    # Enforces authentication for accessing to all methods, and times requests
+    # including their authentication
+    decorators = [auth.protects, timed]
 
     # Controller class used as handler for this view
     query_class: ClassVar[Type[BaseQueryController]] = None
@@ -30,17 +96,30 @@ class QueryApiView(MethodView):
     # and accepted to process by the controller.
     query_params: ClassVar[Optional[List[Tuple[str, Optional[Callable]]]]] = None
 
+    # Format that results are serialized into, and whether they are compressed
+    # by gzip, as negotiated for the current request
+    result_format: ResultFormat = None
+    gzip: bool = False
+
     def get_query_params(self):
         """Reads query parameters from URL query string."""
+        return self.parse_query_params(request.args)
+
+    @classmethod
+    def parse_query_params(cls, args: Mapping[str, Any]) -> Dict[str, Any]:
+        """Reads query parameters from a mapping, e.g. URL query string."""
 
         # Implicit parameters expected by BaseQueryController
-        param_defs = [('profile', int), ('cache', getbool)]
+        param_defs = [
+            ('profile', profile_param), ('cache', getbool), ('engine', str), ('explain', getbool),
+            ('format', result_format),
+        ]
         # Merge with pre-defined custom parameters
-        param_defs += self.query_params or []
+        param_defs += cls.query_params or []
         # Reads parameters from query string
         params = {}
         for name, type_ in dict(param_defs).items():
-            value = request.args.get(name)
+            value = args.get(name)
             if value is not None:
                 if type_ is not None:
                     try:
@@ -52,20 +131,221 @@ class QueryApiView(MethodView):
 
     def get(self):
         """Listens to GET requests."""
+        g.timings.lap('auth')
+        try:
+            query_instance, stream, explain = self.prepare()
+            if explain:
+                return self.explain_response(query_instance)
+            # Answer without executing the query if the client's copy is current
+            etag = self.etag(query_instance)
+            if request.if_none_match.contains_weak(etag):
+                return self.tag_response(Response(status=304), etag)
+            # Execute query instance and return response
+            if stream:
+                return self.streamed_results_response(query_instance, etag)
+            return self.results_response(query_instance, query_instance(self.result_format.parsed), etag)
+        except ParamError as e:
+            # Response if invalid parameters encountered
+            return self.error_response(str(e))
 
+    @staticmethod
+    def error_response(message: str) -> Response:
+        """Returns a `400 Bad Request` response describing invalid parameters."""
+        response = jsonify({'error': message})
+        response.status_code = 400
+        return response
+
+    def prepare(self) -> Tuple[BaseQueryController, bool, bool]:
+        """
+        Reads query params, negotiates the format of results, and inits the
+        query instance, whose phases are then recorded straight into the
+        request's timings. Returns the query instance, and whether to stream
+        its results and to explain it instead.
+        """
         # Ensure query class is properly configured
         if not self.query_class:
             raise TypeError('No query_class configured')
+        timings = g.timings
+        # Read query params
+        params = self.get_query_params()
+        timings.lap('params')
+        # Whether to stream results instead of building them at once
+        stream = params.pop('stream', False)
+        if stream and (params.get('page_size') is not None or params.get('cursor')):
+            raise ParamError('Streaming cannot be combined with pagination')
+        # Whether to return the query plan instead of results
+        explain = params.pop('explain', False)
+        # Format given by parameter, or else accepted best by the client
+        self.result_format = params.pop('format', None) or negotiate_format(request.accept_mimetypes)
+        self.gzip = request.accept_encodings['gzip'] > 0
+        # Init query instance with expected query params
+        query_instance = g.query_instance = self.query_class(**params)
+        timings.merge(query_instance.timings)
+        query_instance.timings = timings
+        return query_instance, stream, explain
+
+    def results_response(self, query_instance: BaseQueryController, results, etag: str) -> Response:
+        """
+        Returns a response of results of the query instance in the negotiated
+        format, with their metadata as headers.
+        """
+        response = self.result_format.response(query_instance.columns, results)
+        g.timings.lap('jsonify' if self.result_format.parsed else 'serialize')
+        # Expose metadata of results as response headers
+        for name, value in query_instance.meta.items():
+            if value is not None:
+                response.headers[self.meta_header(name)] = str(value)
+        return self.tag_response(self.compress_response(response), etag)
+
+    def streamed_results_response(self, query_instance: BaseQueryController, etag: str) -> Response:
+        """Returns a response streaming results of the query instance."""
+        response = self.stream_response(query_instance)
+        if query_instance.profile is not None:
+            response.headers[self.meta_header('query_profile')] = str(query_instance.profile)
+        g.timings.lap('execute')
+        return self.tag_response(self.compress_response(response), etag)
+
+    def compress_response(self, response: Response) -> Response:
+        """
+        Compresses a response by gzip if the client accepts it, unless it is
+        too small to be worth it. Streamed responses are compressed as they
+        are streamed.
+        """
+        if not self.gzip:
+            return response
+        level = app.config['GZIP_LEVEL']
+        if response.is_streamed:
+            response.response = gzip_stream(response.response, level)
+        elif response.content_length >= app.config['GZIP_MIN_SIZE']:
+            response.set_data(gzip_compress(response.get_data(), level))
+            g.timings.lap('compress')
+        else:
+            return response
+        response.content_encoding = 'gzip'
+        return response
+
+    @staticmethod
+    def explain_response(query_instance: BaseQueryController) -> Response:
+        """
+        Returns a response describing how the query instance is executed: its
+        final SQL statement, the bound arguments, and the query plan.
+        """
+        if not app.config['QUERY_EXPLAIN_ENABLED']:
+            raise ParamError('Query plans are disabled')
+        return jsonify({
+            'profile': query_instance.profile,
+            'query': '\n'.join(filter(None, map(str.strip, query_instance.query.splitlines()))),
+            'args': query_instance.query_args,
+            'plan': query_instance.explain(),
+        })
+
+    def etag(self, query_instance: BaseQueryController) -> str:
+        """
+        Returns the entity tag of results of the query instance, which only
+        changes when the query, the data version, or the negotiated format or
+        compression changes. With `profile=auto`, it doesn't change with the
+        profile chosen.
+        """
+        variant = f'{self.result_format.name}:{"gzip" if self.gzip else "identity"}'
+        return md5(f'{query_instance.request_key}:{_data_version.get()}:{variant}'.encode()).hexdigest()
+
+    @staticmethod
+    def tag_response(response: Response, etag: str) -> Response:
+        """Sets the entity tag and caching directives of a response."""
+        response.set_etag(etag)
+        # Results are negotiated by these headers
+        response.vary.update(('Accept', 'Accept-Encoding'))
+        response.cache_control.private = True
+        response.cache_control.max_age = app.config['HTTP_CACHE_MAX_AGE']
+        response.cache_control.must_revalidate = True
+        return response
+
+    @staticmethod
+    def meta_header(name: str) -> str:
+        """Returns the response header of a metadata, e.g. `X-Next-Cursor`."""
+        return 'X-' + name.replace('_', '-').title()
+
+    def stream_response(self, query_instance: BaseQueryController) -> Response:
+        """
+        Returns a response that streams results of the query instance in the
+        negotiated format, one chunk per batch of rows fetched from the cursor.
+        """
+        return Response(stream_with_context(self.stream_results(query_instance)),
+                        mimetype=self.result_format.mimetype)
+
+    def stream_results(self, query_instance: BaseQueryController) -> Iterator[str | bytes]:
+        """Returns chunks of results of the query instance in the negotiated format."""
+        batches = query_instance.iterate(size=app.config['STREAM_FETCH_SIZE'], parse=self.result_format.parsed)
+        # Fetch the first batch up front so that query errors are raised
+        # before the response starts.
+        first = next(batches, [])
+        return self.result_format.stream(query_instance.columns, chain([first], batches))
+
+
+class AsyncQueryApiView(QueryApiView):
+    """
+    The async variant of a query view, served by the ASGI entry point of
+    `app.asgi` rather than by Flask. Preparing the query instance and looking
+    up its results in cache are done on the event loop, as long as the
+    registries read by initing queries are loaded. Loading them (once per data
+    version) is offloaded to `_prepare_executor`, whereas executing queries,
+    explaining them and streaming their results are offloaded to `_executor`,
+    so that the event loop never reads the sales database and a few slow
+    queries never hold up cache hits, conditional requests and invalid
+    parameters.
+    """
+
+    async def dispatch(self) -> Response:
+        """Authenticates and times the current request, and answers it."""
+        start_timing()
+        auth.authenticate()
+        return observe_timing(await self.get())
+
+    async def get(self):
+        """Listens to GET requests."""
+        g.timings.lap('auth')
         try:
-            # Read query params
-            params = self.get_query_params()
-            # Init query instance with expected query params
-            query_instance = self.query_class(**params)
-            # Execute query instance and return response
-            return jsonify(query_instance())
+            if not self.query_class.registries_loaded():
+                await _prepare_executor.run(self.query_class.load_registries)
+                g.timings.lap('registries')
+            query_instance, stream, explain, etag, results = self.prepare_cached()
+            if explain:
+                return await _executor.run(self.explain_response, query_instance)
+            # Answer without executing the query if the client's copy is current
+            if request.if_none_match.contains_weak(etag):
+                return self.tag_response(Response(status=304), etag)
+            if stream:
+                return await _executor.run(self.streamed_results_response, query_instance, etag)
+            # Results found in cache are answered right away, others are
+            # executed and serialized on a thread
+            if results is not None:
+                return self.results_response(query_instance, results, etag)
+            parse = self.result_format.parsed
+            return await _executor.run(
+                lambda: self.results_response(query_instance, query_instance.compute(parse), etag)
+            )
         except ParamError as e:
             # Response if invalid parameters encountered
-            return jsonify({'error': str(e)}, 400)
+            return self.error_response(str(e))
+
+    def prepare_cached(self) -> Tuple[BaseQueryController, bool, bool, str, Optional[Any]]:
+        """
+        Prepares the query instance (see `prepare()`), and returns it with its
+        entity tag and its results if they are to be answered from cache.
+        """
+        query_instance, stream, explain = self.prepare()
+        etag = self.etag(query_instance)
+        results = None
+        if not (explain or stream or request.if_none_match.contains_weak(etag)):
+            results = query_instance.lookup_cache(self.result_format.parsed)
+        return query_instance, stream, explain, etag, results
+
+    def stream_response(self, query_instance: BaseQueryController) -> Response:
+        """
+        Returns a response that streams results of the query instance. The
+        request context stays pushed until `app.asgi` has sent the response.
+        """
+        return Response(self.stream_results(query_instance), mimetype=self.result_format.mimetype)
 
 
 class FilteredSalesApiView(QueryApiView):
@@ -77,6 +357,9 @@ class FilteredSalesApiView(QueryApiView):
         ('region_name', str),
         ('start_date', SQLite.validates_date),
         ('end_date', SQLite.validates_date),
+        ('stream', getbool),
+        ('page_size', int),
+        ('cursor', str),
     ]
 
 
@@ -84,10 +367,190 @@ class MonthlySalesApiView(QueryApiView):
     """Serves monthly sales queries."""
 
     query_class = MonthlySalesQuery
+    query_params = [
+        ('start_date', SQLite.validates_date),
+        ('end_date', SQLite.validates_date),
+    ]
 
 
 class TopProductsApiView(QueryApiView):
     """Serves top products queries."""
 
     query_class = TopProductsQuery
-    query_params = [('limit', int)]
+    query_params = [
+        ('limit', int),
+        ('start_date', SQLite.validates_date),
+        ('end_date', SQLite.validates_date),
+        ('approximate', getbool),
+    ]
+
+
+class RangeRevenueApiView(QueryApiView):
+    """Serves total revenue of date ranges."""
+
+    query_class = RangeRevenueQuery
+    query_params = [
+        ('product_name', str),
+        ('region_name', str),
+        ('start_date', SQLite.validates_date),
+        ('end_date', SQLite.validates_date),
+    ]
+
+
+class RevenueCubeApiView(QueryApiView):
+    """Serves revenue grouped by any dimensions of the cube."""
+
+    query_class = RevenueCubeQuery
+    query_params = [
+        ('group_by', str),
+        ('product_name', str),
+        ('region_name', str),
+        ('start_month', str),
+        ('end_month', str),
+    ]
+
+
+# Init threads that queries of batches run on, shared by all requests
+_batch_executor = ThreadPoolExecutor(app.config['BATCH_WORKERS'], thread_name_prefix='batch')
+
+
+class BatchApiView(MethodView):
+    """
+    Runs many queries in one request, e.g. all queries of a dashboard. The
+    request body is a JSON list of specs, each with the `controller` (the name
+    of its endpoint, e.g. `monthly-revenue`), an optional `profile`, and the
+    `params` of its endpoint. Queries use the cache unless `cache` is set off,
+    and those missing from it run concurrently over pooled connections. The
+    response lists, in the same order, either the results of each query with
+    their metadata, or its error.
+    """
+
+    decorators = [auth.protects, timed]
+
+    def post(self):
+        """Listens to POST requests."""
+        timings = g.timings
+        timings.lap('auth')
+        specs = request.get_json(silent=True)
+        if not isinstance(specs, list) or not all(isinstance(spec, dict) for spec in specs):
+            return self.error_response('Expected a list of query specs')
+        if len(specs) > app.config['BATCH_MAX_QUERIES']:
+            return self.error_response(f'At most {app.config["BATCH_MAX_QUERIES"]} queries per batch')
+        queries = list(map(self.query_instance, specs))
+        timings.lap('params')
+
+        # Answer queries found in cache right away
+        items: List[Optional[Dict[str, Any]]] = [None] * len(queries)
+        misses = []
+        for i, query_instance in enumerate(queries):
+            if isinstance(query_instance, str):
+                items[i] = {'error': query_instance}
+            elif (results := query_instance.lookup_cache()) is not None:
+                items[i] = {'results': results, 'meta': query_instance.meta}
+            else:
+                misses.append(i)
+        timings.lap('cache')
+
+        # Execute the others concurrently, unless there is only one of them
+        execute = _batch_executor.map if len(misses) > 1 else map
+        for i, item in zip(misses, execute(self.compute, [queries[i] for i in misses])):
+            items[i] = item
+        timings.lap('execute')
+        response = jsonify(items)
+        timings.lap('jsonify')
+        return response
+
+    @staticmethod
+    def error_response(message: str) -> Response:
+        """Returns a `400 Bad Request` response describing an invalid batch."""
+        response = jsonify({'error': message})
+        response.status_code = 400
+        return response
+
+    @staticmethod
+    def query_instance(spec: Dict[str, Any]) -> BaseQueryController | str:
+        """Inits the query instance of a spec, or returns its error."""
+        view_class = getattr(app.view_functions.get(spec.get('controller')), 'view_class', None)
+        if not isinstance(view_class, type) or not issubclass(view_class, QueryApiView):
+            return f'Unknown controller {spec.get("controller")!r}'
+        params = spec.get('params') or {}
+        if not isinstance(params, dict):
+            return 'Expected params as an object'
+        if 'profile' in spec:
+            params = {**params, 'profile': spec['profile']}
+        try:
+            params = {'cache': True, **view_class.parse_query_params(params)}
+            if params.pop('stream', False) or params.pop('explain', False) or params.pop('format', None):
+                raise ParamError('Streaming, query plans and formats are not supported in batches')
+            return view_class.query_class(**params)
+        except ParamError as e:
+            return str(e)
+        except Exception as e:
+            # Any other failure (e.g. no connection available in time to read
+            # the partition registry) fails this query only
+            app.logger.exception('Failed to init query of batch')
+            return str(e) or type(e).__name__
+
+    @staticmethod
+    def compute(query_instance: BaseQueryController) -> Dict[str, Any]:
+        """Executes a query instance, and returns its results and metadata, or its error."""
+        with app.app_context():
+            try:
+                results = query_instance.compute()
+            except ParamError as e:
+                return {'error': str(e)}
+            except Exception as e:
+                # Any other failure (e.g. no connection available in time, or a
+                # failing statement) fails this query only
+                app.logger.exception('Failed to execute query of batch')
+                return {'error': str(e) or type(e).__name__}
+        return {'results': results, 'meta': query_instance.meta}
+
+
+class MetricsApiView(MethodView):
+    """
+    Serves latency histograms of query requests per endpoint, profile, engine
+    and cache status, in the Prometheus text format.
+    """
+
+    decorators = [auth.protects]
+
+    def get(self):
+        """Listens to GET requests."""
+        return Response(_metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+class WorkloadApiView(MethodView):
+    """
+    Serves the statement shapes executed by the worker, with their execution
+    counts and times and their candidate indexes, as the workload evaluated by
+    `index_advisor.py`.
+    """
+
+    decorators = [auth.protects]
+
+    def get(self):
+        """Listens to GET requests."""
+        return jsonify(_workload.shapes())
+
+
+class StatsApiView(MethodView):
+    """
+    Serves statistics of the result cache, the connection pool, the
+    coalescing of identical queries, the recorded workload, and the threads
+    that async views offload queries and their preparation to.
+    """
+
+    decorators = [auth.protects]
+
+    def get(self):
+        """Listens to GET requests."""
+        cache = _cache.cache
+        return jsonify({
+            'cache': cache.stats() if hasattr(cache, 'stats') else None,
+            'pool': _pool.stats(),
+            'singleflight': _flights.stats(),
+            'workload': _workload.stats(),
+            'executor': _executor.stats(),
+            'prepare_executor': _prepare_executor.stats(),
+        })
@@ -0,0 +1,271 @@
+import json
+import platform
+import sqlite3
+import sys
+from argparse import ArgumentParser, Namespace
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Any, Iterator, Tuple, Type
+
+from app import app
+from app.controllers import BaseQueryController, FilteredSalesQuery, MonthlySalesQuery, TopProductsQuery, \
+    RangeRevenueQuery, RevenueCubeQuery
+from app.engines import np
+from app.formats import FORMATS
+from app.models import CURRENT_YEAR
+from app.utils import measure
+
+
+# Parameters the controllers are benchmarked with
+CONTROLLER_PARAMS: List[Tuple[Type[BaseQueryController], str, Dict[str, Any]]] = [
+    (MonthlySalesQuery, 'all', {}),
+    (MonthlySalesQuery, 'quarter', {'start_date': f'{CURRENT_YEAR}-01-01', 'end_date': f'{CURRENT_YEAR}-03-31'}),
+    (FilteredSalesQuery, 'narrow', {
+        'product_name': 'Data Science Book',
+        'region_name': 'Mid-Atlantic',
+        'start_date': f'{CURRENT_YEAR}-02-01',
+        'end_date': f'{CURRENT_YEAR}-03-01',
+    }),
+    (FilteredSalesQuery, 'wide', {
+        'start_date': f'{CURRENT_YEAR - 1}-01-01',
+        'end_date': f'{CURRENT_YEAR}-12-31',
+    }),
+    (TopProductsQuery, 'top5', {'limit': 5}),
+    (TopProductsQuery, 'top5-quarter', {
+        'limit': 5, 'start_date': f'{CURRENT_YEAR}-01-01', 'end_date': f'{CURRENT_YEAR}-03-31',
+    }),
+    (TopProductsQuery, 'top20-year', {
+        'limit': 20, 'start_date': f'{CURRENT_YEAR - 1}-03-05', 'end_date': f'{CURRENT_YEAR}-02-10',
+    }),
+    (RangeRevenueQuery, 'two-years', {'start_date': f'{CURRENT_YEAR - 1}-01-01', 'end_date': f'{CURRENT_YEAR}-12-31'}),
+    (RangeRevenueQuery, 'product-region', {
+        'product_name': 'Data Science Book',
+        'region_name': 'Mid-Atlantic',
+        'start_date': f'{CURRENT_YEAR}-02-01',
+        'end_date': f'{CURRENT_YEAR}-03-01',
+    }),
+    (RevenueCubeQuery, 'region-month', {'group_by': 'month,region'}),
+    (RevenueCubeQuery, 'product-quarter', {
+        'group_by': 'product', 'start_month': f'{CURRENT_YEAR}-01', 'end_month': f'{CURRENT_YEAR}-03',
+    }),
+    (RevenueCubeQuery, 'product-slice', {'group_by': 'month,region', 'product_name': 'Data Science Book'}),
+]
+
+# Endpoints the API is benchmarked with
+API_ENDPOINTS: List[Tuple[str, Dict[str, Any]]] = [
+    ('/sales/', {'start_date': f'{CURRENT_YEAR}-01-01', 'end_date': f'{CURRENT_YEAR}-01-31'}),
+    ('/sales/monthly-revenue/', {}),
+    ('/sales/top-products/', {}),
+    ('/sales/range-revenue/', {'start_date': f'{CURRENT_YEAR}-01-01', 'end_date': f'{CURRENT_YEAR}-03-31'}),
+    ('/sales/revenue-cube/', {'group_by': 'month,region', 'start_month': f'{CURRENT_YEAR}-01'}),
+]
+
+
+def benchmark_cases() -> Iterator[Tuple[str, Callable]]:
+    """
+    Yields name and function of every benchmark case: each profile (and
+    engine, and approximation of top products) of each controller, each API
+    endpoint with and without cache, each response format, and all endpoints
+    in one batch.
+    """
+    for query_class, label, params in CONTROLLER_PARAMS:
+        profiles = len(query_class(profile=1, **params).query_profiles())
+        for profile in range(1, profiles + 1):
+            yield f'{query_class.__name__}[{label}]:profile={profile}', query_class(profile=profile, **params)
+        yield f'{query_class.__name__}[{label}]:profile=auto', lambda q=query_class, p=params: q(profile='auto', **p)()
+        if np is not None:
+            yield f'{query_class.__name__}[{label}]:engine=numpy', query_class(engine='numpy', **params)
+        if query_class is TopProductsQuery:
+            yield f'{query_class.__name__}[{label}]:approximate', query_class(approximate=True, **params)
+
+    client = app.test_client()
+    headers = {'X-Api-Key': app.config['API_SECRET_KEY']}
+    for endpoint, params in API_ENDPOINTS:
+        for cache in (0, 1):
+            def request(endpoint=endpoint, params={**params, 'cache': cache}):
+                response = client.get(endpoint, query_string=params, headers=headers)
+                assert response.status_code == 200, f'{endpoint} responded {response.status_code}'
+            yield f'GET {endpoint}:cache={cache}', request
+
+    # Serializing cached results of the first endpoint in each format
+    endpoint, params = API_ENDPOINTS[0]
+    for name in FORMATS:
+        def request(params={**params, 'cache': 1, 'format': name}):
+            response = client.get(endpoint, query_string=params, headers=headers)
+            assert response.status_code == 200, f'{endpoint} responded {response.status_code}'
+        yield f'GET {endpoint}:format={name}', request
+
+    # All endpoints in one request, as a dashboard load would
+    adapter = app.url_map.bind('localhost')
+    for cache in (0, 1):
+        specs = [
+            {'controller': adapter.match(endpoint)[0], 'params': {**params, 'cache': cache}}
+            for endpoint, params in API_ENDPOINTS
+        ]
+
+        def request(specs=specs):
+            response = client.post('/batch', json=specs, headers=headers)
+            assert response.status_code == 200, f'/batch responded {response.status_code}'
+            assert all('results' in item for item in response.get_json()), '/batch returned errors'
+        yield f'POST /batch:cache={cache}', request
+
+
+def accuracy(names: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Compares approximate top products against the exact ones of profile 1, for
+    the cases of `TopProductsQuery` among `names`, and returns the share of
+    exact top products found (recall), the largest error of revenue relative
+    to exact revenue, and whether exact revenue lies within the bounds
+    reported for every product.
+    """
+    results = {}
+    for query_class, label, params in CONTROLLER_PARAMS:
+        name = f'{query_class.__name__}[{label}]:approximate'
+        if query_class is not TopProductsQuery or name not in names:
+            continue
+        query = TopProductsQuery(approximate=True, **params)
+        approximate = query()
+        exact = {item['product_name'] for item in TopProductsQuery(profile=1, **params)()}
+        dates = {name: params[name] for name in ('start_date', 'end_date') if name in params}
+        errors, within = [], True
+        for item in approximate:
+            (revenue,), = RangeRevenueQuery(product_name=item['product_name'], **dates)(parse=False)
+            errors.append(abs(item['total_revenue'] - revenue) / revenue if revenue else 0.0)
+            # Bounds are rounded to cents
+            within &= item['total_revenue'] - item['revenue_error'] - 0.01 <= revenue <= item['total_revenue'] + 0.01
+        results[name] = {
+            'recall': len(exact & {item['product_name'] for item in approximate}) / len(exact) if exact else 1.0,
+            'max_relative_error': max(errors, default=0.0),
+            'within_bounds': within,
+            'revenue_error_bound': query.meta.get('revenue_error_bound'),
+        }
+    return results
+
+
+def run(iterations: int, warmup: int, pattern: str = None) -> Dict[str, Any]:
+    """Runs all benchmark cases matching `pattern` and returns their results."""
+    results = {}
+    with app.app_context():
+        for name, func in benchmark_cases():
+            if pattern and pattern not in name:
+                continue
+            results[name] = stats = measure(func, iterations=iterations, warmup=warmup)
+            print(
+                f'{name:<50} p50 {stats["p50"]:>8.3f}ms  p95 {stats["p95"]:>8.3f}ms  '
+                f'p99 {stats["p99"]:>8.3f}ms  {stats["throughput"]:>10.1f} ops/s'
+            )
+        # Accuracy of the approximations that were timed
+        errors = accuracy(list(results))
+        for name, stats in errors.items():
+            print(
+                f'{name:<50} recall {stats["recall"]:>7.1%}  max error {stats["max_relative_error"]:>8.3%}  '
+                f'{"within" if stats["within_bounds"] else "OUT OF"} bounds'
+            )
+        with sqlite3.connect(app.config['DATABASE_FILE']) as conn:
+            (sales,), = conn.execute('SELECT COUNT(*) FROM sales').fetchall()
+    return {
+        'meta': {
+            'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'sales': sales,
+            'iterations': iterations,
+            'warmup': warmup,
+        },
+        'results': results,
+        'accuracy': errors,
+    }
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float,
+            metrics: Tuple[str, ...] = ('p50', 'p95')) -> List[str]:
+    """
+    Compares results against a baseline, and returns descriptions of the cases
+    whose metrics regress past the baseline by more than `tolerance` (e.g.
+    0.25 means 25% slower). Cases missing from either side are ignored.
+    """
+    regressions = []
+    for name, stats in results['results'].items():
+        expected = baseline['results'].get(name)
+        if not expected:
+            continue
+        for metric in metrics:
+            limit = expected[metric] * (1 + tolerance)
+            if stats[metric] > limit:
+                regressions.append(
+                    f'{name}: {metric} {stats[metric]:.3f}ms > {limit:.3f}ms '
+                    f'(baseline {expected[metric]:.3f}ms + {tolerance:.0%})'
+                )
+    return regressions
+
+
+def get_args() -> Namespace:
+    """Read arguments from command line."""
+
+    parser = ArgumentParser(
+        description='Benchmark every controller profile and API endpoint'
+    )
+    parser.add_argument(
+        '--iterations',
+        metavar='N',
+        type=int,
+        default=200,
+        help='Number of timed executions per case (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--warmup',
+        metavar='N',
+        type=int,
+        default=20,
+        help='Number of untimed executions per case before timing (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--filter',
+        metavar='PATTERN',
+        help='Only run cases whose names contain PATTERN'
+    )
+    parser.add_argument(
+        '--output',
+        metavar='FILE',
+        help='Write results as JSON to FILE'
+    )
+    parser.add_argument(
+        '--baseline',
+        metavar='FILE',
+        help='Fail if any case regresses past the results stored in FILE'
+    )
+    parser.add_argument(
+        '--tolerance',
+        metavar='RATIO',
+        type=float,
+        default=0.25,
+        help='Allowed slowdown against the baseline (default: %(default)s)'
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+    results = run(iterations=args.iterations, warmup=args.warmup, pattern=args.filter)
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(results, fp, indent=2)
+        print(f'Results written to {args.output!r}')
+    if args.baseline:
+        with open(args.baseline) as fp:
+            baseline = json.load(fp)
+        regressions = compare(results, baseline, tolerance=args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}', file=sys.stderr)
+        if regressions:
+            return 1
+        print(f'No regressions against {args.baseline!r}')
+
+
+if __name__ == '__main__':
+    try:
+        sys.exit(main())
+    except (ValueError, FileNotFoundError) as e:
+        print(e, file=sys.stderr)
+        sys.exit(2)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,242 @@
+import asyncio
+import json
+import os
+import platform
+import sqlite3
+import sys
+import time
+from argparse import ArgumentParser, Namespace
+from concurrent.futures import ThreadPoolExecutor
+from configparser import ConfigParser
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+from urllib.parse import urlsplit
+
+from werkzeug.test import EnvironBuilder
+
+from app import app
+from app.asgi import application
+from app.utils import percentile
+from app.views import _executor
+
+# Requests sent by both classes of clients, where slow ones execute a query
+# that scans sales, and fast ones are answered by the result cache
+SLOW_REQUEST = '/sales/?profile=1&product_name=Data+Science+Book&region_name=Mid-Atlantic'
+FAST_REQUEST = '/sales/monthly-revenue/?cache=1'
+
+
+def uwsgi_slots(path: str = 'uwsgi.ini') -> int:
+    """Returns the number of requests served at once by the uwsgi setup (processes x threads)."""
+    config = ConfigParser()
+    config.read(os.path.join(os.path.dirname(os.path.abspath(__file__)), path))
+    return config.getint('uwsgi', 'processes', fallback=1) * config.getint('uwsgi', 'threads', fallback=1)
+
+
+def wsgi_sender(slots: int) -> Callable[[str], Awaitable[int]]:
+    """
+    Returns a function sending a request to the WSGI app, which is served by
+    as many threads as the uwsgi setup serves requests at once. Requests wait
+    for a free thread as they would in the listen queue of uwsgi.
+    """
+    threads = ThreadPoolExecutor(slots, thread_name_prefix='wsgi')
+    headers = {'X-Api-Key': app.config['API_SECRET_KEY']}
+
+    def call(url: str) -> int:
+        path, query_string = urlsplit(url)[2:4]
+        environ = EnvironBuilder(path=path, query_string=query_string, headers=headers).get_environ()
+        status = []
+        app_iter = app.wsgi_app(environ, lambda status_line, _: status.append(int(status_line.split()[0])))
+        try:
+            b''.join(app_iter)
+        finally:
+            getattr(app_iter, 'close', lambda: None)()
+        return status[0]
+
+    async def send(url: str) -> int:
+        return await asyncio.get_running_loop().run_in_executor(threads, call, url)
+    return send
+
+
+def asgi_sender() -> Callable[[str], Awaitable[int]]:
+    """Returns a function sending a request to the ASGI application."""
+    headers = [(b'x-api-key', app.config['API_SECRET_KEY'].encode())]
+
+    async def send(url: str) -> int:
+        path, query_string = urlsplit(url)[2:4]
+        scope = {
+            'type': 'http', 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+            'path': path, 'query_string': query_string.encode(), 'headers': headers,
+            'server': ('localhost', 5000), 'client': ('127.0.0.1', 50000),
+        }
+        status = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send_message(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+
+        await application(scope, receive, send_message)
+        return status[0]
+    return send
+
+
+async def load(send: Callable[[str], Awaitable[int]], clients: List[Tuple[str, str]],
+               duration: float) -> Dict[str, Dict[str, Any]]:
+    """
+    Runs closed-loop clients for `duration` seconds, each sending its request
+    again as soon as it is answered, and returns statistics per class of
+    clients: throughput in requests per second, latency percentiles in
+    milliseconds, and the number of requests not answered by `200 OK`.
+    """
+    samples: Dict[str, List[float]] = {name: [] for name, _ in clients}
+    errors: Dict[str, int] = {name: 0 for name, _ in clients}
+    deadline = time.perf_counter() + duration
+
+    async def client(name: str, url: str):
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            status = await send(url)
+            samples[name].append((time.perf_counter() - started) * 1000)
+            if status != 200:
+                errors[name] += 1
+            # Yield to other clients as the round trip over the network would,
+            # since requests answered by the cache never wait for a thread
+            await asyncio.sleep(0)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(name, url) for name, url in clients))
+    elapsed = time.perf_counter() - started
+
+    results = {}
+    for name, latencies in samples.items():
+        latencies.sort()
+        results[name] = {
+            'requests': len(latencies),
+            'errors': errors[name],
+            'throughput': round(len(latencies) / elapsed, 2),
+            'p50': round(percentile(latencies, 50), 4) if latencies else None,
+            'p95': round(percentile(latencies, 95), 4) if latencies else None,
+            'p99': round(percentile(latencies, 99), 4) if latencies else None,
+        }
+    return results
+
+
+def run(duration: float, slow_clients: int, fast_clients: int, slots: int,
+        slow_request: str = SLOW_REQUEST, fast_request: str = FAST_REQUEST) -> Dict[str, Any]:
+    """Loads both the WSGI and the ASGI app with the same clients, and returns their results."""
+    clients = [('slow', slow_request)] * slow_clients + [('fast', fast_request)] * fast_clients
+    modes = {
+        f'wsgi[{slots} slots]': lambda: wsgi_sender(slots),
+        f'asgi[{_executor.workers} workers]': asgi_sender,
+    }
+    results = {}
+    for mode, sender in modes.items():
+        send = sender()
+        # Warm up the result cache and the connection pool
+        asyncio.run(load(send, clients, duration=min(duration, 1)))
+        results[mode] = asyncio.run(load(send, clients, duration=duration))
+        for name, stats in results[mode].items():
+            print(
+                f'{mode + " " + name:<24} {stats["throughput"]:>9.1f} req/s  p50 {stats["p50"]:>9.3f}ms  '
+                f'p95 {stats["p95"]:>9.3f}ms  p99 {stats["p99"]:>9.3f}ms  {stats["errors"]} errors'
+            )
+    with sqlite3.connect(app.config['DATABASE_FILE']) as conn:
+        (sales,), = conn.execute('SELECT COUNT(*) FROM sales').fetchall()
+    return {
+        'meta': {
+            'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'sales': sales,
+            'duration': duration,
+            'slow_clients': slow_clients,
+            'fast_clients': fast_clients,
+            'slow_request': slow_request,
+            'fast_request': fast_request,
+        },
+        'results': results,
+    }
+
+
+def get_args() -> Namespace:
+    """Read arguments from command line."""
+
+    parser = ArgumentParser(
+        description='Compare the concurrency sustained by the WSGI app as set up for uwsgi and by the ASGI app, '
+                    'under a mix of slow queries and cache hits'
+    )
+    parser.add_argument(
+        '--duration',
+        metavar='SECONDS',
+        type=float,
+        default=10,
+        help='Duration of the load on each app (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--slow-clients',
+        metavar='N',
+        type=int,
+        default=8,
+        help='Number of clients sending slow queries (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--fast-clients',
+        metavar='N',
+        type=int,
+        default=8,
+        help='Number of clients sending requests answered by the cache (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--slots',
+        metavar='N',
+        type=int,
+        default=uwsgi_slots(),
+        help='Number of requests the WSGI app serves at once (default: processes x threads of uwsgi.ini, '
+             '%(default)s)'
+    )
+    parser.add_argument(
+        '--slow-request',
+        metavar='URL',
+        default=SLOW_REQUEST,
+        help='Request sent by slow clients (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--fast-request',
+        metavar='URL',
+        default=FAST_REQUEST,
+        help='Request sent by fast clients (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--output',
+        metavar='FILE',
+        help='Write results as JSON to FILE'
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+    results = run(
+        duration=args.duration,
+        slow_clients=args.slow_clients,
+        fast_clients=args.fast_clients,
+        slots=args.slots,
+        slow_request=args.slow_request,
+        fast_request=args.fast_request,
+    )
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(results, fp, indent=2)
+        print(f'Results written to {args.output!r}')
+
+
+if __name__ == '__main__':
+    try:
+        sys.exit(main())
+    except (ValueError, FileNotFoundError) as e:
+        print(e, file=sys.stderr)
+        sys.exit(2)
+    except KeyboardInterrupt:
+        pass
@@ -10,13 +10,108 @@ DATABASE_FILE = os.path.join(BASE_DIR, 'db.sqlite')
 SQLALCHEMY_DATABASE_URI = 'sqlite:///' + DATABASE_FILE
 SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+# Settings for the pool of persistent SQLite connections used by controllers.
+# Each worker process owns its pool, which should be as large as the number of
+# threads per worker (see uwsgi.ini) plus `BATCH_WORKERS`, so that threads of
+# the batch endpoint never take the connections of other requests.
+SQLITE_POOL_SIZE = 6
+SQLITE_POOL_TIMEOUT = 30  # seconds
+
+# Settings for the batch endpoint. Queries of a batch run on up to
+# `BATCH_WORKERS` threads at once, each holding a pooled connection.
+BATCH_MAX_QUERIES = 50
+BATCH_WORKERS = 2
+
+# Settings for serving query endpoints asynchronously (see app/asgi.py).
+# Requests are prepared and looked up in the cache on the event loop, once the
+# table statistics and the partition registry read to init controllers have
+# been loaded for the current data version on `ASGI_PREPARE_WORKERS` threads.
+# Queries are executed on `ASGI_EXECUTOR_WORKERS` other threads, so the event
+# loop never reads the sales database and cache hits never wait behind slow
+# queries, nor hand over to a thread. Each of those threads holds at most one
+# pooled connection at a time, so the pool is split between them and the
+# threads of the batch endpoint. Requests waiting for a thread beyond
+# `ASGI_MAX_PENDING` are rejected with 503.
+ASGI_PREPARE_WORKERS = 1
+ASGI_EXECUTOR_WORKERS = SQLITE_POOL_SIZE - ASGI_PREPARE_WORKERS - BATCH_WORKERS
+ASGI_MAX_PENDING = 64
+
+# Pragmas applied in order to every pooled connection. `journal_mode` must come
+# before `query_only` since switching to WAL requires writing to the database.
+SQLITE_READ_PRAGMAS = {
+    'journal_mode': 'WAL',  # readers don't block and aren't blocked by writers
+    'mmap_size': 256 * 1024 * 1024,  # bytes of database file mapped in memory
+    'cache_size': -64 * 1024,  # page cache size in KiB when negative
+    'query_only': 1,  # pooled connections are used for reading only
+}
+
+# Number of compiled statements cached by each pooled connection. Controllers
+# bind parameters instead of embedding values into their queries, so repeated
+# queries of the same shape reuse compiled statements from this cache.
+SQLITE_CACHED_STATEMENTS = 256
+
+# Maximum number of statement shapes recorded by each worker for the index
+# advisor (see `GET /workload` and `index_advisor.py`)
+WORKLOAD_MAX_STATEMENTS = 1000
+
+# Compression of responses by gzip for clients that accept it. Responses
+# smaller than `GZIP_MIN_SIZE` bytes are sent as is, unless they are streamed.
+GZIP_LEVEL = 6
+GZIP_MIN_SIZE = 1024
+
+# Number of rows fetched from the cursor at a time when streaming responses
+STREAM_FETCH_SIZE = 1000
+
+# Number of results per page when a cursor is given without page size
+DEFAULT_PAGE_SIZE = 100
+
 # Which year in the ingested dataset is treated as current year? If not
 # specifying, it is calculated using current time.
 CURRENT_YEAR_CONTEXT = 2025
 
+# Period of the tables partitioning sales, either `year` or `month`. Partition
+# tables are created by ingestion for each period that sales are made in, and
+# must be rebuilt (`ingest.py --rebuild-rollups`) after changing this setting.
+SALES_PARTITION_PERIOD = 'year'
+
+# Number of products kept by each sketch of top products, which answers top
+# products with `approximate=true`. The revenue of a product is overestimated by
+# at most the revenue of the date range divided by this capacity. Sketches must
+# be rebuilt (`ingest.py --rebuild-rollups`) after changing this setting.
+PRODUCT_SKETCH_CAPACITY = 100
+
 # Default settings for Flask-Caching
-CACHE_TYPE = 'SimpleCache'  # uses python dict
+CACHE_TYPE = 'app.cache.SQLiteCache'  # shared by all worker processes on the host
 CACHE_DEFAULT_TIMEOUT = 60  # seconds
+CACHE_THRESHOLD = 10000  # maximum number of entries
+CACHE_SQLITE_FILE = os.path.join(BASE_DIR, 'cache.sqlite')
+
+# How long (in seconds) clients may reuse API responses before revalidating them
+# with the ETag, which is answered with 304 as long as the data is unchanged.
+HTTP_CACHE_MAX_AGE = 0
+
+# Absolute path to the file holding the data version, which is bumped by
+# ingestion and invalidates cached results of older versions at once.
+DATA_VERSION_FILE = os.path.join(BASE_DIR, 'data.version')
+
+# Settings of `profile=auto`, which picks the profile estimated to be the
+# cheapest from table statistics, unless latencies observed by the worker tell
+# otherwise. Statistics are gathered by ANALYZE, which ingestion runs once a
+# file is ingested unless `--no-analyze` is given. Without them, tables are
+# sized by their largest rowid and the selectivity of product and region
+# filters is derived from the number of products and regions. Profiles are compared by latency once they have been observed
+# AUTO_PROFILE_MIN_SAMPLES times with parameters of the same shape. To learn
+# latencies, a profile not observed enough yet is tried with a probability of
+# AUTO_PROFILE_EXPLORATION, unless its estimated cost exceeds
+# AUTO_PROFILE_EXPLORATION_COST_RATIO times the cheapest one.
+AUTO_PROFILE_MIN_SAMPLES = 5
+AUTO_PROFILE_EXPLORATION = 0.05
+AUTO_PROFILE_EXPLORATION_COST_RATIO = 10
+
+# Whether clients may request the query plan of their queries with `explain=1`,
+# which reveals SQL statements and the database schema. This should be disabled
+# when being used in production.
+QUERY_EXPLAIN_ENABLED = os.getenv('QUERY_EXPLAIN_ENABLED', default='1') == '1'
 
 # Set a secret key for accessing to self API. This value should be replaced when
 # being used in production.
@@ -0,0 +1,212 @@
+import csv
+import datetime
+import itertools
+import random
+import re
+import time
+from argparse import ArgumentParser, Namespace, ArgumentTypeError
+from typing import List, Iterator, Tuple
+
+import config
+
+# Current year as the app sees it (see `app.models`), read from the settings
+# rather than the app, which would set up the database for nothing
+CURRENT_YEAR = int(getattr(config, 'CURRENT_YEAR_CONTEXT', datetime.date.today().year))
+
+# Names of the sample data, used before numbered names are made up
+SAMPLE_PRODUCTS = [
+    'Rain Jacket', "Children's Book Set", "Genghis Khan's Helmet (Possible)", 'Wireless Mouse', 'Data Science Book',
+    'Desk Chair', 'External SSD', 'Professional Camera', 'Philosophy Book', 'Portable Radio', 'Smart Scale',
+    'Voice Recorder', 'Windbreaker Jacket', 'Running Shorts', 'Sweatpants', 'Beanie (Wool)', 'Belt (Leather)',
+]
+SAMPLE_REGIONS = ['Mid-Atlantic', 'Midwest', 'Mountain', 'Northeast', 'Northwest', 'South', 'Southwest', 'West']
+
+# Suffixes accepted by row counts, e.g. `10M`
+ROW_SUFFIXES = {'': 1, 'K': 1_000, 'M': 1_000_000, 'B': 1_000_000_000}
+
+
+def row_count(value: str) -> int:
+    """Parses a row count with an optional K/M/B suffix, e.g. `100M`."""
+    match = re.fullmatch(r'(\d+)([KMB]?)', value.strip().upper())
+    if not match or not int(match[1]):
+        raise ArgumentTypeError(f'invalid row count {value!r}')
+    return int(match[1]) * ROW_SUFFIXES[match[2]]
+
+
+def make_names(samples: List[str], prefix: str, count: int) -> List[str]:
+    """Returns `count` unique names, taking sample names first."""
+    return samples[:count] + [f'{prefix} #{i:06d}' for i in range(len(samples) + 1, count + 1)]
+
+
+def zipf_weights(count: int, skew: float) -> List[float]:
+    """
+    Returns cumulative weights of a Zipf distribution over `count` ranks, where
+    rank `k` is picked with a probability proportional to `1 / k ** skew`. A
+    skew of 0 means uniform popularity.
+    """
+    return list(itertools.accumulate(1 / k ** skew for k in range(1, count + 1)))
+
+
+def generate_rows(rows: int, seed: int, products: int, regions: int, skew: float, region_skew: float,
+                  start_date: datetime.date, end_date: datetime.date,
+                  batch_size: int = 100_000) -> Iterator[List[Tuple[str, str, str, str]]]:
+    """
+    Lazily generates batches of `(date, product_name, revenue, region_name)`
+    rows. Sales are spread evenly over the days between `start_date` and
+    `end_date` in chronological order, while products and regions are picked by
+    Zipf-distributed popularity. The same arguments always generate the same
+    rows.
+
+    :param rows:            Number of rows to generate
+    :param seed:            Seed of the random generator
+    :param products:        Number of distinct products
+    :param regions:         Number of distinct regions
+    :param skew:            Zipf exponent of product popularity
+    :param region_skew:     Zipf exponent of region popularity
+    :param start_date:      Date of the first sales
+    :param end_date:        Date of the last sales
+    :param batch_size:      Number of rows per batch
+    """
+    rng = random.Random(seed)
+
+    # Shuffle names so that popularity ranks are unrelated to name order
+    product_names = make_names(SAMPLE_PRODUCTS, 'Product', products)
+    region_names = make_names(SAMPLE_REGIONS, 'Region', regions)
+    rng.shuffle(product_names)
+    rng.shuffle(region_names)
+    product_weights = zipf_weights(products, skew)
+    region_weights = zipf_weights(regions, region_skew)
+
+    # Each product has its own unit price, sold in small quantities
+    prices = [round(rng.lognormvariate(3.5, 1.0), 2) for _ in range(products)]
+    quantities, quantity_weights = (1, 2, 3, 4, 5), (60, 20, 10, 6, 4)
+    product_indexes = range(products)
+
+    days = (end_date - start_date).days + 1
+    dates = [(start_date + datetime.timedelta(days=i)).isoformat() for i in range(days)]
+
+    for start in range(0, rows, batch_size):
+        size = min(batch_size, rows - start)
+        picked = rng.choices(product_indexes, cum_weights=product_weights, k=size)
+        batch = list(zip(
+            [dates[i * days // rows] for i in range(start, start + size)],
+            [product_names[i] for i in picked],
+            [f'{prices[i] * q:.2f}' for i, q in zip(picked, rng.choices(quantities, quantity_weights, k=size))],
+            rng.choices(region_names, cum_weights=region_weights, k=size),
+        ))
+        yield batch
+
+
+def generate_file(csv_file: str, rows: int, has_header: bool = True, **kwargs) -> int:
+    """
+    Writes generated rows to a CSV file that can be ingested by `ingest.py`,
+    and returns the number of rows written. See `generate_rows` for `kwargs`.
+
+    :param csv_file:        Path to CSV file
+    :param rows:            Number of rows to generate
+    :param has_header:      Whether to write a header row
+    """
+    total = 0
+    with open(csv_file, 'w', newline='', encoding='utf-8') as fp:
+        writer = csv.writer(fp)
+        if has_header:
+            writer.writerow(['SaleDate', 'ProductName', 'Revenue', 'SaleRegion'])
+        for batch in generate_rows(rows, **kwargs):
+            writer.writerows(batch)
+            total += len(batch)
+    return total
+
+
+def get_args() -> Namespace:
+    """Read arguments from command line."""
+
+    parser = ArgumentParser(
+        description='Generate synthetic sales data as CSV file to ingest'
+    )
+    parser.add_argument(
+        '--rows',
+        metavar='N',
+        type=row_count,
+        default='1M',
+        help='Number of rows, with optional K/M/B suffix, e.g. 10M (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--csv-file',
+        metavar='FILE',
+        help='CSV file to write (default: sales-data-<rows>.csv)'
+    )
+    parser.add_argument(
+        '--no-header',
+        action='store_true',
+        help='Whether to write no header row'
+    )
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=0,
+        help='Seed of the random generator (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--products',
+        metavar='N',
+        type=int,
+        default=1000,
+        help='Number of distinct products (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--regions',
+        metavar='N',
+        type=int,
+        default=50,
+        help='Number of distinct regions (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--skew',
+        type=float,
+        default=1.1,
+        help='Zipf exponent of product popularity, 0 for uniform (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--region-skew',
+        type=float,
+        default=0.5,
+        help='Zipf exponent of region popularity, 0 for uniform (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--years',
+        metavar='N',
+        type=int,
+        default=3,
+        help=f'Number of years spanned by sales, ending with {CURRENT_YEAR} (default: %(default)s)'
+    )
+    args = parser.parse_args()
+    if args.products < 1 or args.regions < 1 or args.years < 1:
+        parser.error('--products, --regions and --years must be positive')
+    return args
+
+
+def main():
+    args = get_args()
+    csv_file = args.csv_file or f'sales-data-{args.rows}.csv'
+    started = time.perf_counter()
+    total = generate_file(
+        csv_file=csv_file,
+        rows=args.rows,
+        has_header=not args.no_header,
+        seed=args.seed,
+        products=args.products,
+        regions=args.regions,
+        skew=args.skew,
+        region_skew=args.region_skew,
+        start_date=datetime.date(CURRENT_YEAR - args.years + 1, 1, 1),
+        end_date=datetime.date(CURRENT_YEAR, 12, 31),
+    )
+    elapsed = time.perf_counter() - started
+    print(f'Generated {total} rows to {csv_file!r} in {elapsed:.2f}s ({total / elapsed:.0f} rows/s)')
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        pass
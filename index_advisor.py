@@ -0,0 +1,262 @@
+import json
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser, ArgumentTypeError, Namespace
+from contextlib import closing
+from typing import Any, Dict, Iterator, List, Tuple
+
+from app import app
+from app.controllers import _workload
+from app.utils import measure
+from benchmark import CONTROLLER_PARAMS
+
+# An index as `(table, columns)`
+Index = Tuple[str, Tuple[str, ...]]
+
+
+def parse_index(value: str) -> Index:
+    """Parses an index written as `table(column, ...)`."""
+    match = re.fullmatch(r'\s*(\w+)\s*\(([\w\s,]+)\)\s*', value)
+    columns = tuple(column.strip() for column in match[2].split(',')) if match else ()
+    if not columns or not all(columns):
+        raise ArgumentTypeError(f'invalid index {value!r}, expected table(column, ...)')
+    return match[1], columns
+
+
+def format_index(index: Index) -> str:
+    """Returns an index written as `table(column, ...)`."""
+    table, columns = index
+    return f'{table}({", ".join(columns)})'
+
+
+def index_name(index: Index) -> str:
+    """Returns the name of an index built by the advisor, e.g. `ix_sales_date_revenue`."""
+    table, columns = index
+    return '_'.join(['ix', table, *columns])
+
+
+def replayed_workload() -> List[Dict[str, Any]]:
+    """
+    Returns the workload recorded by executing every profile of every
+    controller with the parameters of the benchmark, for when no workload
+    recorded by the API is given.
+    """
+    _workload.clear()
+    with app.app_context():
+        for query_class, _, params in CONTROLLER_PARAMS:
+            profiles = len(query_class(profile=1, **params).query_profiles())
+            for profile in range(1, profiles + 1):
+                query_class(profile=profile, **params)()
+    return _workload.shapes()
+
+
+def used_pages(conn: sqlite3.Connection) -> int:
+    """Returns the number of pages of the database that are in use."""
+    (pages,), = conn.execute('PRAGMA page_count').fetchall()
+    (free,), = conn.execute('PRAGMA freelist_count').fetchall()
+    return pages - free
+
+
+def check_index(conn: sqlite3.Connection, index: Index):
+    """
+    Ensures that the table and columns of an index exist, before their names
+    are written into statements.
+    """
+    table, columns = index
+    tables = {name for name, in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    if table not in tables:
+        raise ValueError(f'Table {table!r} does not exist')
+    existing = {name for name, in conn.execute('SELECT name FROM pragma_table_info(?)', (table,))}
+    missing = [column for column in columns if column not in existing]
+    if missing:
+        raise ValueError(f'Table {table!r} has no columns {", ".join(missing)}')
+
+
+def evaluate(db_file: str, workload: List[Dict[str, Any]], iterations: int = 20,
+             warmup: int = 2) -> List[Dict[str, Any]]:
+    """
+    Evaluates the candidate indexes of a workload against a copy of the
+    database, one at a time, and returns for each of them the time spent
+    executing the statements it is a candidate for (weighted by how many
+    times they were executed) without and with the index, the speedup, its
+    size in bytes, its build time, and whether SQLite uses it at all. The
+    best candidates come first.
+
+    :param db_file:       Path to SQLite database file, which is not modified.
+    :param workload:      Statement shapes as recorded by `GET /workload`.
+    :param iterations:    Number of timed executions per statement.
+    :param warmup:        Number of untimed executions per statement.
+    """
+    candidates: Dict[Index, List[Dict[str, Any]]] = {}
+    for shape in workload:
+        for table, columns in shape['candidates']:
+            candidates.setdefault((table, tuple(columns)), []).append(shape)
+
+    report = []
+    with tempfile.TemporaryDirectory() as tmp:
+        copy_file = os.path.join(tmp, os.path.basename(db_file))
+        with closing(sqlite3.connect(db_file)) as source, closing(sqlite3.connect(copy_file)) as conn:
+            source.backup(conn)
+            (page_size,), = conn.execute('PRAGMA page_size').fetchall()
+
+            def latency(shape: Dict[str, Any]) -> float:
+                """Median latency of a statement in milliseconds."""
+                execute = lambda: conn.execute(shape['statement'], shape['args']).fetchall()
+                return measure(execute, iterations=iterations, warmup=warmup)['p50']
+
+            def weighted(latencies: Dict[str, float], shapes: List[Dict[str, Any]]) -> float:
+                """Time spent executing statements as many times as recorded."""
+                return sum(latencies[shape['statement']] * shape['count'] for shape in shapes)
+
+            existing = {name for name, in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+            baseline = {shape['statement']: latency(shape) for shape in workload if shape['candidates']}
+            for index, shapes in candidates.items():
+                name = index_name(index)
+                if name in existing:
+                    continue
+                check_index(conn, index)
+                pages = used_pages(conn)
+                started = time.perf_counter()
+                conn.execute(f'CREATE INDEX {name} ON {index[0]} ({", ".join(index[1])})')
+                conn.commit()
+                build_time = time.perf_counter() - started
+                size = (used_pages(conn) - pages) * page_size
+                plans = [
+                    detail for shape in shapes
+                    for *_, detail in conn.execute(f'EXPLAIN QUERY PLAN {shape["statement"]}', shape['args'])
+                ]
+                latencies = {shape['statement']: latency(shape) for shape in shapes}
+                conn.execute(f'DROP INDEX {name}')
+                conn.commit()
+
+                before, after = weighted(baseline, shapes), weighted(latencies, shapes)
+                report.append({
+                    'index': format_index(index),
+                    'name': name,
+                    'statements': len(shapes),
+                    'executions': sum(shape['count'] for shape in shapes),
+                    'before': round(before, 4),
+                    'after': round(after, 4),
+                    'speedup': round(before / after, 2) if after else None,
+                    'size': size,
+                    'build_time': round(build_time, 4),
+                    'used': any(re.search(rf'\b{name}\b', detail) for detail in plans),
+                })
+    return sorted(report, key=lambda row: (row['used'], row['speedup'] or 0), reverse=True)
+
+
+def build_indexes(db_file: str, indexes: List[Index], timeout: float = 60) -> Iterator[Tuple[Index, float]]:
+    """
+    Builds indexes on the live database, and yields each index with the
+    seconds it took to build. The database is kept in WAL mode, in which
+    readers neither block nor are blocked by the build: they keep reading
+    the last committed version until the index is committed, and prepared
+    statements are replanned on their next execution. Writers (e.g.
+    ingestion) wait for each index to be built, for up to `timeout` seconds.
+    """
+    with closing(sqlite3.connect(db_file, timeout=timeout, isolation_level=None)) as conn:
+        (mode,), = conn.execute('PRAGMA journal_mode = WAL').fetchall()
+        if mode.lower() != 'wal':
+            raise RuntimeError(f'Database is in {mode} mode, in which building indexes blocks readers')
+        for index in indexes:
+            check_index(conn, index)
+            started = time.perf_counter()
+            conn.execute(f'CREATE INDEX IF NOT EXISTS {index_name(index)} ON {index[0]} ({", ".join(index[1])})')
+            yield index, time.perf_counter() - started
+
+
+def get_args() -> Namespace:
+    """Read arguments from command line."""
+
+    parser = ArgumentParser(
+        description='Evaluate candidate indexes against the workload of the controllers, and build the chosen ones'
+    )
+    parser.add_argument(
+        '--workload',
+        metavar='FILE',
+        help='Workload saved from GET /workload (default: replay the benchmark parameters on every profile)'
+    )
+    parser.add_argument(
+        '--iterations',
+        metavar='N',
+        type=int,
+        default=20,
+        help='Number of timed executions per statement (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--warmup',
+        metavar='N',
+        type=int,
+        default=2,
+        help='Number of untimed executions per statement before timing (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--min-speedup',
+        metavar='RATIO',
+        type=float,
+        default=1.2,
+        help='Speedup from which a used index is recommended (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--output',
+        metavar='FILE',
+        help='Write the report as JSON to FILE'
+    )
+    parser.add_argument(
+        '--build',
+        metavar='INDEX',
+        type=parse_index,
+        action='append',
+        default=[],
+        help='Build INDEX written as "table(column, ...)" on the database without evaluating, can be repeated'
+    )
+    parser.add_argument(
+        '--build-recommended',
+        action='store_true',
+        help='Build the recommended indexes on the database after evaluating'
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+    db_file = app.config['DATABASE_FILE']
+    indexes = args.build
+
+    if not indexes:
+        if args.workload:
+            with open(args.workload) as fp:
+                workload = json.load(fp)
+        else:
+            workload = replayed_workload()
+        report = evaluate(db_file, workload, iterations=args.iterations, warmup=args.warmup)
+        for row in report:
+            row['recommended'] = row['used'] and (row['speedup'] or 0) >= args.min_speedup
+            print(
+                f'{"*" if row["recommended"] else " "} {row["index"]:<70} {row["speedup"] or 0:>7.2f}x  '
+                f'{row["before"]:>9.3f}ms -> {row["after"]:>9.3f}ms  {row["size"] / 1024:>10.1f}KiB  '
+                f'{"used" if row["used"] else "unused"}'
+            )
+        if args.output:
+            with open(args.output, 'w') as fp:
+                json.dump(report, fp, indent=2)
+            print(f'Report written to {args.output!r}')
+        if args.build_recommended:
+            indexes = [parse_index(row['index']) for row in report if row['recommended']]
+
+    for index, elapsed in build_indexes(db_file, indexes):
+        print(f'Built {index_name(index)} on {format_index(index)} in {elapsed:.2f}s')
+
+
+if __name__ == '__main__':
+    try:
+        sys.exit(main())
+    except (ValueError, FileNotFoundError, RuntimeError) as e:
+        print(e, file=sys.stderr)
+        sys.exit(2)
+    except KeyboardInterrupt:
+        pass
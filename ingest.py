@@ -1,13 +1,17 @@
 import os
 import csv
 import sys
+import time
 from argparse import ArgumentParser, Namespace
 from datetime import datetime
 from dataclasses import dataclass, field, InitVar
-from typing import List
+from typing import List, Dict, Type, Iterator, Tuple, Callable, Any
+
+from sqlalchemy import func, insert, select, text
 
 from app import app
-from app.models import db, Sale, Product, Region
+from app.models import db, Sale, Product, Region, IngestCheckpoint, RollupUtils, SalePartition
+from app.utils import DataVersion
 
 
 class CsvData:
@@ -45,60 +49,240 @@ class CsvData:
             self.sale_region = region
 
     @classmethod
-    def from_file(cls, csv_file: str, has_header: bool) -> 'CsvData':
+    def iter_rows(cls, csv_file: str, has_header: bool, offset: int = 0,
+                  line: int = 0) -> Iterator[Tuple[RowData, int, int]]:
         """
-        Construct object by reading from a CSV file.
+        Lazily parses rows of a CSV file. Each parsed row is yielded together
+        with the byte offset and the line number right after it, which can be
+        used later to resume reading from that position.
 
         :param csv_file:        Path to CSV file
         :param has_header:      Whether the CSV file has a header row
+        :param offset:          Byte offset to start reading from
+        :param line:            Number of lines already read before `offset`
         """
 
         if not os.path.isfile(csv_file):
             raise FileNotFoundError(f'File {csv_file!r} not found')
 
-        rows = []
-        with open(csv_file, newline='') as fp:
-            for idx, row in enumerate(csv.reader(fp)):
-                if has_header and idx == 0:
+        position = [offset, line]
+
+        def read_lines(fp) -> Iterator[str]:
+            """Yields decoded lines while keeping track of their positions."""
+            for raw in iter(fp.readline, b''):
+                position[0] += len(raw)
+                position[1] += 1
+                yield raw.decode('utf-8-sig' if position[1] == 1 else 'utf-8')
+
+        with open(csv_file, 'rb') as fp:
+            fp.seek(offset)
+            for row in csv.reader(read_lines(fp)):
+                if has_header and position[1] == 1:
                     continue  # skip header
                 try:
-                    rows.append(cls.RowData(csv_row=row))
+                    data = cls.RowData(csv_row=row)
                 except ValueError as e:
-                    raise ValueError(f'File {csv_file!r} has invalid row data at line {idx+1}: {e}')
+                    raise ValueError(f'File {csv_file!r} has invalid row data at line {position[1]}: {e}')
+                yield data, *position
+
+    @classmethod
+    def iter_chunks(cls, csv_file: str, has_header: bool, chunk_size: int, offset: int = 0,
+                    line: int = 0) -> Iterator['CsvData']:
+        """
+        Lazily reads a CSV file in chunks of at most `chunk_size` rows, so that
+        no more than one chunk is held in memory at a time. Each chunk carries
+        the position right after its last row in `offset` and `line`.
+
+        :param csv_file:        Path to CSV file
+        :param has_header:      Whether the CSV file has a header row
+        :param chunk_size:      Maximum number of rows per chunk
+        :param offset:          Byte offset to start reading from
+        :param line:            Number of lines already read before `offset`
+        """
+        chunk = cls([], offset, line)
+        for row, chunk.offset, chunk.line in cls.iter_rows(csv_file, has_header, offset, line):
+            chunk.rows.append(row)
+            if len(chunk.rows) >= chunk_size:
+                yield chunk
+                chunk = cls([], chunk.offset, chunk.line)
+        if chunk:
+            yield chunk
+
+    @classmethod
+    def from_file(cls, csv_file: str, has_header: bool) -> 'CsvData':
+        """
+        Construct object by reading the whole content of a CSV file.
 
-        return cls(rows)
+        :param csv_file:        Path to CSV file
+        :param has_header:      Whether the CSV file has a header row
+        """
+        data = cls([])
+        for row, data.offset, data.line in cls.iter_rows(csv_file, has_header):
+            data.rows.append(row)
+        return data
 
-    def __init__(self, rows: List[RowData]):
+    def __init__(self, rows: List[RowData], offset: int = 0, line: int = 0):
         self.rows = rows
+        self.offset = offset
+        self.line = line
 
     def __iter__(self):
         return iter(self.rows)
 
+    def __len__(self):
+        return len(self.rows)
+
     def __bool__(self):
         return bool(self.rows)
 
 
-def ingest(data: CsvData):
-    """Method for ingesting CsvData into database."""
+def ingest(data: CsvData) -> List[Dict[str, Any]]:
+    """
+    Method for ingesting CsvData into database through ORM models, returns
+    field values of the created sale records. Objects are only flushed,
+    committing them is left to the caller.
+    """
     # Exit if data is empty
     assert data, 'No data to ingest'
 
+    sales = []
+
     # Start ingesting data
     for row in data:
         # Get or create region if not existed
-        region, created = Region.get_or_create(name=row.sale_region)
+        region, created = Region.get_or_create(name=row.sale_region, commit=False)
         if created:
             print(f'Created {region!r}')
 
         # Get or create product if not existed
-        product, created = Product.get_or_create(name=row.product_name)
+        product, created = Product.get_or_create(name=row.product_name, commit=False)
         if created:
             print(f'Created {product!r}')
 
         # Created sale
-        sale = Sale.new(row.sale_date, product, row.revenue, region)
+        sale = Sale.new(row.sale_date, product, row.revenue, region, commit=False)
+        sales.append(dict(id=sale.id, **Sale.row_values(row.sale_date, product.id, region.id, row.revenue)))
         print(f'Created {sale!r}')
 
+    return sales
+
+
+class BulkIngest:
+    """
+    Callable for ingesting CsvData into database in bulk mode. Product and
+    region ids are resolved once through in-memory lookups kept across calls,
+    and sale records are inserted into `sales` with `executemany` instead of
+    going through the ORM object by object. Calls return field values of the
+    inserted sale records with their ids, committing them is left to the
+    caller.
+    """
+
+    def __init__(self):
+        # Preload ids of existing regions and products
+        self.lookups: Dict[Type[db.Model], Dict[str, int]] = {
+            model: dict(db.session.execute(select(model.name, model.id)).all())
+            for model in (Region, Product)
+        }
+
+    def resolve(self, model: Type[db.Model], name: str) -> int:
+        """Returns id of the object named `name`, creates one if not existed."""
+        ids = self.lookups[model]
+        if name not in ids:
+            result = db.session.execute(insert(model.__table__).values(name=name))
+            ids[name] = result.inserted_primary_key[0]
+            print(f'Created <{model.__name__} {name!r}>')
+        return ids[name]
+
+    def __call__(self, data: CsvData) -> List[Dict[str, Any]]:
+        # Exit if data is empty
+        assert data, 'No data to ingest'
+
+        # Assign ids up front, so that copies of sales share them
+        next_id = (db.session.execute(select(func.max(Sale.id))).scalar() or 0) + 1
+
+        sales = []
+        for sale_id, row in enumerate(data, start=next_id):
+            region_id = self.resolve(Region, row.sale_region)
+            product_id = self.resolve(Product, row.product_name)
+            sales.append(dict(id=sale_id, **Sale.row_values(row.sale_date, product_id, region_id, row.revenue)))
+
+        # Write all records of the chunk at once
+        db.session.execute(insert(Sale.__table__), sales)
+        return sales
+
+
+def analyze_tables():
+    """
+    Gathers statistics of all tables and indexes into `sqlite_stat1`, which
+    the query planner chooses indexes by and `profile=auto` estimates the
+    costs of profiles from.
+    """
+    db.session.execute(text('ANALYZE'))
+    db.session.commit()
+
+
+def ingest_file(csv_file: str, has_header: bool, writer: Callable[[CsvData], List[Dict[str, Any]]],
+                chunk_size: int = 50000, restart: bool = False, analyze: bool = True) -> int:
+    """
+    Streams a CSV file into database chunk by chunk and returns the number of
+    ingested rows. Each chunk is committed in one transaction together with
+    its copies in partitions, the updates of summary tables and a checkpoint
+    of its byte offset, so that an interrupted ingestion of the same file
+    resumes right after the last committed chunk. The data version is bumped
+    after every committed chunk, and once more after tables are analyzed.
+
+    :param csv_file:      Path to CSV file
+    :param has_header:    Whether the CSV file has a header row
+    :param writer:        Method that writes a chunk of CsvData to database
+                          and returns field values of the created sales
+    :param chunk_size:    Number of rows written per transaction
+    :param restart:       Whether to ignore any existing checkpoint
+    :param analyze:       Whether to analyze tables once the file is ingested
+    """
+    if not os.path.isfile(csv_file):
+        raise FileNotFoundError(f'File {csv_file!r} not found')
+
+    # Load checkpoint of the file. A file changed after some of its rows were
+    # committed is only ingested again from the beginning if asked to, since
+    # those rows would be duplicated.
+    stat = os.stat(csv_file)
+    checkpoint, created = IngestCheckpoint.get_or_create(
+        source=os.path.abspath(csv_file),
+        defaults=dict(file_size=stat.st_size, file_mtime=stat.st_mtime_ns),
+        commit=False,
+    )
+    if restart:
+        checkpoint.reset(stat)
+    elif not checkpoint.matches(stat):
+        if checkpoint.offset:
+            raise AssertionError(f'File {csv_file!r} has changed since it was ingested up to line {checkpoint.line}, '
+                                 f'use --restart to ingest it again from the beginning')
+        checkpoint.reset(stat)
+    elif checkpoint.completed:
+        raise AssertionError(f'File {csv_file!r} was already ingested, use --restart to ingest it again')
+    elif checkpoint.offset:
+        print(f'Resuming from line {checkpoint.line + 1} (byte offset {checkpoint.offset})')
+
+    total = 0
+    data_version = DataVersion(app.config['DATA_VERSION_FILE'])
+    chunks = CsvData.iter_chunks(csv_file, has_header, chunk_size, checkpoint.offset, checkpoint.line)
+    for chunk in chunks:
+        sales = writer(chunk)
+        SalePartition.accumulate(sales)
+        RollupUtils.accumulate_all(sales)
+        checkpoint.offset, checkpoint.line = chunk.offset, chunk.line
+        db.session.commit()
+        data_version.bump()
+        total += len(chunk)
+
+    # Mark the file as completed even if its last lines hold no rows
+    checkpoint.offset = stat.st_size
+    db.session.commit()
+    if analyze:
+        analyze_tables()
+        data_version.bump()
+    return total
+
 
 def get_args() -> Namespace:
     """Read arguments from command line."""
@@ -117,15 +301,61 @@ def get_args() -> Namespace:
         action='store_true',
         help='Whether CSV file has no header'
     )
+    parser.add_argument(
+        '--bulk',
+        action='store_true',
+        help='Ingest in bulk mode with batched inserts instead of per-row ORM objects'
+    )
+    parser.add_argument(
+        '--batch-size',
+        metavar='N',
+        type=int,
+        default=50000,
+        help='Number of rows read and written per transaction (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--restart',
+        action='store_true',
+        help='Ingest the file from the beginning even if a checkpoint exists, duplicating rows already ingested'
+    )
+    parser.add_argument(
+        '--no-analyze',
+        action='store_true',
+        help='Skip analyzing tables once ingested, which takes a full scan of every index'
+    )
+    parser.add_argument(
+        '--rebuild-rollups',
+        action='store_true',
+        help='Recompute all summary tables and partitions of sales from ingested sales, then exit'
+    )
     return parser.parse_args()
 
 
 def main():
     args = get_args()
-    data = CsvData.from_file(csv_file=args.csv_file, has_header=not args.no_header)
     with app.app_context():
         db.create_all()
-        ingest(data)
+        if args.rebuild_rollups:
+            SalePartition.rebuild()
+            RollupUtils.rebuild_all()
+            db.session.commit()
+            if not args.no_analyze:
+                analyze_tables()
+            DataVersion(app.config['DATA_VERSION_FILE']).bump()
+            print('Rebuilt', ', '.join(model.__tablename__ for model in [SalePartition, *RollupUtils.rollups]))
+            return
+        started = time.perf_counter()
+        total = ingest_file(
+            csv_file=args.csv_file,
+            has_header=not args.no_header,
+            writer=BulkIngest() if args.bulk else ingest,
+            chunk_size=args.batch_size,
+            restart=args.restart,
+            analyze=not args.no_analyze,
+        )
+        elapsed = time.perf_counter() - started
+    assert total, 'No data to ingest'
+    print(f'Ingested {total} rows in {elapsed:.2f}s ({total / elapsed:.0f} rows/s)')
 
 
 if __name__ == '__main__':
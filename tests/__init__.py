@@ -1,11 +1,12 @@
 import json
-import timeit
+import time
 import unittest
-from functools import partial
 from typing import Callable
 from urllib.parse import urlencode
 
 from app import app
+from app.controllers import _cache
+from app.utils import measure
 
 
 class BaseTest(unittest.TestCase):
@@ -21,13 +22,26 @@ class ControllerTest(BaseTest):
     def setUp(self):
         super().setUp()
         self.total_attempts = 200
+        self.warmup_attempts = 10
+
+    def measure(self, func: Callable, number: int = None) -> float:
+        """
+        Executes the input `func` a number of times (default: `total_attempts`)
+        and returns the total elapsed time in milliseconds.
+        """
+        return measure(func, iterations=number or self.total_attempts, warmup=0)['total']
 
     def time(self, func: Callable):
         """
-        Executes the input `func` and prints out its elapsed time in milliseconds.
+        Executes the input `func` after warming up, and prints out its total
+        elapsed time and latency percentiles in milliseconds.
         """
-        elapsed = timeit.timeit(func, number=self.total_attempts) * 1000
-        print(f'elapsed {elapsed:.2f}ms')
+        stats = measure(func, iterations=self.total_attempts, warmup=self.warmup_attempts)
+        print(
+            f'elapsed {stats["total"]:.2f}ms',
+            f'p50 {stats["p50"]:.3f}ms', f'p95 {stats["p95"]:.3f}ms', f'p99 {stats["p99"]:.3f}ms',
+            sep=' | ',
+        )
 
 
 class ApiTest(BaseTest):
@@ -57,9 +71,9 @@ class ApiTest(BaseTest):
 
     def time_get(self, endpoint, params=None, headers=None):
         """Returns elapsed time in milliseconds for a GET request."""
-        request = partial(self.get, endpoint, params=params, headers=headers)
-        elapsed = timeit.timeit(request, number=1) * 1000
-        return elapsed
+        started = time.perf_counter()
+        self.get(endpoint, params=params, headers=headers)
+        return (time.perf_counter() - started) * 1000
 
     def describe_cache_time(self, endpoint, params=None, headers=None, expect_threshold=None):
         """
@@ -69,6 +83,8 @@ class ApiTest(BaseTest):
         # Insert cache param
         params = params or {}
         params['cache'] = 1
+        # Start from a cold cache, which is shared with other processes
+        _cache.clear()
         # Time first and second requests
         e1, e2 = [self.time_get(endpoint, headers=headers, params=params) for _ in range(2)]
         # Ensures second request takes less time than the first one
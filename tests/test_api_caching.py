@@ -1,3 +1,4 @@
+from app.controllers import MonthlySalesQuery, _cache, _data_version
 from tests import ApiTest
 
 
@@ -13,3 +14,27 @@ class ApiCaching(ApiTest):
 
     def test_top_products(self):
         self.describe_cache_time('/sales/top-products/')
+
+    def test_changed_during_execution(self):
+        """
+        Test API caching: results of a query executed while data changed are
+        not cached under the new data version.
+        """
+        _cache.clear()
+        query = MonthlySalesQuery(cache=True)
+        execute = query.execute
+
+        def execute_and_change():
+            rows = execute()
+            _data_version.bump()
+            return rows
+
+        query.execute = execute_and_change
+        query()
+        self.assertEqual(query.cache_status, 'miss')
+        again = MonthlySalesQuery(cache=True)
+        again()
+        self.assertEqual(again.cache_status, 'miss')
+        cached = MonthlySalesQuery(cache=True)
+        cached()
+        self.assertEqual(cached.cache_status, 'hit')
@@ -0,0 +1,65 @@
+from unittest import mock
+
+from app.controllers import FilteredSalesQuery, _data_version, _pool
+from tests import ApiTest
+
+
+class ApiConditionalGet(ApiTest):
+    """Tests ETag and conditional GET support on all available endpoints."""
+
+    def request(self, endpoint, etag=None, params=None):
+        headers = {'X-Api-Key': 'testing'}
+        if etag:
+            headers['If-None-Match'] = etag
+        return self.client.get(endpoint, headers=headers, query_string=params)
+
+    def describe_conditional_get(self, endpoint, params=None):
+        # First request returns full response with ETag
+        response = self.request(endpoint, params=params)
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['ETag']
+        self.assertIn('must-revalidate', response.headers['Cache-Control'])
+
+        # Revalidating returns 304 without touching SQLite
+        acquired = _pool.stats()['acquired']
+        response = self.request(endpoint, etag=etag, params=params)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.get_data(), b'')
+        self.assertEqual(response.headers['ETag'], etag)
+        self.assertEqual(_pool.stats()['acquired'], acquired)
+
+        # Other parameters have another ETag
+        response = self.request(endpoint, etag=etag, params={**(params or {}), 'profile': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+        # Changing data invalidates the ETag
+        _data_version.bump()
+        response = self.request(endpoint, etag=etag, params=params)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_filter_sales(self):
+        self.describe_conditional_get('/sales/', params={'start_date': '2025-01-01', 'end_date': '2025-01-31'})
+
+    def test_monthly_sales(self):
+        self.describe_conditional_get('/sales/monthly-revenue/')
+
+    def test_top_products(self):
+        self.describe_conditional_get('/sales/top-products/', params={'limit': 3})
+
+    def test_auto_profile(self):
+        """
+        Test conditional GET: the ETag of `profile=auto` doesn't change with
+        the profile chosen, e.g. when another one is explored.
+        """
+        params = {'profile': 'auto', 'start_date': '2025-01-01', 'end_date': '2025-01-31'}
+        etags = set()
+        for profile in (2, 4):
+            with mock.patch.object(FilteredSalesQuery, 'choose_profile', return_value=profile):
+                response = self.request('/sales/', params=params)
+            self.assertEqual(response.headers['X-Query-Profile'], str(profile))
+            etags.add(response.headers['ETag'])
+        self.assertEqual(len(etags), 1)
+        with mock.patch.object(FilteredSalesQuery, 'choose_profile', return_value=3):
+            self.assertEqual(self.request('/sales/', etag=etags.pop(), params=params).status_code, 304)
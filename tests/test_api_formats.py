@@ -0,0 +1,114 @@
+import csv
+import gzip
+import io
+import json
+
+from app.formats import BinaryFormat
+from tests import ApiTest
+
+
+class ApiFormats(ApiTest):
+    """Tests negotiating the format and the compression of results."""
+
+    params = {'start_date': '2025-01-01', 'end_date': '2025-03-31'}
+
+    def request(self, endpoint='/sales/', params=None, headers=None):
+        response = self.client.get(endpoint, query_string={**self.params, **(params or {})},
+                                   headers={'X-Api-Key': 'testing', **(headers or {})})
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def expected_rows(self, endpoint='/sales/'):
+        """Returns results as JSON records turned into rows, with their columns."""
+        records = self.request(endpoint).get_json()
+        columns = list(records[0])
+        return columns, [tuple(record[column] for column in columns) for record in records]
+
+    def assertRows(self, columns, rows, expected_columns, expected_rows):
+        # Columns may come in another order than keys of JSON records
+        order = [columns.index(column) for column in expected_columns]
+        self.assertEqual(sorted(columns), sorted(expected_columns))
+        self.assertEqual([tuple(row[i] for i in order) for row in rows], expected_rows)
+
+    def test_columnar(self):
+        expected = self.expected_rows()
+        response = self.request(params={'format': 'columnar'})
+        self.assertEqual(response.mimetype, 'application/vnd.columnar+json')
+        body = response.get_json(force=True)
+        self.assertRows(body['columns'], [tuple(row) for row in body['rows']], *expected)
+        # Rows don't carry the id of sales used for pagination
+        self.assertEqual(body['columns'], ['sale_date', 'product_name', 'revenue', 'region_name'])
+
+    def test_csv(self):
+        expected = self.expected_rows('/sales/top-products/')
+        response = self.request('/sales/top-products/', params={'format': 'csv'})
+        self.assertEqual(response.mimetype, 'text/csv')
+        header, *rows = csv.reader(io.StringIO(response.get_data(as_text=True)))
+        self.assertEqual(header, ['product_name', 'total_revenue'])
+        self.assertEqual([name for name, _ in rows], [name for name, _ in expected[1]])
+        self.assertEqual([float(revenue) for _, revenue in rows], [revenue for _, revenue in expected[1]])
+
+    def test_binary(self):
+        expected = self.expected_rows()
+        response = self.request(params={'format': 'binary'})
+        self.assertEqual(response.mimetype, 'application/vnd.rows+octet-stream')
+        self.assertRows(*BinaryFormat.loads(response.get_data()), *expected)
+        # Smaller than JSON records
+        self.assertLess(len(response.get_data()), len(self.request().get_data()) / 2)
+
+    def test_binary_encoding(self):
+        rows = [('a', 1, 1.5, None), ('b' * 300, -2 ** 40, -0.25, 'a'), ('a', 2 ** 31, 0.0, 'é')]
+        data = BinaryFormat().dumps(['s', 'i', 'd', 'n'], rows)
+        self.assertEqual(BinaryFormat.loads(data), (['s', 'i', 'd', 'n'], rows))
+        self.assertRaises(ValueError, BinaryFormat.loads, b'{}')
+
+    def test_accept(self):
+        response = self.request('/sales/monthly-revenue/', headers={'Accept': 'text/csv;q=0.5, application/vnd.columnar+json'})
+        self.assertEqual(response.mimetype, 'application/vnd.columnar+json')
+        # The parameter wins over the header
+        response = self.request('/sales/monthly-revenue/', params={'format': 'csv'},
+                                headers={'Accept': 'application/vnd.columnar+json'})
+        self.assertEqual(response.mimetype, 'text/csv')
+        # JSON records unless another format is accepted
+        for accept in ('*/*', 'text/html', 'application/json'):
+            response = self.request('/sales/monthly-revenue/', headers={'Accept': accept})
+            self.assertEqual(response.mimetype, 'application/json')
+            self.assertIn('Accept', response.headers['Vary'])
+
+    def test_invalid_format(self):
+        response = self.client.get('/sales/', query_string={'format': 'xml'}, headers={'X-Api-Key': 'testing'})
+        self.assertIn('Invalid argument \\"format=xml\\"', response.get_data(as_text=True))
+
+    def test_gzip(self):
+        for fmt in ('json', 'columnar', 'csv', 'binary'):
+            plain = self.request(params={'format': fmt})
+            compressed = self.request(params={'format': fmt}, headers={'Accept-Encoding': 'gzip, deflate'})
+            self.assertEqual(compressed.headers['Content-Encoding'], 'gzip')
+            self.assertIn('Accept-Encoding', compressed.headers['Vary'])
+            self.assertEqual(gzip.decompress(compressed.get_data()), plain.get_data())
+            self.assertLess(len(compressed.get_data()), len(plain.get_data()))
+            self.assertNotEqual(compressed.headers['ETag'], plain.headers['ETag'])
+
+        # Small responses are not compressed
+        response = self.request('/sales/top-products/', params={'limit': 1}, headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_streamed(self):
+        for fmt in ('json', 'columnar', 'csv', 'binary'):
+            whole = self.request(params={'format': fmt})
+            streamed = self.request(params={'format': fmt, 'stream': 1})
+            if fmt == 'json':
+                self.assertEqual(json.loads(streamed.get_data()), whole.get_json())
+            else:
+                self.assertEqual(streamed.get_data(), whole.get_data())
+            compressed = self.request(params={'format': fmt, 'stream': 1}, headers={'Accept-Encoding': 'gzip'})
+            self.assertEqual(compressed.headers['Content-Encoding'], 'gzip')
+            self.assertEqual(gzip.decompress(compressed.get_data()), streamed.get_data())
+
+    def test_cached_rows(self):
+        # Rows and records are cached apart
+        for fmt in ('columnar', 'columnar', 'json', 'json'):
+            body = self.request(params={'format': fmt, 'cache': 1}).get_data()
+        self.assertEqual(json.loads(body)[0].keys(), {'sale_date', 'product_name', 'revenue', 'region_name'})
+        body = json.loads(self.request(params={'format': 'columnar', 'cache': 1}).get_data())
+        self.assertEqual(len(body['rows'][0]), 4)
@@ -1,3 +1,4 @@
+from app import app
 from tests import ApiTest
 
 
@@ -9,6 +10,41 @@ class ApiFunctionality(ApiTest):
         expected_items = list(filter(lambda i: '2025-01-' in i['sale_date'], returned_items))
         self.assertEqual(len(expected_items), len(returned_items))
 
+    def test_filter_sales_stream(self):
+        params = {'start_date': '2024-01-01', 'end_date': '2025-01-31'}
+        expected_items = self.get('/sales/', params=params)
+        # Stream in many small chunks
+        app.config['STREAM_FETCH_SIZE'], fetch_size = 7, app.config['STREAM_FETCH_SIZE']
+        try:
+            returned_items = self.get('/sales/', params={**params, 'stream': 1})
+        finally:
+            app.config['STREAM_FETCH_SIZE'] = fetch_size
+        self.assertEqual(expected_items, returned_items)
+        self.assertEqual(self.get('/sales/', params={'stream': 1, 'product_name': 'Unknown'}), [])
+
+    def test_filter_sales_pagination(self):
+        params = {'start_date': '2024-06-01', 'end_date': '2025-01-31'}
+        for profile in (1, 2, 3):
+            expected_items = self.get('/sales/', params={**params, 'profile': profile})
+            returned_items, cursor = [], None
+            while True:
+                page_params = {**params, 'profile': profile, 'page_size': 25}
+                if cursor:
+                    page_params['cursor'] = cursor
+                response = self.client.get('/sales/', query_string=page_params, headers={'X-Api-Key': 'testing'})
+                returned_items += response.get_json()
+                cursor = response.headers.get('X-Next-Cursor')
+                if not cursor:
+                    break
+            self.assertCountEqual(expected_items, returned_items)
+            dates = [item['sale_date'] for item in returned_items]
+            self.assertEqual(dates, sorted(dates))
+        for page_size in (0, -1):
+            response = self.client.get('/sales/', query_string={'page_size': page_size},
+                                       headers={'X-Api-Key': 'testing'})
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.get_json(), {'error': 'Page size must be an integer >= 1'})
+
     def test_monthly_sales(self):
         items = self.get('/sales/monthly-revenue/')
         self.assertGreater(len(items), 0)
@@ -17,3 +53,31 @@ class ApiFunctionality(ApiTest):
     def test_top_products(self):
         items = self.get('/sales/top-products/', params={'limit': 3})
         self.assertEqual(len(items), 3)
+
+    def test_top_products_approximate(self):
+        params = {'limit': 3, 'start_date': '2024-03-05', 'end_date': '2025-02-10'}
+        response = self.client.get('/sales/top-products/', query_string={**params, 'approximate': 'true'},
+                                   headers={'X-Api-Key': 'testing'})
+        items = response.get_json()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('X-Revenue-Error-Bound', response.headers)
+        self.assertNotIn('X-Query-Profile', response.headers)
+        self.assertTrue(all(item.keys() == {'product_name', 'total_revenue', 'revenue_error'} for item in items))
+        expected = self.get('/sales/top-products/', params=params)
+        self.assertEqual([item['product_name'] for item in items], [item['product_name'] for item in expected])
+
+    def test_range_revenue(self):
+        params = {'start_date': '2024-06-01', 'end_date': '2025-01-31'}
+        items = self.get('/sales/range-revenue/', params=params)
+        sales = self.get('/sales/', params=params)
+        self.assertEqual(len(items), 1)
+        self.assertAlmostEqual(items[0]['revenue'], sum(item['revenue'] for item in sales), places=2)
+
+    def test_revenue_cube(self):
+        params = {'start_month': '2024-06', 'end_month': '2025-01', 'region_name': 'Mid-Atlantic'}
+        items = self.get('/sales/revenue-cube/', params={'group_by': 'month,product', **params})
+        sales = self.get('/sales/', params={'start_date': '2024-06-01', 'end_date': '2025-01-31',
+                                           'region_name': 'Mid-Atlantic'})
+        self.assertTrue(all(item.keys() == {'year', 'month', 'product_name', 'revenue'} for item in items))
+        self.assertEqual(items, sorted(items, key=lambda item: (item['year'], item['month'], item['product_name'])))
+        self.assertAlmostEqual(sum(item['revenue'] for item in items), sum(item['revenue'] for item in sales), places=2)
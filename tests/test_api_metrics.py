@@ -0,0 +1,73 @@
+import threading
+
+from app.controllers import _cache
+from app.views import _metrics
+from tests import ApiTest
+
+
+class ApiMetrics(ApiTest):
+    """Tests phase timings of requests and the metrics endpoint."""
+
+    def setUp(self):
+        super().setUp()
+        _metrics.clear()
+        _cache.clear()
+
+    def request(self, endpoint, params=None):
+        response = self.client.get(endpoint, headers={'X-Api-Key': 'testing'}, query_string=params)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def server_timing(self, response):
+        metrics = [metric.split(';dur=') for metric in response.headers['Server-Timing'].split(', ')]
+        return {name: float(elapsed) for name, elapsed in metrics}
+
+    def test_server_timing(self):
+        """
+        Test API metrics: phases of executed queries are exposed by the Server-Timing header.
+        """
+        timing = self.server_timing(self.request('/sales/monthly-revenue/', params={'profile': 1}))
+        self.assertEqual(list(timing), ['auth', 'params', 'populate_query', 'execute', 'parse', 'jsonify', 'total'])
+        self.assertGreaterEqual(timing['total'], sum(elapsed for name, elapsed in timing.items() if name != 'total'))
+
+    def test_server_timing_cache(self):
+        """
+        Test API metrics: cache hits skip execution phases.
+        """
+        self.request('/sales/top-products/', params={'cache': 1})
+        timing = self.server_timing(self.request('/sales/top-products/', params={'cache': 1}))
+        self.assertIn('cache', timing)
+        self.assertNotIn('execute', timing)
+
+    def test_metrics(self):
+        """
+        Test API metrics: requests of all threads are counted per endpoint, profile and cache status.
+        """
+        threads = [
+            threading.Thread(target=self.request, args=('/sales/', {'profile': 2}))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.request('/sales/top-products/', params={'cache': 1})
+        self.request('/sales/top-products/', params={'cache': 1})
+        self.request('/sales/top-products/', params={'approximate': 'true', 'profile': 3})
+
+        response = self.request('/metrics')
+        self.assertTrue(response.mimetype.startswith('text/plain'))
+        body = response.get_data(as_text=True)
+        self.assertIn(
+            'query_request_duration_milliseconds_count{endpoint="filter-sales",profile="2",engine="sqlite",cache="off"} 8',
+            body,
+        )
+        self.assertIn(
+            'query_request_duration_milliseconds_count{endpoint="top-products",profile="3",engine="sqlite",cache="hit"} 1',
+            body,
+        )
+        self.assertIn(
+            'query_request_duration_milliseconds_count{endpoint="top-products",profile="",engine="sqlite",cache="off"} 1',
+            body,
+        )
+        self.assertIn('phase="execute"', body)
@@ -0,0 +1,87 @@
+from app.controllers import _cache, _pool
+from tests import ApiTest
+
+
+class ApiBatch(ApiTest):
+    """Tests running many queries in one request by the batch endpoint."""
+
+    def post(self, body, headers=None):
+        return self.client.post('/batch', json=body, headers={'X-Api-Key': 'testing', **(headers or {})})
+
+    def test_same_results(self):
+        specs = [
+            ('monthly-revenue', None, {}, '/sales/monthly-revenue/'),
+            ('top-products', 2, {'limit': 3}, '/sales/top-products/'),
+            ('filter-sales', 2, {'start_date': '2025-01-01', 'end_date': '2025-01-31', 'page_size': 5}, '/sales/'),
+        ]
+        body = [{'controller': name, 'profile': profile, 'params': params} if profile else
+                {'controller': name, 'params': params} for name, profile, params, _ in specs]
+        response = self.post(body)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('execute;dur=', response.headers['Server-Timing'])
+        items = response.get_json()
+        self.assertEqual(len(items), len(specs))
+
+        # Results are the same as those of the endpoints, in the same order
+        for item, (_, profile, params, endpoint) in zip(items, specs):
+            expected = self.client.get(endpoint, headers={'X-Api-Key': 'testing'},
+                                       query_string={**params, **({'profile': profile} if profile else {})})
+            self.assertEqual(item['results'], expected.get_json())
+            self.assertEqual(str(item['meta']['query_profile']), expected.headers['X-Query-Profile'])
+        self.assertIsNotNone(items[2]['meta']['next_cursor'])
+
+    def test_uses_cache(self):
+        _cache.clear()
+        body = [{'controller': 'top-products', 'params': {'limit': 4}}]
+        first = self.post(body).get_json()
+        stats = _cache.cache.stats()
+        self.assertEqual(self.post(body).get_json(), first)
+        self.assertEqual(_cache.cache.stats()['hits'], stats['hits'] + 1)
+
+        # Unless set off per query
+        self.post([{'controller': 'top-products', 'params': {'limit': 4, 'cache': 0}}])
+        self.assertEqual(_cache.cache.stats()['hits'], stats['hits'] + 1)
+
+    def test_errors_per_query(self):
+        items = self.post([
+            {'controller': 'monthly-revenue'},
+            {'controller': 'unknown'},
+            {'controller': 'stats'},
+            {'controller': 'top-products', 'params': {'limit': 'many'}},
+            {'controller': 'filter-sales', 'params': {'stream': 1}},
+            {'controller': 'filter-sales', 'params': ['start_date']},
+        ]).get_json()
+        self.assertIn('results', items[0])
+        self.assertEqual(items[1], {'error': "Unknown controller 'unknown'"})
+        self.assertEqual(items[2], {'error': "Unknown controller 'stats'"})
+        self.assertEqual(items[3], {'error': 'Invalid argument "limit=many"'})
+        self.assertIn('not supported', items[4]['error'])
+        self.assertIn('error', items[5])
+
+    def test_failures_per_query(self):
+        # Queries fail on their own when no connection is available in time
+        specs = [{'controller': 'monthly-revenue', 'params': {'cache': 0}},
+                 {'controller': 'top-products', 'params': {'limit': 3, 'cache': 0}}]
+        self.post(specs)
+        conns = [_pool.acquire() for _ in range(_pool.size)]
+        timeout, _pool.timeout = _pool.timeout, 0.01
+        try:
+            response = self.post([*specs, {'controller': 'unknown'}])
+        finally:
+            _pool.timeout = timeout
+            for conn in conns:
+                _pool.release(conn)
+        self.assertEqual(response.status_code, 200)
+        items = response.get_json()
+        self.assertEqual(items[:2], [{'error': f'No SQLite connection available after {0.01}s'}] * 2)
+        self.assertEqual(items[2], {'error': "Unknown controller 'unknown'"})
+
+    def test_invalid_batch(self):
+        for body in ({'controller': 'monthly-revenue'}, ['monthly-revenue'], None):
+            self.assertEqual(self.post(body).status_code, 400)
+        body = [{'controller': 'monthly-revenue'}] * (self.client.application.config['BATCH_MAX_QUERIES'] + 1)
+        self.assertEqual(self.post(body).status_code, 400)
+        self.assertEqual(self.post([]).get_json(), [])
+
+    def test_authentication(self):
+        self.assertEqual(self.post([], headers={'X-Api-Key': 'invalid'}).status_code, 401)
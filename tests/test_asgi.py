@@ -0,0 +1,211 @@
+import asyncio
+import gzip
+import json
+import threading
+from urllib.parse import urlencode
+
+from app import app
+from app.asgi import application
+from app.controllers import BaseQueryController, FilteredSalesQuery, _cache
+from app.views import _executor, _prepare_executor
+from tests import ApiTest
+
+
+class AsgiTest(ApiTest):
+    """Tests serving the query endpoints by the ASGI entry point."""
+
+    def request(self, endpoint, params=None, headers=None):
+        """Sends a GET request to the ASGI application, and returns its status, headers and body."""
+        headers = {'X-Api-Key': 'testing', **(headers or {})}
+        scope = {
+            'type': 'http',
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': endpoint,
+            'query_string': urlencode(params or {}).encode(),
+            'headers': [(name.lower().encode(), value.encode()) for name, value in headers.items() if value],
+            'server': ('localhost', 80),
+            'client': ('127.0.0.1', 50000),
+        }
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        async def call():
+            await application(scope, receive, send)
+            start, *body = messages
+            headers = {name.decode(): value.decode() for name, value in start['headers']}
+            return start['status'], headers, b''.join(message['body'] for message in body)
+        return call()
+
+    def run_request(self, endpoint, params=None, headers=None):
+        return asyncio.run(self.request(endpoint, params=params, headers=headers))
+
+    def saturate(self, release: threading.Event, executor=_executor):
+        """Occupies every thread of the executor until `release` is set."""
+        return [asyncio.create_task(executor.run(release.wait)) for _ in range(executor.workers)]
+
+    def describe_same_response(self, endpoint, params=None):
+        # Responses are the same as those of the WSGI app
+        expected = self.client.get(endpoint, headers={'X-Api-Key': 'testing'}, query_string=params)
+        status, headers, body = self.run_request(endpoint, params=params)
+        self.assertEqual(status, expected.status_code)
+        self.assertEqual(json.loads(body), expected.get_json())
+        self.assertEqual(headers['etag'], expected.headers['ETag'])
+        self.assertEqual(headers['x-query-profile'], expected.headers['X-Query-Profile'])
+        self.assertIn('total;dur=', headers['server-timing'])
+
+    def test_filter_sales(self):
+        self.describe_same_response('/sales/', params={'start_date': '2025-01-01', 'end_date': '2025-01-31'})
+
+    def test_filter_sales_streamed(self):
+        self.describe_same_response('/sales/', params={'start_date': '2025-01-01', 'end_date': '2025-01-31',
+                                                       'stream': 1})
+
+    def test_monthly_sales(self):
+        self.describe_same_response('/sales/monthly-revenue/')
+
+    def test_top_products(self):
+        self.describe_same_response('/sales/top-products/', params={'limit': 3})
+
+    def test_formats(self):
+        params = {'start_date': '2025-01-01', 'end_date': '2025-01-31'}
+        for stream in (0, 1):
+            for fmt in ('columnar', 'csv', 'binary'):
+                expected = self.client.get('/sales/', query_string={**params, 'format': fmt},
+                                           headers={'X-Api-Key': 'testing', 'Accept-Encoding': 'gzip'})
+                status, headers, body = self.run_request('/sales/', params={**params, 'format': fmt, 'stream': stream},
+                                                         headers={'Accept-Encoding': 'gzip'})
+                self.assertEqual(status, 200)
+                self.assertEqual(headers['content-type'], expected.headers['Content-Type'])
+                self.assertEqual(headers['content-encoding'], 'gzip')
+                self.assertEqual(gzip.decompress(body), gzip.decompress(expected.get_data()))
+
+    def test_not_modified(self):
+        _, headers, _ = self.run_request('/sales/monthly-revenue/')
+        status, _, body = self.run_request('/sales/monthly-revenue/', headers={'If-None-Match': headers['etag']})
+        self.assertEqual(status, 304)
+        self.assertEqual(body, b'')
+
+    def test_authentication(self):
+        status, _, _ = self.run_request('/sales/monthly-revenue/', headers={'X-Api-Key': ''})
+        self.assertEqual(status, 401)
+        status, _, _ = self.run_request('/stats/', headers={'X-Api-Key': 'invalid'})
+        self.assertEqual(status, 401)
+
+    def test_other_endpoints(self):
+        # Endpoints other than queries are served by the WSGI app
+        status, _, body = self.run_request('/stats/')
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body)['executor']['workers'], _executor.workers)
+        status, _, _ = self.run_request('/unknown/')
+        self.assertEqual(status, 404)
+
+    def test_cache_hits_while_saturated(self):
+        params = {'cache': 1, 'limit': 4}
+
+        async def scenario():
+            # Warm up the cache
+            status, _, expected = await self.request('/sales/top-products/', params=params)
+            self.assertEqual(status, 200)
+
+            release = threading.Event()
+            blockers = self.saturate(release)
+            try:
+                await asyncio.sleep(0.05)
+                # Cache hits are answered while every thread is busy
+                status, headers, body = await asyncio.wait_for(
+                    self.request('/sales/top-products/', params=params), timeout=2
+                )
+                self.assertEqual(status, 200)
+                self.assertEqual(body, expected)
+                self.assertIn('cache;dur=', headers['server-timing'])
+
+                # Whereas cache misses wait for a thread
+                miss = asyncio.create_task(self.request('/sales/top-products/', params={'cache': 0, 'limit': 4}))
+                await asyncio.sleep(0.05)
+                self.assertFalse(miss.done())
+            finally:
+                release.set()
+            await asyncio.gather(*blockers)
+            status, _, body = await miss
+            self.assertEqual(status, 200)
+            self.assertEqual(body, expected)
+        asyncio.run(scenario())
+
+    def test_registries_on_threads(self):
+        params = {'profile': 'auto', 'start_date': '2025-01-01', 'end_date': '2025-01-31', 'cache': 1}
+
+        # Exploring another profile would miss the cache of the chosen one
+        exploration, app.config['AUTO_PROFILE_EXPLORATION'] = app.config['AUTO_PROFILE_EXPLORATION'], 0
+        self.addCleanup(app.config.__setitem__, 'AUTO_PROFILE_EXPLORATION', exploration)
+
+        async def scenario():
+            _cache.clear()
+            BaseQueryController._partitions = FilteredSalesQuery._statistics = None
+            release = threading.Event()
+            blockers = self.saturate(release, _prepare_executor)
+            try:
+                # Registries of a new data version are loaded on threads
+                # rather than on the event loop, which keeps running meanwhile
+                request = asyncio.create_task(self.request('/sales/', params=params))
+                await asyncio.sleep(0.05)
+                self.assertFalse(request.done())
+            finally:
+                release.set()
+            await asyncio.gather(*blockers)
+            status, headers, body = await request
+            self.assertEqual(status, 200)
+            self.assertIn('registries;dur=', headers['server-timing'])
+
+            # Once loaded, requests are prepared and answered from cache on
+            # the event loop, without waiting for any thread
+            release.clear()
+            blockers = self.saturate(release, _prepare_executor) + self.saturate(release)
+            try:
+                await asyncio.sleep(0.05)
+                status, headers, cached = await asyncio.wait_for(self.request('/sales/', params=params), timeout=2)
+                self.assertEqual(status, 200)
+                self.assertEqual(cached, body)
+                self.assertNotIn('registries;dur=', headers['server-timing'])
+                self.assertIn('cache;dur=', headers['server-timing'])
+            finally:
+                release.set()
+            await asyncio.gather(*blockers)
+        asyncio.run(scenario())
+
+    def test_rejects_when_overloaded(self):
+        async def scenario():
+            release = threading.Event()
+            blockers = self.saturate(release)
+            max_pending, _executor.max_pending = _executor.max_pending, 0
+            rejected = _executor.stats()['rejected']
+            try:
+                await asyncio.sleep(0.05)
+                status, headers, _ = await self.request('/sales/monthly-revenue/', params={'cache': 0})
+                self.assertEqual(status, 503)
+                self.assertEqual(headers['retry-after'], '1')
+                self.assertEqual(_executor.stats()['rejected'], rejected + 1)
+            finally:
+                _executor.max_pending = max_pending
+                release.set()
+            await asyncio.gather(*blockers)
+        asyncio.run(scenario())
+
+    def test_lifespan(self):
+        messages = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        asyncio.run(application({'type': 'lifespan'}, receive, send))
+        self.assertEqual(sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
@@ -0,0 +1,113 @@
+from app import app
+from app.controllers import FilteredSalesQuery, MonthlySalesQuery, ParamError, _latencies
+from app.models import CURRENT_YEAR
+from tests import ApiTest, BaseTest
+
+
+class AutoProfile(BaseTest):
+    """Tests automatic selection of profiles by `profile=auto`."""
+
+    def setUp(self):
+        super().setUp()
+        self.config = {key: app.config[key] for key in ('AUTO_PROFILE_EXPLORATION', 'AUTO_PROFILE_MIN_SAMPLES')}
+        app.config.update(AUTO_PROFILE_EXPLORATION=0, AUTO_PROFILE_MIN_SAMPLES=5)
+        _latencies.clear()
+
+    def tearDown(self):
+        app.config.update(self.config)
+        _latencies.clear()
+        super().tearDown()
+
+    def observe(self, query_class, params, profile, elapsed, times=5):
+        query = query_class(profile=profile, **params)
+        for _ in range(times):
+            _latencies.observe((query_class.__name__, query.shape, profile), elapsed)
+
+    def test_estimated_costs(self):
+        """
+        Test auto profile: the profile with the lowest estimated cost is chosen,
+        the most optimized one winning ties.
+        """
+        params = {'product_name': 'Data Science Book'}
+        query = FilteredSalesQuery(profile='auto', **params)
+        costs = query.estimate_costs(**params)
+        self.assertLess(costs[2], costs[1])
+        self.assertLess(costs[3], costs[1])
+        self.assertLess(costs[4], costs[1])
+        self.assertEqual(query.profile, min(costs, key=lambda p: (costs[p], -p)))
+        self.assertEqual(FilteredSalesQuery(profile='auto').profile, 4)
+        self.assertEqual(MonthlySalesQuery(profile='auto').profile, 4)
+
+    def test_pagination(self):
+        """
+        Test auto profile: pages read from the date indexes are estimated far
+        cheaper than a full scan.
+        """
+        params = {'start_date': f'{CURRENT_YEAR - 1}-06-01', 'page_size': 1}
+        costs = FilteredSalesQuery(profile=2, **params).estimate_costs(**params)
+        self.assertLess(costs[2] * 5, costs[1])
+        self.assertLess(costs[3] * 5, costs[1])
+
+    def test_observed_latencies(self):
+        """
+        Test auto profile: once observed enough, the profile with the lowest
+        latency is chosen for queries of the same shape only.
+        """
+        params = {'product_name': 'Data Science Book'}
+        self.observe(FilteredSalesQuery, params, profile=2, elapsed=1.0)
+        self.observe(FilteredSalesQuery, params, profile=3, elapsed=5.0)
+        self.observe(FilteredSalesQuery, params, profile=4, elapsed=5.0)
+        self.assertEqual(FilteredSalesQuery(profile='auto', **params).profile, 2)
+        self.assertEqual(FilteredSalesQuery(profile='auto', product_name='Wireless Mouse').profile, 2)
+        self.assertEqual(FilteredSalesQuery(profile='auto', region_name='South').profile, 4)
+
+        # Not observed enough
+        self.observe(MonthlySalesQuery, {}, profile=1, elapsed=0.1, times=4)
+        self.observe(MonthlySalesQuery, {}, profile=4, elapsed=1.0)
+        self.assertEqual(MonthlySalesQuery(profile='auto').profile, 4)
+
+    def test_executions_observed(self):
+        """
+        Test auto profile: executions of every profile are observed.
+        """
+        query = FilteredSalesQuery(profile=1, region_name='South')
+        query()
+        count, average = _latencies.get(('FilteredSalesQuery', query.shape, 1))
+        self.assertEqual(count, 1)
+        self.assertGreater(average, 0)
+        self.assertEqual(query.meta['query_profile'], 1)
+
+    def test_exploration(self):
+        """
+        Test auto profile: profiles not observed yet are explored unless they
+        are estimated far more costly.
+        """
+        app.config['AUTO_PROFILE_EXPLORATION'] = 1
+        params = {'start_date': f'{CURRENT_YEAR}-02-01', 'end_date': f'{CURRENT_YEAR}-03-01'}
+        query = FilteredSalesQuery(profile='auto', **params)
+        costs = query.estimate_costs(**params)
+        best = min(costs, key=lambda p: (costs[p], -p))
+        self.assertNotEqual(query.profile, best)
+        self.assertLessEqual(costs[query.profile], costs[best] * app.config['AUTO_PROFILE_EXPLORATION_COST_RATIO'])
+
+    def test_invalid_profile(self):
+        """
+        Test auto profile: other strings are not accepted as profiles.
+        """
+        with self.assertRaises(ParamError):
+            FilteredSalesQuery(profile='fastest')
+
+
+class ApiAutoProfile(ApiTest):
+    """Tests the profile chosen by `profile=auto` is reported by the API."""
+
+    def test_query_profile_header(self):
+        """
+        Test API auto profile: the chosen profile is exposed as X-Query-Profile.
+        """
+        headers = {'X-Api-Key': 'testing'}
+        for params in ({'profile': 'auto'}, {'profile': 'auto', 'stream': 1}, {'profile': 2}):
+            response = self.client.get('/sales/', headers=headers, query_string=params)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn(response.headers['X-Query-Profile'], ('1', '2', '3', '4'))
+        self.assertEqual(response.headers['X-Query-Profile'], '2')
@@ -0,0 +1,60 @@
+import asyncio
+import unittest
+
+from app.utils import measure, percentile
+from benchmark import compare
+from benchmark_concurrency import load, uwsgi_slots
+
+
+class BenchmarkHarness(unittest.TestCase):
+    def test_percentile(self):
+        """
+        Test benchmark harness: percentiles are interpolated between samples.
+        """
+        samples = [float(i) for i in range(1, 101)]
+        self.assertEqual(percentile(samples, 50), 50.5)
+        self.assertAlmostEqual(percentile(samples, 99), 99.01)
+        self.assertEqual(percentile([3.0], 95), 3.0)
+
+    def test_measure(self):
+        """
+        Test benchmark harness: warmup executions are not timed.
+        """
+        calls = []
+        stats = measure(lambda: calls.append(1), iterations=50, warmup=5)
+        self.assertEqual(len(calls), 55)
+        self.assertEqual(stats['iterations'], 50)
+        self.assertLessEqual(stats['min'], stats['p50'])
+        self.assertLessEqual(stats['p50'], stats['p95'])
+        self.assertLessEqual(stats['p95'], stats['p99'])
+        self.assertLessEqual(stats['p99'], stats['max'])
+
+    def test_compare(self):
+        """
+        Test benchmark harness: only regressions past the tolerance are reported.
+        """
+        baseline = {'results': {'a': {'p50': 1.0, 'p95': 2.0}, 'b': {'p50': 1.0, 'p95': 2.0}}}
+        results = {'results': {
+            'a': {'p50': 1.2, 'p95': 2.4},  # within tolerance
+            'b': {'p50': 1.0, 'p95': 3.0},  # p95 regressed
+            'c': {'p50': 9.0, 'p95': 9.0},  # not in baseline
+        }}
+        regressions = compare(results, baseline, tolerance=0.25)
+        self.assertEqual(len(regressions), 1)
+        self.assertTrue(regressions[0].startswith('b: p95'))
+
+    def test_concurrency_load(self):
+        """
+        Test concurrency harness: clients resend requests until the duration
+        elapses, and non-200 responses are counted per class of clients.
+        """
+        async def send(url):
+            await asyncio.sleep(0.001)
+            return 200 if url == '/ok' else 503
+
+        results = asyncio.run(load(send, [('ok', '/ok'), ('ok', '/ok'), ('busy', '/busy')], duration=0.1))
+        self.assertGreater(results['ok']['requests'], results['busy']['requests'])
+        self.assertEqual(results['ok']['errors'], 0)
+        self.assertEqual(results['busy']['errors'], results['busy']['requests'])
+        self.assertLessEqual(results['ok']['p50'], results['ok']['p99'])
+        self.assertEqual(uwsgi_slots(), 4)
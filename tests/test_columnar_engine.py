@@ -0,0 +1,72 @@
+import sqlite3
+import unittest
+from contextlib import closing
+
+from app import app
+from app.controllers import FilteredSalesQuery, MonthlySalesQuery, TopProductsQuery
+from app.engines import np, get_columnar_sales
+from app.models import CURRENT_YEAR
+from tests import ControllerTest
+
+
+@unittest.skipIf(np is None, 'NumPy is not installed')
+class ColumnarEngine(ControllerTest):
+    """Tests the NumPy columnar engine against the SQL profiles."""
+
+    def setUp(self):
+        super().setUp()
+
+        # Same filter parameters as FilteredSalesQuery controller tests
+        self.params = {
+            'product_name': 'Data Science Book',
+            'region_name': 'Mid-Atlantic',
+            'start_date': f'{CURRENT_YEAR}-02-01',
+            'end_date': f'{CURRENT_YEAR}-03-01',
+        }
+
+    def assertSameResults(self, expected, actual):
+        """Asserts both results hold the same items regardless of their order."""
+        normalize = lambda items: sorted(
+            tuple(round(v, 2) if isinstance(v, float) else v for v in item.values()) for item in items
+        )
+        self.assertEqual(normalize(expected), normalize(actual))
+
+    def test_monthly_sales(self):
+        """
+        Test MonthlySalesQuery controller: NumPy engine.
+        """
+        self.assertSameResults(MonthlySalesQuery()(), MonthlySalesQuery(engine='numpy')())
+        self.time(MonthlySalesQuery(engine='numpy'))
+
+    def test_filter_sales(self):
+        """
+        Test FilteredSalesQuery controller: NumPy engine.
+        """
+        for params in [self.params, {'start_date': f'{CURRENT_YEAR - 1}-06-01', 'end_date': f'{CURRENT_YEAR}-01-31'}, {}]:
+            self.assertSameResults(FilteredSalesQuery(**params)(), FilteredSalesQuery(engine='numpy', **params)())
+        self.time(FilteredSalesQuery(engine='numpy', **self.params))
+
+    def test_top_products(self):
+        """
+        Test ProductTopFiveQuery controller: NumPy engine.
+        """
+        self.assertSameResults(TopProductsQuery(limit=10)(), TopProductsQuery(engine='numpy', limit=10)())
+        self.time(TopProductsQuery(engine='numpy'))
+
+    def test_refresh(self):
+        """
+        Test the columnar copy is reloaded once the database is changed.
+        """
+        db_file = app.config['DATABASE_FILE']
+        loaded = get_columnar_sales(db_file)
+        self.assertIs(get_columnar_sales(db_file), loaded)
+
+        # Change the database through another connection
+        with closing(sqlite3.connect(db_file)) as conn:
+            conn.execute('CREATE TABLE test_columnar_refresh (id INTEGER)')
+            conn.execute('DROP TABLE test_columnar_refresh')
+        self.assertIsNot(get_columnar_sales(db_file), loaded)
+
+        # Reload on demand
+        loaded = get_columnar_sales(db_file)
+        self.assertIsNot(get_columnar_sales(db_file, refresh=True), loaded)
@@ -0,0 +1,43 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from app import app
+from app.utils import SQLite, SQLitePool
+from tests import BaseTest
+
+
+class ConnectionPool(BaseTest):
+    """Tests the pool of persistent SQLite connections."""
+
+    def setUp(self):
+        super().setUp()
+        self.pool = SQLitePool(app.config['DATABASE_FILE'], size=2, pragmas={'cache_size': -1024, 'query_only': 1})
+
+    def tearDown(self):
+        self.pool.close()
+        super().tearDown()
+
+    def query(self, sql='SELECT COUNT(*) FROM sales'):
+        with SQLite(self.pool.db_file, pool=self.pool) as conn:
+            return conn.fetchall(sql)
+
+    def test_reuses_connections(self):
+        for _ in range(10):
+            self.query()
+        stats = self.pool.stats()
+        self.assertEqual(stats['open'], 1)
+        self.assertEqual(stats['acquired'], 10)
+        self.assertEqual(stats['reused'], 9)
+        self.assertEqual(stats['in_use'], 0)
+
+    def test_applies_pragmas(self):
+        self.assertEqual(self.query('PRAGMA cache_size'), [(-1024,)])
+        self.assertEqual(self.query('PRAGMA query_only'), [(1,)])
+
+    def test_concurrent_use(self):
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(lambda _: self.query(), range(100)))
+        self.assertEqual(len(set(map(tuple, results))), 1)
+        stats = self.pool.stats()
+        self.assertLessEqual(stats['open'], 2)
+        self.assertEqual(stats['acquired'], 100)
+        self.assertEqual(stats['in_use'], 0)
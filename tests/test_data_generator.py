@@ -0,0 +1,73 @@
+import os
+import datetime
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from generate_data import generate_file, row_count
+from ingest import CsvData
+
+
+class DataGenerator(unittest.TestCase):
+    def setUp(self):
+        self.kwargs = dict(
+            rows=5000, seed=7, products=40, regions=12, skew=1.1, region_skew=0.5,
+            start_date=datetime.date(2023, 1, 1), end_date=datetime.date(2025, 12, 31),
+        )
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def generate(self, name: str, **kwargs):
+        csv_file = os.path.join(self.tmp.name, name)
+        generate_file(csv_file, **{**self.kwargs, **kwargs})
+        return csv_file
+
+    def test_ingestible(self):
+        """
+        Test data generator: generated rows are parsed by ingestion and respect
+        cardinality and date span.
+        """
+        rows = [row for row, *_ in CsvData.iter_rows(self.generate('sales.csv'), has_header=True)]
+        self.assertEqual(len(rows), 5000)
+        self.assertLessEqual(len({row.product_name for row in rows}), 40)
+        self.assertLessEqual(len({row.sale_region for row in rows}), 12)
+        self.assertEqual(rows[0].sale_date, datetime.date(2023, 1, 1))
+        self.assertEqual(rows[-1].sale_date, datetime.date(2025, 12, 31))
+        self.assertEqual(sorted(row.sale_date for row in rows), [row.sale_date for row in rows])
+
+    def test_seed(self):
+        """
+        Test data generator: the same seed generates the same file.
+        """
+        read = lambda csv_file: open(csv_file).read()
+        first, second = self.generate('first.csv'), self.generate('second.csv')
+        self.assertEqual(read(first), read(second))
+        self.assertNotEqual(read(first), read(self.generate('other.csv', seed=8)))
+
+    def test_skew(self):
+        """
+        Test data generator: popularity of products is skewed.
+        """
+        counts = {}
+        for row, *_ in CsvData.iter_rows(self.generate('sales.csv'), has_header=True):
+            counts[row.product_name] = counts.get(row.product_name, 0) + 1
+        top, *_, bottom = sorted(counts.values(), reverse=True)
+        self.assertGreater(top, bottom * 10)
+
+    def test_row_count(self):
+        """
+        Test data generator: row counts accept K/M/B suffixes.
+        """
+        self.assertEqual(row_count('477'), 477)
+        self.assertEqual(row_count('10M'), 10_000_000)
+        self.assertEqual(row_count('100m'), 100_000_000)
+
+    def test_standalone(self):
+        """
+        Test data generator: it runs without setting up the app.
+        """
+        script = "import sys, generate_data; print('app' in sys.modules)"
+        output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout
+        self.assertEqual(output.strip(), 'False')
@@ -32,3 +32,43 @@ class FilteredSalesQueryController(ControllerTest):
         Test FilteredSalesQuery controller: Profile #3 (indexed, partitioning).
         """
         self.time(FilteredSalesQuery(profile=3, **self.params))
+
+    def test_profile_4(self):
+        """
+        Test FilteredSalesQuery controller: Profile #4 (indexed, partitioning by period).
+        """
+        self.time(FilteredSalesQuery(profile=4, **self.params))
+
+    def test_statement_reuse(self):
+        """
+        Test FilteredSalesQuery controller: bound parameters vs. literal values.
+        """
+        # Distinct filters, each one is executed once
+        products = ['Data Science Book', 'Rain Jacket', 'Wireless Mouse', 'Desk Chair']
+        queries = [
+            FilteredSalesQuery(**{**self.params, 'product_name': products[i % 4], 'start_date': f'{CURRENT_YEAR}-01-{i // 4 + 2:02d}'})
+            for i in range(self.total_attempts // 2)
+        ]
+
+        def literal(query):
+            """Returns executor of query having its parameters embedded as literals."""
+            sql = query.query
+            for name, value in query.query_args.items():
+                sql = sql.replace(f':{name}', repr(value))
+
+            def execute():
+                with query.db as conn:
+                    return conn.fetchall(sql)
+            return execute
+
+        # Queries share one statement, which can be reused from the cache of
+        # compiled statements, and differ by their bound values only
+        self.assertEqual(len({query.query for query in queries}), 1)
+        self.assertEqual(len({tuple(query.query_args.items()) for query in queries}), len(queries))
+
+        literals = [literal(query) for query in queries]
+        self.assertEqual([query.execute() for query in queries[:8]], [execute() for execute in literals[:8]])
+
+        embedded = self.measure(lambda: [execute() for execute in literals], number=1)
+        bound = self.measure(lambda: [query() for query in queries], number=1)
+        print(f'bound: {bound:.2f}ms | literal: {embedded:.2f}ms')
@@ -0,0 +1,138 @@
+import os
+import sqlite3
+import tempfile
+from argparse import ArgumentTypeError
+from contextlib import closing
+
+from app import app
+from app.controllers import FilteredSalesQuery, MonthlySalesQuery, _workload
+from app.utils import Workload
+from index_advisor import build_indexes, evaluate, format_index, index_name, parse_index
+from tests import ApiTest, BaseTest
+
+# Covering index of sales filtered by product and region
+INDEX = ('sales', ('product_id', 'region_id', 'date', 'revenue'))
+
+
+class IndexAdvisor(BaseTest):
+    """Tests recording of the workload, and evaluation and building of indexes."""
+
+    def setUp(self):
+        super().setUp()
+        _workload.clear()
+        self.params = {'product_name': 'Data Science Book', 'region_name': 'South'}
+
+    def tearDown(self):
+        _workload.clear()
+        super().tearDown()
+
+    def copy_database(self, directory: str) -> str:
+        """Returns the path to a copy of the database in a directory."""
+        copy_file = os.path.join(directory, 'db.sqlite')
+        with closing(sqlite3.connect(app.config['DATABASE_FILE'])) as source, \
+                closing(sqlite3.connect(copy_file)) as conn:
+            source.backup(conn)
+        return copy_file
+
+    def test_workload(self):
+        """
+        Test index advisor: executed statement shapes are recorded with their
+        candidate indexes, regardless of the values bound.
+        """
+        FilteredSalesQuery(profile=1, **self.params)()
+        FilteredSalesQuery(profile=1, **{**self.params, 'region_name': 'West'})()
+        MonthlySalesQuery(profile=4)()
+        shapes = {(shape['controller'], shape['profile']): shape for shape in _workload.shapes()}
+        self.assertEqual(len(shapes), 2)
+        shape = shapes['FilteredSalesQuery', 1]
+        self.assertEqual(shape['count'], 2)
+        self.assertEqual(shape['args']['region_name'], 'West')
+        self.assertEqual(shape['candidates'], [['sales', list(INDEX[1])]])
+        self.assertEqual(shapes['MonthlySalesQuery', 4]['candidates'], [])
+
+    def test_workload_size(self):
+        """
+        Test index advisor: shapes beyond the size of the workload are dropped.
+        """
+        workload = Workload(size=1)
+        workload.record('SELECT 1', {}, 1.0)
+        workload.record('SELECT 2', {}, 1.0)
+        workload.record('SELECT 1', {}, 2.0)
+        self.assertEqual(workload.stats(), {'shapes': 1, 'dropped': 1})
+        self.assertEqual(workload.shapes()[0]['total'], 3.0)
+
+    def test_parse_index(self):
+        """
+        Test index advisor: indexes are written as `table(column, ...)`.
+        """
+        self.assertEqual(parse_index('sales(product_id, region_id, date, revenue)'), INDEX)
+        self.assertEqual(parse_index(format_index(INDEX)), INDEX)
+        self.assertEqual(index_name(INDEX), 'ix_sales_product_id_region_id_date_revenue')
+        for value in ('sales', 'sales()', 'sales(date,)', 'sales(date); DROP TABLE sales'):
+            with self.assertRaises(ArgumentTypeError):
+                parse_index(value)
+
+    def test_evaluate(self):
+        """
+        Test index advisor: candidates are evaluated on a copy of the database.
+        """
+        FilteredSalesQuery(profile=1, **self.params)()
+        report = evaluate(app.config['DATABASE_FILE'], _workload.shapes(), iterations=3, warmup=1)
+        self.assertEqual([row['index'] for row in report], [format_index(INDEX)])
+        row = report[0]
+        self.assertTrue(row['used'])
+        self.assertGreater(row['size'], 0)
+        self.assertEqual(row['executions'], 1)
+
+        # The database is left untouched
+        with closing(sqlite3.connect(app.config['DATABASE_FILE'])) as conn:
+            indexes = conn.execute("SELECT name FROM sqlite_master WHERE name = ?", (index_name(INDEX),)).fetchall()
+        self.assertEqual(indexes, [])
+
+    def test_build_without_blocking_readers(self):
+        """
+        Test index advisor: indexes are built while readers are reading.
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            db_file = self.copy_database(tmp)
+            with closing(sqlite3.connect(db_file, isolation_level=None)) as reader:
+                reader.execute('PRAGMA journal_mode = WAL')
+                reader.execute('BEGIN')
+                (before,), = reader.execute('SELECT COUNT(*) FROM sales').fetchall()
+
+                built = list(build_indexes(db_file, [INDEX], timeout=1))
+                self.assertEqual([index for index, _ in built], [INDEX])
+
+                # The reader still reads the same snapshot until it ends
+                self.assertEqual(reader.execute('SELECT COUNT(*) FROM sales').fetchall(), [(before,)])
+                reader.execute('COMMIT')
+
+                # Then reads the index, which is planned for its next statements
+                indexes = reader.execute("SELECT name FROM sqlite_master WHERE type = 'index'").fetchall()
+                self.assertIn((index_name(INDEX),), indexes)
+                plan = reader.execute(
+                    'EXPLAIN QUERY PLAN SELECT date, revenue FROM sales WHERE product_id = 1 AND region_id = 1'
+                ).fetchall()
+            self.assertIn(index_name(INDEX), plan[0][-1])
+
+            with self.assertRaises(ValueError):
+                list(build_indexes(db_file, [('sales', ('no_such_column',))]))
+            with self.assertRaises(ValueError):
+                list(build_indexes(db_file, [('sales); DROP TABLE sales; --', ('date',))]))
+
+
+class ApiWorkload(ApiTest):
+    """Tests the workload endpoint."""
+
+    def test_workload(self):
+        """
+        Test API workload: statement shapes executed by the worker are served.
+        """
+        _workload.clear()
+        headers = {'X-Api-Key': 'testing'}
+        self.client.get('/sales/top-products/', headers=headers, query_string={'profile': 1})
+        response = self.client.get('/workload', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(shape['controller'], shape['profile']) for shape in response.json], [('TopProductsQuery', 1)])
+        self.assertEqual(self.client.get('/workload').status_code, 401)
+
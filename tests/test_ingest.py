@@ -0,0 +1,233 @@
+import datetime
+import os
+import tempfile
+import unittest
+from contextlib import contextmanager
+from typing import Callable, Dict, List
+
+from flask import Flask
+from sqlalchemy import func, select, text
+
+from app import app
+from app.models import Product, Region, RollupUtils, Sale, SalePartition, db
+from generate_data import generate_file
+from index_advisor import build_indexes
+from ingest import BulkIngest, CsvData, ingest, ingest_file
+
+
+class Interrupted(Exception):
+    """Raised by a writer to interrupt an ingestion."""
+
+
+class Ingestion(unittest.TestCase):
+    """
+    Tests ingestion of CSV files chunk by chunk. Each test ingests into new
+    databases, so that the database of other tests is left untouched.
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.csv_file = os.path.join(self.tmp.name, 'sales.csv')
+        self.rows = generate_file(
+            self.csv_file, rows=500, seed=3, products=30, regions=6, skew=1.1, region_skew=0.5,
+            start_date=datetime.date(2023, 1, 1), end_date=datetime.date(2025, 12, 31),
+        )
+
+        # Ingestion bumps the data version, which other tests read
+        version_file = app.config['DATA_VERSION_FILE']
+        app.config['DATA_VERSION_FILE'] = os.path.join(self.tmp.name, 'data.version')
+        self.addCleanup(app.config.__setitem__, 'DATA_VERSION_FILE', version_file)
+
+    @contextmanager
+    def database(self, name: str = 'db.sqlite'):
+        """Runs the block within the context of an app bound to a new database."""
+        db_file = os.path.join(self.tmp.name, name)
+        database_app = Flask(__name__)
+        database_app.config.from_mapping(app.config, DATABASE_FILE=db_file,
+                                         SQLALCHEMY_DATABASE_URI=f'sqlite:///{db_file}')
+        db.init_app(database_app)
+        with database_app.app_context():
+            db.create_all()
+            try:
+                yield
+            finally:
+                db.session.remove()
+                for engine in db.engines.values():
+                    engine.dispose()
+
+    @staticmethod
+    def interrupting(writer: Callable, chunks: int) -> Callable:
+        """Returns a writer that interrupts the ingestion after writing `chunks` chunks."""
+        written = []
+
+        def write(data: CsvData):
+            if len(written) >= chunks:
+                raise Interrupted
+            written.append(data)
+            return writer(data)
+
+        return write
+
+    def ingest_until(self, chunks: int, chunk_size: int):
+        """Ingests the CSV file until interrupted after `chunks` chunks."""
+        with self.assertRaises(Interrupted):
+            ingest_file(self.csv_file, True, self.interrupting(ingest, chunks), chunk_size=chunk_size)
+        db.session.rollback()
+
+    def count(self) -> int:
+        return db.session.execute(select(func.count()).select_from(Sale)).scalar()
+
+    @staticmethod
+    def snapshot() -> Dict[str, List[tuple]]:
+        """
+        Returns rows of names, sales, partitions and all summary tables in key
+        order, with revenues rounded off the errors of summing up floats.
+        """
+        partitions = db.session.execute(select(SalePartition.name).order_by(SalePartition.name)).scalars().all()
+        statements = {
+            'registry': select(SalePartition.name, SalePartition.start_date, SalePartition.end_date,
+                               SalePartition.rows).order_by(SalePartition.name),
+        }
+        for table in [Product.__table__, Region.__table__, Sale.__table__,
+                      *(SalePartition.table(name) for name in partitions),
+                      *(rollup.__table__ for rollup in RollupUtils.rollups)]:
+            statements[table.name] = select(table).order_by(*table.primary_key.columns)
+        return {
+            name: [tuple(round(value, 4) if isinstance(value, float) else value for value in row)
+                   for row in db.session.execute(statement).all()]
+            for name, statement in statements.items()
+        }
+
+    def assertConsistent(self):
+        """
+        Asserts sales are those of the CSV file each ingested once, and that
+        partitions and summary tables hold the same as if rebuilt from them.
+        """
+        sales = db.session.execute(
+            select(Sale.date, Product.name, Sale.revenue, Region.name)
+            .join(Product, Sale.product_id == Product.id)
+            .join(Region, Sale.region_id == Region.id)
+            .order_by(Sale.id)
+        ).all()
+        rows = [row for row, *_ in CsvData.iter_rows(self.csv_file, has_header=True)]
+        self.assertEqual([tuple(sale) for sale in sales],
+                         [(row.sale_date, row.product_name, row.revenue, row.sale_region) for row in rows])
+
+        ids = [sale_id for name in db.session.execute(select(SalePartition.name)).scalars().all()
+               for sale_id in db.session.execute(select(SalePartition.table(name).c.id)).scalars()]
+        self.assertEqual(sorted(ids), db.session.execute(select(Sale.id).order_by(Sale.id)).scalars().all())
+
+        accumulated = self.snapshot()
+        SalePartition.rebuild()
+        RollupUtils.rebuild_all()
+        rebuilt = self.snapshot()
+        db.session.rollback()
+        self.assertEqual(accumulated.keys(), rebuilt.keys())
+        for name, rows in rebuilt.items():
+            self.assertEqual(accumulated[name], rows, name)
+
+    def test_resume(self):
+        """
+        Test ingestion: an interrupted ingestion resumes right after the last
+        committed chunk, so that every row is ingested once.
+        """
+        with self.database():
+            self.ingest_until(chunks=3, chunk_size=40)
+            self.assertEqual(self.count(), 120)
+            self.ingest_until(chunks=2, chunk_size=40)
+            self.assertEqual(self.count(), 200)
+            self.assertEqual(ingest_file(self.csv_file, True, ingest, chunk_size=40), self.rows - 200)
+            self.assertEqual(self.count(), self.rows)
+            self.assertConsistent()
+
+    def test_completed(self):
+        """
+        Test ingestion: a completely ingested file is refused unless restarted.
+        """
+        with self.database():
+            self.assertEqual(ingest_file(self.csv_file, True, ingest, chunk_size=200), self.rows)
+            with self.assertRaisesRegex(AssertionError, 'already ingested'):
+                ingest_file(self.csv_file, True, ingest, chunk_size=200)
+            db.session.rollback()
+            self.assertEqual(self.count(), self.rows)
+            self.assertConsistent()
+
+    def test_changed(self):
+        """
+        Test ingestion: a file changed after some of its rows were committed is
+        refused unless restarted, rather than ingested again from the beginning.
+        """
+        with self.database():
+            self.ingest_until(chunks=1, chunk_size=40)
+            with open(self.csv_file, 'a') as fp:
+                fp.write('2025-12-31,Desk Chair,10.00,West\n')
+            with self.assertRaisesRegex(AssertionError, '--restart'):
+                ingest_file(self.csv_file, True, ingest, chunk_size=40)
+            db.session.rollback()
+            self.assertEqual(self.count(), 40)
+
+            # Restarting ingests every row of the file again
+            self.assertEqual(ingest_file(self.csv_file, True, ingest, chunk_size=200, restart=True), self.rows + 1)
+            self.assertEqual(self.count(), self.rows + 41)
+
+    def test_bulk(self):
+        """
+        Test ingestion: bulk mode writes the same names, sales, partitions and
+        summary tables as ingesting through ORM objects, including products
+        and regions first sold in later chunks.
+        """
+        first = [row for row, *_ in CsvData.iter_rows(self.csv_file, has_header=True)][:7]
+        snapshots = []
+        for name, writer in (('orm.sqlite', lambda: ingest), ('bulk.sqlite', BulkIngest)):
+            with self.database(name):
+                self.assertEqual(ingest_file(self.csv_file, True, writer(), chunk_size=7), self.rows)
+                snapshots.append(self.snapshot())
+                self.assertConsistent()
+        orm, bulk = snapshots
+
+        # Names are created by chunks after the first one too
+        self.assertGreater(len(orm['products']), len({row.product_name for row in first}))
+        self.assertGreater(len(orm['regions']), len({row.sale_region for row in first}))
+        self.assertEqual(orm.keys(), bulk.keys())
+        for name, rows in orm.items():
+            self.assertEqual(bulk[name], rows, name)
+
+    def test_analyze(self):
+        """
+        Test ingestion: tables are analyzed once a file is ingested, unless
+        skipped.
+        """
+        statistics = "SELECT COUNT(*) FROM sqlite_master WHERE name = 'sqlite_stat1'"
+        with self.database('skipped.sqlite'):
+            ingest_file(self.csv_file, True, ingest, chunk_size=200, analyze=False)
+            self.assertEqual(db.session.execute(text(statistics)).scalar(), 0)
+        with self.database():
+            ingest_file(self.csv_file, True, ingest, chunk_size=200)
+            stat = db.session.execute(
+                text("SELECT stat FROM sqlite_stat1 WHERE idx = 'ix_sales_indexed_date'")
+            ).scalar()
+            self.assertEqual(int(stat.split()[0]), self.rows)
+
+    def test_partition_indexes(self):
+        """
+        Test ingestion: indexes built on a partition are built on partitions
+        created later by ingestion, and on those rebuilt.
+        """
+        def indexes() -> Dict[str, List[str]]:
+            rows = db.session.execute(text(
+                "SELECT tbl_name, name FROM sqlite_master WHERE type = 'index' AND name LIKE '%_product_id_revenue'"
+            )).all()
+            return {table: [name for tbl_name, name in rows if tbl_name == table] for table, _ in rows}
+
+        with self.database():
+            self.ingest_until(chunks=1, chunk_size=40)
+            self.assertEqual(db.session.execute(select(SalePartition.name)).scalars().all(), ['sales_2023'])
+            db.session.remove()
+            list(build_indexes(os.path.join(self.tmp.name, 'db.sqlite'), [('sales_2023', ('product_id', 'revenue'))]))
+            ingest_file(self.csv_file, True, ingest, chunk_size=40)
+            expected = {f'sales_{year}': [f'ix_sales_{year}_product_id_revenue'] for year in (2023, 2024, 2025)}
+            self.assertEqual(indexes(), expected)
+            SalePartition.rebuild()
+            self.assertEqual(indexes(), expected)
+            db.session.rollback()
@@ -1,4 +1,5 @@
-from app.controllers import MonthlySalesQuery
+from app.controllers import MonthlySalesQuery, ParamError
+from app.models import CURRENT_YEAR
 from tests import ControllerTest
 
 
@@ -20,3 +21,34 @@ class MonthlySalesQueryController(ControllerTest):
         Test MonthlySalesQuery controller: Profile #3 (pre-populated fields + indexed).
         """
         self.time(MonthlySalesQuery(profile=3))
+
+    def test_profile_4(self):
+        """
+        Test MonthlySalesQuery controller: Profile #4 (summary table).
+        """
+        self.time(MonthlySalesQuery(profile=4))
+
+    def test_summary_table(self):
+        """
+        Test MonthlySalesQuery controller: Profile #4 matches aggregated sales.
+        """
+        expected, actual = MonthlySalesQuery(profile=3)(), MonthlySalesQuery(profile=4)()
+        self.assertEqual([(i['year'], i['month']) for i in expected], [(i['year'], i['month']) for i in actual])
+        for e, a in zip(expected, actual):
+            self.assertAlmostEqual(e['revenue'], a['revenue'], places=2)
+
+    def test_date_range(self):
+        """
+        Test MonthlySalesQuery controller: a range may be a single day, which
+        every profile sums up the same, but not end before it starts.
+        """
+        day = f'{CURRENT_YEAR - 1}-03-05'
+        expected = MonthlySalesQuery(profile=1, start_date=day, end_date=day)()
+        self.assertLessEqual(len(expected), 1)
+        for profile in (2, 3, 4):
+            actual = MonthlySalesQuery(profile=profile, start_date=day, end_date=day)()
+            self.assertEqual([(i['year'], i['month']) for i in expected], [(i['year'], i['month']) for i in actual])
+            for e, a in zip(expected, actual):
+                self.assertAlmostEqual(e['revenue'], a['revenue'], places=2)
+        with self.assertRaises(ParamError):
+            MonthlySalesQuery(start_date=f'{CURRENT_YEAR - 1}-03-06', end_date=day)
@@ -0,0 +1,162 @@
+import datetime
+
+from app import app
+from app.controllers import FilteredSalesQuery, MonthlySalesQuery, ParamError, TopProductsQuery
+from app.engines import np
+from app.models import CURRENT_YEAR, SalePartition
+from tests import ApiTest, BaseTest
+
+
+class Partitions(BaseTest):
+    """Tests partitioning of sales by period, and pruning of partitions."""
+
+    def fetchall(self, sql, *args):
+        with FilteredSalesQuery(profile=1).db as conn:
+            return conn.fetchall(sql, *args)
+
+    def test_registry(self):
+        """
+        Test partitions: every sale is copied with the same id to the partition
+        of its period, whose size is registered.
+        """
+        partitions = FilteredSalesQuery(profile=4).partitions()
+        self.assertTrue(partitions)
+        for table, start_date, end_date, rows in partitions:
+            (count, first, last), = self.fetchall(f'SELECT COUNT(*), MIN(date), MAX(date) FROM {table}')
+            self.assertEqual(count, rows)
+            self.assertGreaterEqual(first, start_date)
+            self.assertLessEqual(last, end_date)
+            missing = self.fetchall(f'''
+                SELECT COUNT(*) FROM {table} p
+                LEFT JOIN sales s ON s.id = p.id AND s.date = p.date AND s.revenue = p.revenue
+                WHERE s.id IS NULL
+            ''')
+            self.assertEqual(missing, [(0,)])
+        (sales,), = self.fetchall('SELECT COUNT(*) FROM sales')
+        self.assertEqual(sum(rows for *_, rows in partitions), sales)
+
+    def test_period(self):
+        """
+        Test partitions: sales are partitioned by year or by month.
+        """
+        self.assertEqual(
+            SalePartition.period(datetime.date(2024, 2, 10)),
+            ('sales_2024', datetime.date(2024, 1, 1), datetime.date(2024, 12, 31)),
+        )
+        app.config['SALES_PARTITION_PERIOD'] = 'month'
+        try:
+            self.assertEqual(
+                SalePartition.period(datetime.date(2024, 2, 10)),
+                ('sales_2024_02', datetime.date(2024, 2, 1), datetime.date(2024, 2, 29)),
+            )
+            self.assertEqual(SalePartition.period(datetime.date(2024, 12, 31))[2], datetime.date(2024, 12, 31))
+        finally:
+            app.config['SALES_PARTITION_PERIOD'] = 'year'
+
+    def test_pruning(self):
+        """
+        Test partitions: only partitions overlapping the date range are read,
+        and partitions lying entirely within the range are not filtered.
+        """
+        query = FilteredSalesQuery(profile=4, start_date=f'{CURRENT_YEAR}-02-01', end_date=f'{CURRENT_YEAR}-03-01')
+        self.assertIn(f'sales_{CURRENT_YEAR}', query.query)
+        self.assertNotIn(f'sales_{CURRENT_YEAR - 1}', query.query)
+
+        query = FilteredSalesQuery(profile=4, start_date=f'{CURRENT_YEAR - 1}-01-01')
+        self.assertIn('UNION ALL', query.query)
+        self.assertNotIn(':start_date', query.query)
+
+        # No partition overlaps the range
+        query = FilteredSalesQuery(profile=4, start_date=f'{CURRENT_YEAR + 5}-01-01')
+        self.assertEqual(query(), [])
+
+    def test_filtered_sales(self):
+        """
+        Test partitions: profiles 3 and 4 return the same sales as other profiles.
+        """
+        for params in (
+            {},
+            {'product_name': 'Data Science Book'},
+            {'start_date': f'{CURRENT_YEAR - 1}-06-01', 'end_date': f'{CURRENT_YEAR}-02-01'},
+            {'region_name': 'South', 'end_date': f'{CURRENT_YEAR - 1}-12-31'},
+            {'start_date': f'{CURRENT_YEAR}-03-01'},
+            {'start_date': f'{CURRENT_YEAR + 5}-01-01'},
+        ):
+            expected = sorted(map(repr, FilteredSalesQuery(profile=2, **params)()))
+            for profile in (3, 4):
+                self.assertEqual(sorted(map(repr, FilteredSalesQuery(profile=profile, **params)())), expected)
+
+    def test_pagination(self):
+        """
+        Test partitions: pages of profiles 3 and 4 walk through partitions in
+        the same order as other profiles, with the same cursors.
+        """
+        for profile in (2, 3, 4):
+            pages, cursor = [], None
+            while True:
+                query = FilteredSalesQuery(profile=profile, start_date=f'{CURRENT_YEAR - 1}-12-01', page_size=7,
+                                           cursor=cursor)
+                pages += query()
+                cursor = query.meta['next_cursor']
+                if not cursor:
+                    break
+            if profile == 2:
+                expected = pages
+        self.assertEqual(pages, expected)
+        self.assertEqual(pages, FilteredSalesQuery(profile=2, start_date=f'{CURRENT_YEAR - 1}-12-01')())
+
+    def test_aggregates(self):
+        """
+        Test partitions: monthly revenue and top products of a date range are
+        the same across profiles and engines.
+        """
+        ranges = (
+            {'start_date': f'{CURRENT_YEAR - 1}-03-15', 'end_date': f'{CURRENT_YEAR}-02-10'},
+            {'start_date': f'{CURRENT_YEAR}-01-01'},
+            {'end_date': f'{CURRENT_YEAR - 1}-06-30'},
+        )
+        for params in ranges:
+            monthly = MonthlySalesQuery(profile=1, **params)()
+            self.assertTrue(monthly)
+            for profile in (2, 3, 4):
+                self.assertEqual(MonthlySalesQuery(profile=profile, **params)(), monthly)
+
+            top = sorted(row['total_revenue'] for row in TopProductsQuery(profile=1, limit=100, **params)())
+            for profile in (2, 3):
+                totals = TopProductsQuery(profile=profile, limit=100, **params)()
+                self.assertEqual(sorted(row['total_revenue'] for row in totals), top)
+
+            if np is not None:
+                self.assertEqual(MonthlySalesQuery(engine='numpy', **params)(), monthly)
+                totals = TopProductsQuery(engine='numpy', limit=100, **params)()
+                self.assertEqual(sorted(row['total_revenue'] for row in totals), top)
+
+        # Narrower ranges sum up less revenue
+        total = sum(row['revenue'] for row in MonthlySalesQuery(profile=4)())
+        self.assertLess(sum(row['revenue'] for row in MonthlySalesQuery(profile=4, **ranges[0])()), total)
+
+    def test_invalid_range(self):
+        """
+        Test partitions: invalid date ranges are rejected.
+        """
+        with self.assertRaises(ParamError):
+            MonthlySalesQuery(start_date='2024-13-01')
+        with self.assertRaises(ParamError):
+            TopProductsQuery(start_date=f'{CURRENT_YEAR}-02-01', end_date=f'{CURRENT_YEAR}-01-01')
+
+
+class ApiPartitions(ApiTest):
+    """Tests date ranges of aggregate endpoints."""
+
+    def test_date_range(self):
+        """
+        Test API date ranges: monthly revenue and top products accept a date range.
+        """
+        headers = {'X-Api-Key': 'testing'}
+        params = {'start_date': f'{CURRENT_YEAR}-01-01', 'end_date': f'{CURRENT_YEAR}-03-31'}
+        response = self.client.get('/sales/monthly-revenue/', headers=headers, query_string=params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['month'] for row in response.json], ['01', '02', '03'])
+        response = self.client.get('/sales/top-products/', headers=headers, query_string={**params, 'limit': 3})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json), 3)
@@ -0,0 +1,143 @@
+import datetime
+import random
+from collections import defaultdict
+
+from sqlalchemy import func, insert, select
+
+from app import app
+from app.controllers import ParamError, TopProductsQuery
+from app.models import CURRENT_YEAR, Product, ProductSketch, Sale, db
+from app.sketches import SpaceSaving
+from tests import BaseTest, ControllerTest
+
+
+class SpaceSavingSketch(BaseTest):
+    def test_bounds(self):
+        """
+        Test SpaceSaving sketch: counts of kept items bound their weights, no
+        error exceeds the total weight divided by capacity, and every item
+        weighing more than that is kept.
+        """
+        rng = random.Random(0)
+        weights = defaultdict(float)
+        sketch = SpaceSaving(20)
+        for _ in range(5000):
+            item = int(rng.paretovariate(1.2)) % 200
+            weight = round(rng.uniform(1, 100), 2)
+            weights[item] += weight
+            sketch.update(item, weight)
+
+        self.assertAlmostEqual(sketch.total, sum(weights.values()), places=4)
+        self.assertEqual(len(sketch.counters), 20)
+        limit = sketch.total / sketch.capacity
+        for item, count, error in sketch.top():
+            self.assertLessEqual(count - error, weights[item] + 1e-6)
+            self.assertGreaterEqual(count + 1e-6, weights[item])
+            self.assertLessEqual(error, limit)
+        for item, weight in weights.items():
+            if item not in sketch.counters:
+                self.assertLessEqual(weight, sketch.floor + 1e-6)
+            if weight > limit:
+                self.assertIn(item, sketch.counters)
+
+    def test_from_totals(self):
+        """
+        Test SpaceSaving sketch: a sketch of exact totals keeps the heaviest
+        items without error, and streams further items from there.
+        """
+        sketch = SpaceSaving.from_totals(2, {'a': 5.0, 'b': 3.0, 'c': 2.0, 'd': 1.0})
+        self.assertEqual(sketch.top(), [('a', 5.0, 0.0), ('b', 3.0, 0.0)])
+        self.assertEqual((sketch.floor, sketch.total), (2.0, 11.0))
+        sketch.update('c', 4.0)
+        self.assertEqual(sketch.top(), [('c', 7.0, 3.0), ('a', 5.0, 0.0)])
+        self.assertEqual(sketch.floor, 3.0)
+
+
+class ProductSketchesController(ControllerTest):
+    params = {'start_date': f'{CURRENT_YEAR - 1}-03-05', 'end_date': f'{CURRENT_YEAR}-02-10'}
+
+    def test_approximate(self):
+        """
+        Test TopProductsQuery controller: approximate (sketches of products).
+        """
+        self.time(TopProductsQuery(approximate=True, **self.params))
+
+    def test_periods(self):
+        """
+        Test product sketches: a date range is covered by the fewest periods.
+        """
+        periods = ProductSketch.periods(datetime.date(2023, 12, 30), datetime.date(2025, 3, 2))
+        self.assertEqual(periods, ['2023-12-30', '2023-12-31', '2024', '2025-01', '2025-02', '2025-03-01', '2025-03-02'])
+        self.assertEqual(ProductSketch.periods(datetime.date(2024, 2, 1), datetime.date(2024, 2, 29)), ['2024-02'])
+        self.assertEqual(ProductSketch.periods(datetime.date(2024, 2, 1), datetime.date(2024, 2, 1)), ['2024-02-01'])
+
+    def test_exact(self):
+        """
+        Test TopProductsQuery controller: sketches keeping all products sold in
+        their periods answer top products exactly, without error.
+        """
+        for params in ({}, self.params, {'end_date': f'{CURRENT_YEAR - 1}-07-31'}):
+            expected = TopProductsQuery(profile=1, limit=10, **params)()
+            query = TopProductsQuery(approximate=True, limit=10, **params)
+            actual = query()
+            self.assertEqual([i['product_name'] for i in expected], [i['product_name'] for i in actual])
+            for e, a in zip(expected, actual):
+                self.assertAlmostEqual(e['total_revenue'], a['total_revenue'], places=2)
+                self.assertEqual(a['revenue_error'], 0)
+            self.assertEqual(query.meta['revenue_error_bound'], 0)
+
+    def test_params(self):
+        """
+        Test TopProductsQuery controller: only SQLite approximates top products.
+        """
+        with self.assertRaises(ParamError):
+            TopProductsQuery(approximate=True, engine='numpy')
+
+    def test_profile(self):
+        """
+        Test TopProductsQuery controller: approximate results report no
+        profile, whichever profile is selected.
+        """
+        for profile in (None, 2, 'auto'):
+            query = TopProductsQuery(approximate=True, profile=profile, **self.params)
+            query()
+            self.assertIsNone(query.profile)
+            self.assertIsNone(query.meta['query_profile'])
+
+    def test_bounds(self):
+        """
+        Test TopProductsQuery controller: sketches of a few products, rebuilt
+        then accumulated from more sales, bound the revenue of top products.
+        """
+        next_id = (db.session.execute(select(func.max(Sale.id))).scalar() or 0) + 1
+        product_ids = db.session.execute(select(Product.id)).scalars().all()
+        rng = random.Random(1)
+        sales = [
+            dict(id=sale_id, **Sale.row_values(
+                datetime.date(CURRENT_YEAR - 1, 1, 1) + datetime.timedelta(days=rng.randrange(700)),
+                rng.choice(product_ids), 1, round(rng.uniform(1, 100), 2),
+            ))
+            for sale_id in range(next_id, next_id + 300)
+        ]
+        query = TopProductsQuery(approximate=True, limit=5, **self.params)
+        capacity, app.config['PRODUCT_SKETCH_CAPACITY'] = app.config['PRODUCT_SKETCH_CAPACITY'], 3
+        try:
+            ProductSketch.rebuild()
+            db.session.execute(insert(Sale.__table__), sales)
+            ProductSketch.accumulate(sales)
+            rows = db.session.connection().exec_driver_sql(query.query, query.query_args).all()
+            exact = dict(db.session.execute(
+                select(Product.name, func.sum(Sale.revenue))
+                .join(Product, Sale.product_id == Product.id)
+                .where(Sale.date.between(*map(datetime.date.fromisoformat, self.params.values())))
+                .group_by(Product.name)
+            ).all())
+        finally:
+            app.config['PRODUCT_SKETCH_CAPACITY'] = capacity
+            db.session.rollback()
+
+        self.assertEqual(len(rows), 5)
+        for product_name, revenue, error, bound in rows:
+            self.assertLessEqual(revenue - error - 0.01, exact.get(product_name, 0))
+            self.assertGreaterEqual(revenue + 0.01, exact.get(product_name, 0))
+            self.assertLessEqual(error, bound)
@@ -14,3 +14,18 @@ class TopProductsQueryController(ControllerTest):
         Test ProductTopFiveQuery controller: Profile #2 (indexed).
         """
         self.time(TopProductsQuery(profile=2))
+
+    def test_profile_3(self):
+        """
+        Test ProductTopFiveQuery controller: Profile #3 (summary table).
+        """
+        self.time(TopProductsQuery(profile=3))
+
+    def test_summary_table(self):
+        """
+        Test ProductTopFiveQuery controller: Profile #3 matches aggregated sales.
+        """
+        expected, actual = TopProductsQuery(profile=2, limit=10)(), TopProductsQuery(profile=3, limit=10)()
+        self.assertEqual([i['product_name'] for i in expected], [i['product_name'] for i in actual])
+        for e, a in zip(expected, actual):
+            self.assertAlmostEqual(e['total_revenue'], a['total_revenue'], places=2)
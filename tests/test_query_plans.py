@@ -0,0 +1,178 @@
+from typing import List
+
+from app.controllers import BaseQueryController, FilteredSalesQuery, MonthlySalesQuery, TopProductsQuery, \
+    RangeRevenueQuery, RevenueCubeQuery
+from app.models import CURRENT_YEAR
+from tests import ApiTest, BaseTest
+
+
+class QueryPlans(BaseTest):
+    """
+    Tests that SQLite plans each profile the way it is designed to, so that a
+    schema change silently turning a profile into a full scan gets caught.
+    """
+
+    def plan(self, query: BaseQueryController) -> List[str]:
+        return [step['detail'] for step in query.explain()]
+
+    def assertUses(self, query: BaseQueryController, *expected: str):
+        """Asserts every expected step is found in the query plan."""
+        plan = self.plan(query)
+        for step in expected:
+            self.assertTrue(any(step in detail for detail in plan), f'{step!r} not found in plan {plan}')
+
+    def assertNotUses(self, query: BaseQueryController, *unexpected: str):
+        """Asserts no unexpected step is found in the query plan."""
+        plan = self.plan(query)
+        for step in unexpected:
+            self.assertFalse(any(step in detail for detail in plan), f'{step!r} found in plan {plan}')
+
+    def test_monthly_sales(self):
+        """
+        Test query plans of MonthlySalesQuery: profile 3 walks the composite
+        index in group order, profile 4 reads the summary table in key order.
+        """
+        self.assertUses(MonthlySalesQuery(profile=1), 'SCAN sales', 'USE TEMP B-TREE FOR GROUP BY')
+        self.assertUses(MonthlySalesQuery(profile=2), 'SCAN sales', 'USE TEMP B-TREE FOR GROUP BY')
+        self.assertUses(MonthlySalesQuery(profile=3), 'SCAN sales USING INDEX idx_year_month')
+        self.assertNotUses(MonthlySalesQuery(profile=3), 'TEMP B-TREE')
+        self.assertUses(MonthlySalesQuery(profile=4), 'SCAN monthly_revenue')
+        self.assertNotUses(MonthlySalesQuery(profile=4), 'TEMP B-TREE')
+
+    def test_top_products(self):
+        """
+        Test query plans of TopProductsQuery: profile 2 seeks sales by the
+        indexed product id, profile 3 reads the summary table in revenue order.
+        """
+        self.assertUses(TopProductsQuery(profile=1), 'SCAN s')
+        self.assertUses(TopProductsQuery(profile=2), 'USING INDEX ix_sales_indexed_product_id')
+        self.assertUses(TopProductsQuery(profile=3), 'SCAN pr USING COVERING INDEX idx_total_revenue_desc')
+        self.assertNotUses(TopProductsQuery(profile=3), 'TEMP B-TREE')
+
+    def test_top_products_approximate(self):
+        """
+        Test query plans of approximate TopProductsQuery: sketches of periods
+        are read through the key of `product_sketches` rather than scanned.
+        """
+        query = TopProductsQuery(approximate=True, start_date=f'{CURRENT_YEAR - 1}-03-05',
+                                 end_date=f'{CURRENT_YEAR}-02-10')
+        self.assertUses(query, 'SEARCH s USING PRIMARY KEY (period=? AND product_id=?)',
+                        'SEARCH s USING PRIMARY KEY (period=? AND product_id>?)')
+        self.assertNotUses(query, 'SCAN s')
+
+    def test_range_revenue(self):
+        """
+        Test query plans of RangeRevenueQuery: profile 3 seeks the revenue up
+        to each end of the range through the key of the summary table.
+        """
+        params = {'start_date': f'{CURRENT_YEAR - 1}-06-01', 'end_date': f'{CURRENT_YEAR}-06-01'}
+        self.assertUses(RangeRevenueQuery(profile=1, **params), 'SEARCH s USING INDEX ix_sales_indexed_date')
+        self.assertUses(RangeRevenueQuery(profile=3, **params),
+                        'SEARCH c USING PRIMARY KEY (product_id=? AND region_id=? AND date<?)')
+        self.assertNotUses(RangeRevenueQuery(profile=3, **params), 'SCAN c', 'TEMP B-TREE')
+        self.assertNotUses(RangeRevenueQuery(profile=3, product_name='Data Science Book', **params), 'SCAN c', 'SCAN p')
+
+    def test_revenue_cube(self):
+        """
+        Test query plans of RevenueCubeQuery: profile 2 seeks ranges of months
+        and slices through the keys of cells, and reads cells of any subset of
+        dimensions in group order.
+        """
+        months = {'start_month': f'{CURRENT_YEAR - 1}-03', 'end_month': f'{CURRENT_YEAR - 1}-09'}
+        self.assertUses(RevenueCubeQuery(profile=1, group_by='month,region'), 'USE TEMP B-TREE FOR GROUP BY')
+        self.assertUses(RevenueCubeQuery(profile=2, group_by='month', **months), 'SEARCH s USING PRIMARY KEY')
+        self.assertUses(RevenueCubeQuery(profile=2, group_by='month,region', product_name='Data Science Book'),
+                        'SEARCH s USING COVERING INDEX idx_revenue_cube_product (product_id=?)')
+        self.assertUses(RevenueCubeQuery(profile=2, group_by='region', region_name='Mid-Atlantic'),
+                        'SEARCH s USING COVERING INDEX idx_revenue_cube_region (region_id=?)')
+        for group_by in ('', 'month', 'product', 'region', 'month,product', 'month,region', 'product,region',
+                         'month,product,region'):
+            self.assertNotUses(RevenueCubeQuery(profile=2, group_by=group_by), 'TEMP B-TREE FOR GROUP BY')
+
+    def test_filtered_sales(self):
+        """
+        Test query plans of FilteredSalesQuery: profile 2 seeks sales through
+        the indexed date, profile 3 seeks each partition through its date index.
+        """
+        params = {'start_date': f'{CURRENT_YEAR - 1}-06-01', 'end_date': f'{CURRENT_YEAR}-06-01'}
+        self.assertUses(FilteredSalesQuery(profile=1, **params), 'SCAN s')
+        self.assertUses(FilteredSalesQuery(profile=2, **params), 'SEARCH s USING INDEX ix_sales_indexed_date')
+        self.assertUses(
+            FilteredSalesQuery(profile=3, **params),
+            f'SEARCH s USING INDEX ix_sales_{CURRENT_YEAR - 1}_date',
+            f'SEARCH s USING INDEX ix_sales_{CURRENT_YEAR}_date',
+        )
+        self.assertNotUses(FilteredSalesQuery(profile=3, **params), 'SCAN s')
+
+        # Partitions before current year are pruned
+        current = {'start_date': f'{CURRENT_YEAR}-02-01', 'end_date': f'{CURRENT_YEAR}-03-01'}
+        self.assertUses(FilteredSalesQuery(profile=3, **current), f'SEARCH s USING INDEX ix_sales_{CURRENT_YEAR}_date')
+        self.assertNotUses(FilteredSalesQuery(profile=3, **current), f'sales_{CURRENT_YEAR - 1}')
+
+    def test_filtered_sales_partitions(self):
+        """
+        Test query plans of FilteredSalesQuery: profile 4 only reads partitions
+        overlapping the date range, through their date indexes.
+        """
+        current = {'start_date': f'{CURRENT_YEAR}-02-01', 'end_date': f'{CURRENT_YEAR}-03-01'}
+        self.assertUses(FilteredSalesQuery(profile=4, **current), f'SEARCH s USING INDEX ix_sales_{CURRENT_YEAR}_date')
+        self.assertNotUses(FilteredSalesQuery(profile=4, **current), f'sales_{CURRENT_YEAR - 1}')
+
+        # Pages are merged from the date indexes of partitions without sorting
+        params = {'start_date': f'{CURRENT_YEAR - 1}-06-01', 'page_size': 10}
+        self.assertUses(
+            FilteredSalesQuery(profile=4, **params),
+            'MERGE (UNION ALL)',
+            f'USING INDEX ix_sales_{CURRENT_YEAR - 1}_date',
+            f'USING INDEX ix_sales_{CURRENT_YEAR}_date',
+        )
+        self.assertNotUses(FilteredSalesQuery(profile=4, **params), 'TEMP B-TREE')
+
+    def test_filtered_sales_names(self):
+        """
+        Test query plans of FilteredSalesQuery: names are looked up through
+        unique indexes, and profiles 2 and 3 seek sales through an index.
+        """
+        params = {'product_name': 'Data Science Book', 'region_name': 'South', **{
+            'start_date': f'{CURRENT_YEAR - 1}-06-01', 'end_date': f'{CURRENT_YEAR}-06-01'
+        }}
+        for profile in (1, 2, 3):
+            self.assertUses(
+                FilteredSalesQuery(profile=profile, **params),
+                'SEARCH p USING COVERING INDEX sqlite_autoindex_products_1',
+                'SEARCH r USING COVERING INDEX sqlite_autoindex_regions_1',
+            )
+        self.assertUses(FilteredSalesQuery(profile=2, **params), 'SEARCH s USING INDEX')
+        self.assertUses(FilteredSalesQuery(profile=3, **params), 'SEARCH s USING INDEX')
+        self.assertNotUses(FilteredSalesQuery(profile=3, **params), 'SCAN s')
+
+    def test_filtered_sales_pages(self):
+        """
+        Test query plans of FilteredSalesQuery: pages of profiles 2 and 3 are
+        read in keyset order from the date indexes without sorting.
+        """
+        params = {'start_date': f'{CURRENT_YEAR - 1}-06-01', 'page_size': 10}
+        self.assertUses(FilteredSalesQuery(profile=1, **params), 'USE TEMP B-TREE FOR ORDER BY')
+        self.assertUses(FilteredSalesQuery(profile=2, **params), 'USING INDEX ix_sales_indexed_date')
+        self.assertNotUses(FilteredSalesQuery(profile=2, **params), 'TEMP B-TREE')
+        self.assertUses(
+            FilteredSalesQuery(profile=3, **params),
+            'MERGE (UNION ALL)',
+            f'USING INDEX ix_sales_{CURRENT_YEAR - 1}_date',
+            f'USING INDEX ix_sales_{CURRENT_YEAR}_date',
+        )
+        self.assertNotUses(FilteredSalesQuery(profile=3, **params), 'TEMP B-TREE')
+
+
+class ApiQueryPlans(ApiTest):
+    """Tests the `explain` option of the API."""
+
+    def test_explain(self):
+        """
+        Test API query plans: the final SQL, its arguments and its plan are returned.
+        """
+        data = self.get('/sales/', params={'explain': 1, 'profile': 2, 'start_date': f'{CURRENT_YEAR}-01-01'})
+        self.assertEqual(data['profile'], 2)
+        self.assertIn('indexed_date >= :start_date', data['query'])
+        self.assertEqual(data['args'], {'start_date': f'{CURRENT_YEAR}-01-01'})
+        self.assertTrue(any('ix_sales_indexed_date' in step['detail'] for step in data['plan']))
@@ -0,0 +1,120 @@
+import datetime
+import random
+
+from sqlalchemy import func, insert, select
+
+from app.controllers import ParamError, RangeRevenueQuery, TopProductsQuery
+from app.engines import np
+from app.models import CURRENT_YEAR, CumulativeRevenue, Sale, db
+from tests import ControllerTest
+
+
+class RangeRevenueQueryController(ControllerTest):
+    params = {'start_date': f'{CURRENT_YEAR - 1}-03-01', 'end_date': f'{CURRENT_YEAR}-02-15'}
+
+    def test_profile_1(self):
+        """
+        Test RangeRevenueQuery controller: Profile #1 (indexes of sales).
+        """
+        self.time(RangeRevenueQuery(profile=1, **self.params))
+
+    def test_profile_2(self):
+        """
+        Test RangeRevenueQuery controller: Profile #2 (partitions by period).
+        """
+        self.time(RangeRevenueQuery(profile=2, **self.params))
+
+    def test_profile_3(self):
+        """
+        Test RangeRevenueQuery controller: Profile #3 (cumulative revenue).
+        """
+        self.time(RangeRevenueQuery(profile=3, **self.params))
+
+    def test_summary_table(self):
+        """
+        Test RangeRevenueQuery controller: every profile and engine sums up the
+        same revenue for date ranges, products and regions.
+        """
+        with RangeRevenueQuery().db as conn:
+            (first, last), = conn.fetchall('SELECT MIN(date), MAX(date) FROM sales')
+            product, region = conn.fetchall('''
+                SELECT p.name, r.name FROM sales s
+                JOIN products p ON s.product_id = p.id
+                JOIN regions r ON s.region_id = r.id
+                LIMIT 1
+            ''')[0]
+        first, last = datetime.date.fromisoformat(first), datetime.date.fromisoformat(last)
+
+        rng = random.Random(0)
+        cases = [{}, {'start_date': first.isoformat(), 'end_date': first.isoformat()}, {'product_name': 'Unknown'}]
+        for _ in range(20):
+            start = first + datetime.timedelta(days=rng.randrange((last - first).days + 1))
+            end = start + datetime.timedelta(days=rng.randrange(400))
+            params = {'start_date': start.isoformat(), 'end_date': end.isoformat()}
+            if rng.random() < 0.5:
+                params['product_name'] = product
+            if rng.random() < 0.5:
+                params['region_name'] = region
+            if rng.random() < 0.2:
+                del params[rng.choice(['start_date', 'end_date'])]
+            cases.append(params)
+
+        engines = ['sqlite'] + ['numpy'] * (np is not None)
+        for params in cases:
+            expected = RangeRevenueQuery(profile=1, **params)()[0]['revenue']
+            for profile in (2, 3):
+                self.assertAlmostEqual(RangeRevenueQuery(profile=profile, **params)()[0]['revenue'], expected,
+                                       places=2, msg=f'profile {profile} {params}')
+            for engine in engines[1:]:
+                self.assertAlmostEqual(RangeRevenueQuery(engine=engine, **params)()[0]['revenue'], expected,
+                                       places=2, msg=f'engine {engine} {params}')
+
+    def test_params(self):
+        """
+        Test RangeRevenueQuery controller: a range may be a single day, but
+        never ends before it starts.
+        """
+        RangeRevenueQuery(start_date=f'{CURRENT_YEAR}-01-01', end_date=f'{CURRENT_YEAR}-01-01')
+        with self.assertRaises(ParamError):
+            RangeRevenueQuery(start_date=f'{CURRENT_YEAR}-01-02', end_date=f'{CURRENT_YEAR}-01-01')
+        # Invalid dates are rejected as by other controllers
+        for params in ({'start_date': f'{CURRENT_YEAR}-13-01'}, {'end_date': 'today'}):
+            with self.assertRaises(ParamError) as expected:
+                TopProductsQuery(**params)
+            with self.assertRaises(ParamError) as error:
+                RangeRevenueQuery(**params)
+            self.assertEqual(str(error.exception), str(expected.exception))
+
+    def test_accumulate(self):
+        """
+        Test RangeRevenueQuery controller: cumulative revenue accumulated from
+        sales ingested out of date order matches that rebuilt from all sales.
+        """
+        table = CumulativeRevenue.__table__
+
+        def cumulative_revenue():
+            rows = db.session.execute(select(table)).all()
+            return {(product, region, date): revenue for product, region, date, revenue in rows}
+
+        next_id = (db.session.execute(select(func.max(Sale.id))).scalar() or 0) + 1
+        rng = random.Random(1)
+        sales = [
+            dict(id=sale_id, **Sale.row_values(
+                datetime.date(CURRENT_YEAR - 1, 1, 1) + datetime.timedelta(days=rng.randrange(800)),
+                rng.randrange(1, 6), rng.randrange(1, 4), round(rng.uniform(1, 100), 2),
+            ))
+            for sale_id in range(next_id, next_id + 300)
+        ]
+        try:
+            db.session.execute(insert(Sale.__table__), sales)
+            CumulativeRevenue.accumulate(sales[:200])
+            CumulativeRevenue.accumulate(sales[200:])
+            accumulated = cumulative_revenue()
+            CumulativeRevenue.rebuild()
+            rebuilt = cumulative_revenue()
+        finally:
+            db.session.rollback()
+
+        self.assertEqual(accumulated.keys(), rebuilt.keys())
+        for key, revenue in rebuilt.items():
+            self.assertAlmostEqual(accumulated[key], revenue, places=2, msg=key)
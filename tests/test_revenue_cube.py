@@ -0,0 +1,127 @@
+import datetime
+import itertools
+import random
+
+from sqlalchemy import func, insert, select
+
+from app.controllers import ParamError, RevenueCubeQuery
+from app.engines import np
+from app.models import CURRENT_YEAR, RevenueCube, Sale, db
+from tests import ControllerTest
+
+
+class RevenueCubeQueryController(ControllerTest):
+    params = {'group_by': 'month,region', 'start_month': f'{CURRENT_YEAR - 1}-03', 'end_month': f'{CURRENT_YEAR}-02'}
+
+    def test_profile_1(self):
+        """
+        Test RevenueCubeQuery controller: Profile #1 (groups sales).
+        """
+        self.time(RevenueCubeQuery(profile=1, **self.params))
+
+    def test_profile_2(self):
+        """
+        Test RevenueCubeQuery controller: Profile #2 (rolls up cells of the cube).
+        """
+        self.time(RevenueCubeQuery(profile=2, **self.params))
+
+    def test_group_by(self):
+        """
+        Test RevenueCubeQuery controller: every profile and engine returns the
+        same groups in the same order, for every subset of dimensions.
+        """
+        with RevenueCubeQuery().db as conn:
+            product, region = conn.fetchall('''
+                SELECT p.name, r.name FROM sales s
+                JOIN products p ON s.product_id = p.id
+                JOIN regions r ON s.region_id = r.id
+                LIMIT 1
+            ''')[0]
+        filters = [
+            {},
+            {'product_name': product},
+            {'region_name': region, 'start_month': f'{CURRENT_YEAR - 1}-03', 'end_month': f'{CURRENT_YEAR - 1}-11'},
+            {'start_month': f'{CURRENT_YEAR}-01', 'end_month': f'{CURRENT_YEAR}-01'},
+            {'product_name': 'Unknown'},
+        ]
+        dimensions = list(RevenueCubeQuery.dimensions)
+        engines = ['numpy'] * (np is not None)
+        for size in range(len(dimensions) + 1):
+            for group_by in itertools.combinations(dimensions, size):
+                for params in filters:
+                    params = {'group_by': ','.join(reversed(group_by)), **params}
+                    expected = RevenueCubeQuery(profile=1, **params)()
+                    keys = [tuple(item.values())[:-1] for item in expected]
+                    self.assertEqual(keys, sorted(keys), params)
+                    results = [RevenueCubeQuery(profile=2, **params)()]
+                    results += [RevenueCubeQuery(engine=engine, **params)() for engine in engines]
+                    for items in results:
+                        self.assertEqual([item.keys() for item in items], [item.keys() for item in expected], params)
+                        for item, expected_item in zip(items, expected):
+                            self.assertEqual({**item, 'revenue': None}, {**expected_item, 'revenue': None}, params)
+                            self.assertEqual(item['revenue'], expected_item['revenue'], params)
+
+    def test_rounded(self):
+        """
+        Test RevenueCubeQuery controller: revenue of every group, and the grand
+        total of ungrouped revenue, is rounded to cents by every profile and
+        engine, as range revenue is.
+        """
+        engines = ['numpy'] * (np is not None)
+        for group_by in ('', 'month', 'product,region'):
+            queries = [RevenueCubeQuery(profile=profile, group_by=group_by) for profile in (1, 2)]
+            queries += [RevenueCubeQuery(engine=engine, group_by=group_by) for engine in engines]
+            for query in queries:
+                for item in query():
+                    self.assertEqual(item['revenue'], round(item['revenue'], 2), (group_by, query.profile))
+
+    def test_params(self):
+        """
+        Test RevenueCubeQuery controller: dimensions must be known, and months
+        must be in the format of yyyy-mm and in order.
+        """
+        self.assertEqual(RevenueCubeQuery(group_by='region, month').columns, ('year', 'month', 'region_name', 'revenue'))
+        self.assertEqual(RevenueCubeQuery(group_by='').columns, ('revenue',))
+        RevenueCubeQuery(start_month=f'{CURRENT_YEAR}-01', end_month=f'{CURRENT_YEAR}-01')
+        with self.assertRaises(ParamError):
+            RevenueCubeQuery(group_by='month,day')
+        with self.assertRaises(ParamError):
+            RevenueCubeQuery(start_month=f'{CURRENT_YEAR}-13')
+        with self.assertRaises(ParamError):
+            RevenueCubeQuery(end_month=f'{CURRENT_YEAR}-01-01')
+        with self.assertRaises(ParamError):
+            RevenueCubeQuery(start_month=f'{CURRENT_YEAR}-02', end_month=f'{CURRENT_YEAR}-01')
+
+    def test_accumulate(self):
+        """
+        Test RevenueCubeQuery controller: cells accumulated from batches of
+        sales match those rebuilt from all sales.
+        """
+        table = RevenueCube.__table__
+
+        def cells():
+            rows = db.session.execute(select(table)).all()
+            return {(year, month, product, region): revenue for year, month, product, region, revenue in rows}
+
+        next_id = (db.session.execute(select(func.max(Sale.id))).scalar() or 0) + 1
+        rng = random.Random(1)
+        sales = [
+            dict(id=sale_id, **Sale.row_values(
+                datetime.date(CURRENT_YEAR - 1, 1, 1) + datetime.timedelta(days=rng.randrange(800)),
+                rng.randrange(1, 6), rng.randrange(1, 4), round(rng.uniform(1, 100), 2),
+            ))
+            for sale_id in range(next_id, next_id + 300)
+        ]
+        try:
+            db.session.execute(insert(Sale.__table__), sales)
+            RevenueCube.accumulate(sales[:200])
+            RevenueCube.accumulate(sales[200:])
+            accumulated = cells()
+            RevenueCube.rebuild()
+            rebuilt = cells()
+        finally:
+            db.session.rollback()
+
+        self.assertEqual(accumulated.keys(), rebuilt.keys())
+        for key, revenue in rebuilt.items():
+            self.assertAlmostEqual(accumulated[key], revenue, places=2, msg=key)
@@ -0,0 +1,77 @@
+import os
+import tempfile
+import unittest
+
+from app.cache import SQLiteCache
+from app.utils import DataVersion
+
+
+class SharedCache(unittest.TestCase):
+    """Tests the result cache shared by worker processes."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.version_file = os.path.join(self.tmp_dir.name, 'data.version')
+        # Two cache instances over the same files, as two workers would have
+        self.caches = [
+            SQLiteCache(os.path.join(self.tmp_dir.name, 'cache.sqlite'), DataVersion(self.version_file), threshold=5)
+            for _ in range(2)
+        ]
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_shared_entries(self):
+        first, second = self.caches
+        first.set('key', [{'revenue': 1.5}])
+        self.assertEqual(second.get('key'), [{'revenue': 1.5}])
+        self.assertIsNone(second.get('missing'))
+
+        stats = second.stats()
+        self.assertEqual(stats['entries'], 1)
+        self.assertGreater(stats['size'], 0)
+        self.assertEqual((stats['hits'], stats['misses'], stats['hit_rate']), (1, 1, 0.5))
+
+    def test_data_version_invalidation(self):
+        first, second = self.caches
+        for i in range(3):
+            first.set(f'key{i}', i)
+        DataVersion(self.version_file).bump()
+        self.assertFalse(any(second.has(f'key{i}') for i in range(3)))
+
+        # Entries of older versions are purged on next write
+        second.set('key', 'value')
+        self.assertEqual(first.get('key'), 'value')
+        self.assertEqual(first.stats()['entries'], 1)
+
+    def test_expiration_and_threshold(self):
+        first, second = self.caches
+        first.set('expired', 1, timeout=-1)
+        self.assertIsNone(second.get('expired'))
+        for i in range(10):
+            first.set(f'key{i}', i, timeout=i + 1)
+        self.assertEqual(second.stats()['entries'], 5)
+        self.assertEqual(second.get('key9'), 9)
+
+    def test_stale_results(self):
+        first, second = self.caches
+        version = DataVersion(self.version_file).get()
+        DataVersion(self.version_file).bump()
+
+        # Results computed before the version was bumped are not set
+        self.assertFalse(first.set('key', 'stale', version=version))
+        self.assertIsNone(second.get('key'))
+        self.assertEqual(first.stats()['stale'], 1)
+        self.assertTrue(first.set('key', 'value', version=version + 1))
+        self.assertEqual(second.get('key'), 'value')
+
+    def test_prune_every(self):
+        cache = SQLiteCache(os.path.join(self.tmp_dir.name, 'cache.sqlite'), DataVersion(self.version_file),
+                            threshold=300)
+        for i in range(303):
+            cache.set(f'key{i}', i)
+        # Entries are counted every 3 writes, hence evicted after the 303rd
+        self.assertEqual(cache.stats()['entries'], 300)
+        for i in range(303, 305):
+            cache.set(f'key{i}', i)
+        self.assertEqual(cache.stats()['entries'], 302)
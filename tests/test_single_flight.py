@@ -0,0 +1,51 @@
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from app.utils import SingleFlight
+
+
+class SingleFlightTest(unittest.TestCase):
+    """Tests coalescing of identical concurrent calls."""
+
+    def setUp(self):
+        self.flights = SingleFlight()
+        self.started = threading.Event()
+
+    def slow(self, result):
+        """Returns a function that blocks long enough for others to coalesce."""
+        def func():
+            self.started.set()
+            time.sleep(0.1)
+            if isinstance(result, Exception):
+                raise result
+            return result
+        return func
+
+    def run_concurrently(self, func, total=8):
+        """Calls `do()` from many threads once the first one is in flight."""
+        with ThreadPoolExecutor(max_workers=total) as executor:
+            leader = executor.submit(self.flights.do, 'key', func)
+            self.started.wait()
+            followers = [executor.submit(self.flights.do, 'key', func) for _ in range(total - 1)]
+            return [leader, *followers]
+
+    def test_coalesces_calls(self):
+        result = ['rows']
+        futures = self.run_concurrently(self.slow(result))
+        self.assertTrue(all(future.result() is result for future in futures))
+        self.assertEqual(self.flights.stats(), {'executions': 1, 'coalesced': 7, 'in_flight': 0})
+
+    def test_shares_errors(self):
+        futures = self.run_concurrently(self.slow(ValueError('failed')))
+        for future in futures:
+            self.assertRaises(ValueError, future.result)
+
+        # Next calls are executed again
+        self.assertEqual(self.flights.do('key', lambda: 1), 1)
+        self.assertEqual(self.flights.stats()['executions'], 2)
+
+    def test_distinct_keys(self):
+        self.assertEqual([self.flights.do(key, lambda: key) for key in 'ab'], ['a', 'b'])
+        self.assertEqual(self.flights.stats()['coalesced'], 0)